@@ -0,0 +1,157 @@
+###
+#  内容寻址的资源存储：不可变文件（模板vis.blend、上传的场景、导出给Lingo的体素矩阵）按sha256只保存一份，
+#  放入任务目录时优先使用reflink（写时复制的文件克隆），其次硬链接，都不支持时才复制。
+#  硬链接与存储中的文件共享同一份数据，需要修改任务目录中的文件前先调用make_private断开链接
+###
+import errno
+import os
+import shutil
+import stat
+import threading
+import time
+import uuid
+from os.path import join as path_join, exists as path_exists
+
+try:
+    import fcntl
+except ImportError:  # Windows没有fcntl，也不支持FICLONE，直接使用硬链接或复制
+    fcntl = None
+
+from voxel_cache import hash_file
+
+DEFAULT_ASSET_DIR = "./cache/assets"
+_FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+
+# 各种放置方式的计数，便于确认文件系统是否支持reflink/硬链接
+placement_counts = {'reflink': 0, 'hardlink': 0, 'copy': 0}
+_counts_lock = threading.Lock()
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """在支持的文件系统（btrfs、xfs等）上克隆文件，数据块在写入前共享，返回是否成功"""
+    if fcntl is None:
+        return False
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        if path_exists(dst):
+            os.remove(dst)
+        return False
+
+
+def link_or_copy(src: str, dst: str, allow_hardlink: bool = True) -> str:
+    """将src放到dst（dst已存在时覆盖），依次尝试reflink、硬链接和复制
+
+    参数:
+        src (str): 源文件，使用硬链接时不应再被原地修改
+        dst (str): 目标路径
+        allow_hardlink (bool, optional): 调用者随后会原地修改dst时应传入False. Defaults to True.
+    返回:
+        str: 实际使用的方式，'reflink'、'hardlink'或'copy'
+    """
+    tmp = f"{dst}.{uuid.uuid4().hex}.tmp"
+    if _reflink(src, tmp):
+        method = 'reflink'
+    else:
+        try:
+            if not allow_hardlink:
+                raise OSError(errno.EPERM, "hardlink not allowed")
+            os.link(src, tmp)
+            method = 'hardlink'
+        except OSError:
+            # 跨文件系统、不支持硬链接或调用者要求独立副本
+            shutil.copyfile(src, tmp)
+            method = 'copy'
+    os.replace(tmp, dst)
+    with _counts_lock:
+        placement_counts[method] += 1
+    return method
+
+
+def make_private(path: str):
+    """写时复制：文件与其他路径共享数据（硬链接）时，替换为一份独立的可写副本"""
+    st = os.stat(path)
+    if st.st_nlink > 1:
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        if not _reflink(path, tmp):
+            shutil.copyfile(path, tmp)
+        os.replace(tmp, path)
+    os.chmod(path, stat.S_IMODE(os.stat(path).st_mode) | stat.S_IWUSR)
+
+
+class AssetStore:
+    """按内容哈希保存不可变文件的存储
+
+    参数:
+        root (str, optional): 存储目录. Defaults to "./cache/assets".
+    """
+
+    def __init__(self, root: str = DEFAULT_ASSET_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def blob_path(self, digest: str) -> str:
+        return path_join(self.root, digest[:2], digest)
+
+    def digest(self, path: str) -> str:
+        """文件内容的sha256，模板等反复放置的文件不会重复计算（见voxel_cache.hash_file）"""
+        return hash_file(path)
+
+    def put(self, path: str) -> str:
+        """将文件存入存储（内容已存在时不再写入），返回其哈希"""
+        digest = self.digest(path)
+        blob = self.blob_path(digest)
+        if not path_exists(blob):
+            self._commit(blob, lambda tmp: link_or_copy(path, tmp, allow_hardlink=False))
+        return digest
+
+    def put_derived(self, key: str, build) -> str:
+        """保存由其他内容确定性生成的文件（例如由体素文件导出的.npy），key相同则只生成一次
+
+        参数:
+            key (str): 能唯一确定生成结果的键，例如源文件哈希加上格式名
+            build (callable): build(tmp_path)，将结果写入给定的临时路径
+        返回:
+            str: 存储中文件的路径
+        """
+        blob = self.blob_path(key)
+        if not path_exists(blob):
+            self._commit(blob, build)
+        return blob
+
+    def _commit(self, blob: str, write):
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        tmp = f"{blob}.{uuid.uuid4().hex}.tmp"
+        try:
+            write(tmp)
+            # 存储中的文件只读，防止通过硬链接被意外原地修改
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, blob)
+        finally:
+            if path_exists(tmp):
+                os.remove(tmp)
+
+    def place(self, src: str, dst: str) -> str:
+        """将src的内容以共享数据的方式放到dst，返回使用的放置方式"""
+        return link_or_copy(self.blob_path(self.put(src)), dst)
+
+    def gc(self, min_age: float = 24 * 3600) -> int:
+        """删除没有被任何任务目录硬链接、且超过min_age秒未被放置的文件，返回释放的字节数"""
+        freed = 0
+        now = time.time()
+        for prefix in os.listdir(self.root):
+            folder = path_join(self.root, prefix)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                blob = path_join(folder, name)
+                try:
+                    st = os.stat(blob)
+                    if st.st_nlink == 1 and now - max(st.st_mtime, st.st_ctime) > min_age:
+                        os.remove(blob)
+                        freed += st.st_size
+                except OSError:
+                    continue
+        return freed
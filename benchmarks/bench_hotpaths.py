@@ -0,0 +1,260 @@
+###
+#  场景处理热点路径的基准测试：生成面数递增的合成.obj场景，对体素化、投影、填充、补齐、预览和打包
+#  分别计时并记录内存峰值，结果写入json以便不同版本之间对比。不依赖bpy、Lingo模型或GPU。
+#  用法：python benchmarks/bench_hotpaths.py [--sizes small medium] [--repeat 3] [--output result.json]
+#        python benchmarks/bench_hotpaths.py --compare old.json new.json
+###
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import trimesh
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# 每种规模的合成场景：(家具数量, 每件家具的球面细分次数)
+SCENE_SIZES = {
+    'small': (10, 1),
+    'medium': (40, 3),
+    'large': (80, 5),
+}
+TARGET_SHAPE = (400, 100, 600)
+
+
+def make_scene(n_items: int, subdivisions: int, seed: int = 0) -> trimesh.Trimesh:
+    """生成带地板、墙面和若干家具（长方体 + 细分球体）的合成房间"""
+    rng = np.random.default_rng(seed)
+    parts = [
+        trimesh.creation.box(extents=[6.0, 0.05, 4.0]),
+        trimesh.creation.box(extents=[6.0, 2.5, 0.05], transform=trimesh.transformations.translation_matrix([0, 1.25, -2])),
+    ]
+    for i in range(n_items):
+        if i % 2:
+            item = trimesh.creation.box(extents=rng.uniform(0.2, 1.2, size=3))
+        else:
+            item = trimesh.creation.icosphere(subdivisions=subdivisions, radius=rng.uniform(0.1, 0.5))
+        item.apply_translation([rng.uniform(-2.5, 2.5), rng.uniform(0.1, 1.0), rng.uniform(-1.5, 1.5)])
+        parts.append(item)
+    return trimesh.util.concatenate(parts)
+
+
+class Measurement:
+    """一次测量：墙钟耗时、tracemalloc记录的Python/NumPy分配峰值和进程RSS峰值"""
+
+    def __enter__(self):
+        from metrics import _RssSampler
+        self._sampler = _RssSampler()
+        self._sampler.start()
+        tracemalloc.start()
+        self._tic = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._tic
+        _, self.alloc_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.rss_peak = self._sampler.stop()
+        return False
+
+
+def run_case(name, params, fn, repeat, setup=None):
+    """重复执行fn并汇总结果；setup在每次计时前执行，不计入耗时"""
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with Measurement() as m:
+            fn()
+        runs.append(m)
+    result = {
+        'name': name,
+        'params': params,
+        'seconds': [round(m.seconds, 6) for m in runs],
+        'best_s': min(m.seconds for m in runs),
+        'median_s': statistics.median(m.seconds for m in runs),
+        'alloc_peak_bytes': max(m.alloc_peak for m in runs),
+        'rss_peak_bytes': max(m.rss_peak for m in runs),
+    }
+    print(f"{name:<34} {json.dumps(params, ensure_ascii=False):<42} best={result['best_s']:.4f}s "
+          f"median={result['median_s']:.4f}s alloc_peak={result['alloc_peak_bytes'] / 2**20:.1f}MB")
+    return result
+
+
+def environment_info() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'trimesh': trimesh.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def preview_function():
+    """优先测试main.preview_action；Web依赖（gradio等）未安装时退化为其内部实现preview_cache"""
+    try:
+        import main
+        return 'main.preview_action', main.preview_action
+    except ImportError as e:
+        print(f"无法导入main（{e}），改为测试preview_cache.PreviewCanvasCache")
+        from preview_cache import PreviewCanvasCache
+        cache = PreviewCanvasCache(["red", "orange", "blue", "yellow", "green"])
+
+        def preview(task, table):
+            return cache.render(task.task_id, task.image_path, task.pixel_to_scene_ratio, table)
+        return 'preview_cache.render', preview
+
+
+def run_benchmarks(sizes, repeat, workdir, methods):
+    import pandas as pd
+    from classes import Task
+    from interfaces import voxelize_obj
+    from npy_to_2d_image import npy_to_2d_image
+    from utils import fill_voxel_matrix, pad_voxel_matrix_with_y_padding, zip_folder_files
+    from voxel_format import load_voxels
+
+    preview_name, preview = preview_function()
+    results = []
+    for size in sizes:
+        n_items, subdivisions = SCENE_SIZES[size]
+        mesh = make_scene(n_items, subdivisions)
+        scene_dir = os.path.join(workdir, size)
+        os.makedirs(scene_dir, exist_ok=True)
+        obj_path = os.path.join(scene_dir, 'scene.obj')
+        mesh.export(obj_path)
+        base = {'scene': size, 'faces': int(len(mesh.faces))}
+
+        voxel_path = os.path.join(scene_dir, 'scene.pvox')
+        ratio = None
+        for method in methods:
+            for suffix in ('.npy', '.pvox'):
+                output = os.path.join(scene_dir, f'scene_{method}{suffix}')
+                holder = {}
+                results.append(run_case('interfaces.voxelize_obj', dict(base, method=method, format=suffix),
+                                        lambda: holder.update(r=voxelize_obj(obj_path, output=output, method=method)),
+                                        repeat))
+                ratio = holder['r'][1]
+                shutil.copyfile(output, voxel_path if suffix == '.pvox' else os.path.join(scene_dir, 'scene.npy'))
+
+        for voxel_file in (os.path.join(scene_dir, 'scene.npy'), voxel_path):
+            for projection_type in ('max', 'average'):
+                image_path = os.path.join(scene_dir, f'projection_{projection_type}.png')
+                results.append(run_case('npy_to_2d_image',
+                                        dict(base, projection_type=projection_type,
+                                             format=os.path.splitext(voxel_file)[1]),
+                                        lambda: npy_to_2d_image(voxel_file, image_path, projection_type), repeat))
+
+        grid = load_voxels(voxel_path)
+        results.append(run_case('utils.fill_voxel_matrix', dict(base, shape=list(grid.shape)),
+                                lambda: fill_voxel_matrix(grid), repeat))
+        target = tuple(max(a, b) for a, b in zip(grid.shape, TARGET_SHAPE))
+        results.append(run_case('utils.pad_voxel_matrix_with_y_padding', dict(base, target_shape=list(target)),
+                                lambda: pad_voxel_matrix_with_y_padding(grid, target), repeat))
+        # 直接写入.npy内存映射，不在内存中分配完整的目标矩阵
+        padded_path = os.path.join(scene_dir, 'padded.npy')
+        padded = np.lib.format.open_memmap(padded_path, mode='w+', dtype=bool, shape=target)
+        results.append(run_case('utils.pad_voxel_matrix_with_y_padding', dict(base, target_shape=list(target), out='memmap'),
+                                lambda: pad_voxel_matrix_with_y_padding(grid, target, out=padded), repeat))
+        del padded
+        del grid
+
+        task = Task(obj_path)
+        task.image_path = os.path.join(scene_dir, 'projection_average.png')
+        task.pixel_to_scene_ratio = ratio
+        columns = ["起点x1", "起点y1", "终点x2", "终点y2", "动作"]
+        table = pd.DataFrame([[str(i * 0.3), "0.5", str(i * 0.3 + 0.3), "-0.5", "walk"] for i in range(5)],
+                             columns=columns)
+        results.append(run_case(preview_name, dict(base, rows=len(table), cached=False),
+                                lambda: preview(task, table), repeat,
+                                setup=lambda: setattr(task, 'task_id', os.urandom(8).hex())))
+        changed = table.copy()
+
+        def change_last_row():
+            # 只修改最后一行，模拟用户调整终点后再次预览
+            changed.at[len(changed) - 1, "终点y2"] = str(np.random.rand())
+        results.append(run_case(preview_name, dict(base, rows=len(table), cached=True, changed_row=len(table) - 1),
+                                lambda: preview(task, changed), repeat, setup=change_last_row))
+
+        # 模拟一个任务目录：场景文件、体素文件、投影图和一段"视频"
+        task_dir = os.path.join(workdir, f'task_{size}')
+        os.makedirs(task_dir, exist_ok=True)
+        for path in (obj_path, voxel_path, task.image_path):
+            shutil.copy(path, task_dir)
+        with open(os.path.join(task_dir, 'processed_videos.mp4'), 'wb') as f:
+            f.write(np.random.default_rng(0).bytes(8 * 2**20))
+
+        def clear_archive():
+            for name in os.listdir(task_dir):
+                if name.endswith('.zip') or name.startswith('.'):
+                    os.remove(os.path.join(task_dir, name))
+        results.append(run_case('utils.zip_folder_files', dict(base, cached=False),
+                                lambda: zip_folder_files(task_dir), repeat, setup=clear_archive))
+        results.append(run_case('utils.zip_folder_files', dict(base, cached=True),
+                                lambda: zip_folder_files(task_dir), repeat))
+    return results
+
+
+def compare(old_path: str, new_path: str):
+    """对比两次运行的结果，按 (name, params) 匹配，输出耗时和内存峰值的变化"""
+    with open(old_path) as f:
+        old = {(r['name'], json.dumps(r['params'], sort_keys=True)): r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = json.load(f)['results']
+    for r in new:
+        key = (r['name'], json.dumps(r['params'], sort_keys=True))
+        if key not in old:
+            continue
+        o = old[key]
+        print(f"{r['name']:<34} {key[1]:<70} time x{o['best_s'] / max(r['best_s'], 1e-9):6.2f} "
+              f"alloc x{o['alloc_peak_bytes'] / max(r['alloc_peak_bytes'], 1):6.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the scene processing hot paths offline')
+    parser.add_argument('--sizes', nargs='+', default=['small', 'medium'], choices=list(SCENE_SIZES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--methods', nargs='+', default=['subdivide', 'fast'], help='voxelize_obj engines to time')
+    parser.add_argument('--output', default='bench_hotpaths.json', help='where to write the json results')
+    parser.add_argument('--keep-workdir', action='store_true', help='keep the generated scenes and outputs')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    output = os.path.abspath(args.output)
+    workdir = tempfile.mkdtemp(prefix='lingo_bench_')
+    cwd = os.getcwd()
+    # 部分模块导入时会在当前目录下创建缓存目录，在临时目录中运行以免污染仓库
+    os.chdir(workdir)
+    try:
+        results = run_benchmarks(args.sizes, args.repeat, workdir, args.methods)
+    finally:
+        os.chdir(cwd)
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    with open(output, 'w') as f:
+        json.dump({'environment': environment_info(), 'results': results}, f, indent=2, ensure_ascii=False)
+    print(f"结果已写入 {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+###
+#  渲染档位校准（需要bpy）：在本机CPU上对每个渲染档位尝试不同的线程数和分块大小，每种组合在新的子进程中
+#  渲染动画的前几帧，选出每帧耗时最短的组合写入render_profiles的校准文件。之后CPU渲染自动使用这些设置，
+#  调度时可用render_profiles.estimate_render_seconds按每帧耗时估计渲染时间。
+#  --blend应为一个已完成导入阶段、包含场景和人物动画的任务文件（例如 ./outputs/<任务ID>/vis.blend），
+#  空的vis.blend模板没有关键帧，测得的每帧耗时不能代表实际渲染。
+#  用法：python benchmarks/bench_render_profiles.py --blend <任务目录>/vis.blend [--frames 3] [--profiles draft standard final]
+###
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from render_profiles import DEFAULT_CALIBRATION_PATH, RENDER_PROFILES  # noqa: E402
+
+DEFAULT_TILE_SIZES = (32, 64, 128, 256)
+
+
+def thread_candidates(cpu_count: int):
+    """候选线程数：全部逻辑核心、约3/4以及一半（开启超线程时接近物理核心数）"""
+    return sorted({cpu_count, max(1, cpu_count * 3 // 4), max(1, cpu_count // 2)}, reverse=True)
+
+
+def keyframe_range(blend: str):
+    """在当前进程中（子进程侧）输出.blend文件中关键帧的范围，没有关键帧时输出null"""
+    import bpy
+
+    bpy.ops.wm.open_mainfile(filepath=blend)
+    frames = [kp.co[0] for obj in bpy.data.objects if obj.animation_data and obj.animation_data.action
+              for fcurve in obj.animation_data.action.fcurves for kp in fcurve.keyframe_points]
+    result = [int(min(frames)), int(max(frames))] if frames else None
+    print("KEYFRAME_RANGE " + json.dumps(result))
+
+
+def run_keyframe_range(blend: str):
+    """在子进程中读取关键帧范围，返回 (起始帧, 结束帧)，没有关键帧时返回None；无法读取时抛出RuntimeError"""
+    args = [sys.executable, os.path.abspath(__file__), '--keyframe-range', blend]
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    result = subprocess.run(args, capture_output=True, text=True, env=env)
+    for line in result.stdout.splitlines():
+        if line.startswith("KEYFRAME_RANGE "):
+            frame_range = json.loads(line[len("KEYFRAME_RANGE "):])
+            return None if frame_range is None else tuple(frame_range)
+    raise RuntimeError((result.stderr.strip().splitlines() or ['no output'])[-1])
+
+
+def probe(blend: str, profile: str, threads: int, tile_size: int, frames: int):
+    """在当前进程中（子进程侧）按给定设置用CPU渲染frames帧，输出每帧耗时"""
+    import bpy
+    from video_renderer import apply_render_profile, auto_detect_animation_range, set_cpu_rendering
+
+    bpy.ops.wm.open_mainfile(filepath=blend)
+    scene = bpy.context.scene
+    scene.render.engine = "CYCLES"
+    set_cpu_rendering()
+    settings = dict(RENDER_PROFILES[profile], threads=threads, tile_size=tile_size)
+    apply_render_profile(scene, settings)
+    frame_start, frame_end = auto_detect_animation_range()
+    seconds = []
+    for frame in range(frame_start, min(frame_end, frame_start + frames - 1) + 1):
+        scene.frame_set(frame)
+        tic = time.perf_counter()
+        bpy.ops.render.render(write_still=False)
+        seconds.append(time.perf_counter() - tic)
+    print("RENDER_PROBE " + json.dumps({'seconds': seconds}))
+
+
+def run_probe(blend: str, profile: str, threads: int, tile_size: int, frames: int) -> dict:
+    """在新的子进程中运行probe，避免前一次渲染的持久化数据和缓存影响计时"""
+    args = [sys.executable, os.path.abspath(__file__), '--probe', blend, profile, str(threads), str(tile_size),
+            str(frames)]
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    result = subprocess.run(args, capture_output=True, text=True, env=env)
+    for line in result.stdout.splitlines():
+        if line.startswith("RENDER_PROBE "):
+            seconds = json.loads(line[len("RENDER_PROBE "):])['seconds']
+            # 第一帧包含内核加载和BVH构建，单独记录；之后各帧的中位数作为每帧耗时
+            steady = seconds[1:] or seconds
+            return {'threads': threads, 'tile_size': tile_size, 'first_frame_s': seconds[0],
+                    'seconds_per_frame': statistics.median(steady), 'frames': len(seconds)}
+    error = (result.stderr.strip().splitlines() or ['no output'])[-1]
+    return {'threads': threads, 'tile_size': tile_size, 'error': error}
+
+
+def calibrate(blend: str, profiles, frames: int, tile_sizes) -> dict:
+    cpu_count = os.cpu_count() or 1
+    results = {}
+    for profile in profiles:
+        candidates = []
+        for threads in thread_candidates(cpu_count):
+            for tile_size in tile_sizes:
+                candidate = run_probe(blend, profile, threads, tile_size, frames)
+                candidates.append(candidate)
+                if 'error' in candidate:
+                    print(f"{profile:<9} threads={threads:<3} tile={tile_size:<5} 失败: {candidate['error']}")
+                else:
+                    print(f"{profile:<9} threads={threads:<3} tile={tile_size:<5} "
+                          f"first={candidate['first_frame_s']:.2f}s per_frame={candidate['seconds_per_frame']:.2f}s")
+        ok = [c for c in candidates if 'error' not in c]
+        if not ok:
+            continue
+        best = min(ok, key=lambda c: c['seconds_per_frame'])
+        results[profile] = dict(best, candidates=candidates)
+        print(f"{profile}: threads={best['threads']} tile={best['tile_size']} "
+              f"每帧约 {best['seconds_per_frame']:.2f}s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='pick the fastest CPU render settings per profile for this host')
+    parser.add_argument('--blend',
+                        help='imported task .blend with the scene and character animation, e.g. outputs/<task_id>/vis.blend')
+    parser.add_argument('--profiles', nargs='+', default=list(RENDER_PROFILES), choices=list(RENDER_PROFILES))
+    parser.add_argument('--frames', type=int, default=3, help='frames rendered per candidate')
+    parser.add_argument('--tile-sizes', nargs='+', type=int, default=list(DEFAULT_TILE_SIZES))
+    parser.add_argument('--output', default=DEFAULT_CALIBRATION_PATH, help='calibration file read by render_profiles')
+    parser.add_argument('--probe', nargs=5, metavar=('BLEND', 'PROFILE', 'THREADS', 'TILE', 'FRAMES'),
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--keyframe-range', metavar='BLEND', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.keyframe_range:
+        keyframe_range(args.keyframe_range)
+        return
+
+    if args.probe:
+        blend, profile, threads, tile_size, frames = args.probe
+        probe(blend, profile, int(threads), int(tile_size), int(frames))
+        return
+
+    if args.blend is None:
+        parser.error("需要 --blend：已完成导入阶段的任务文件（例如 outputs/<任务ID>/vis.blend）")
+    blend = os.path.abspath(args.blend)
+    if not os.path.isfile(blend):
+        parser.error(f"{blend} 不存在")
+    try:
+        frame_range = run_keyframe_range(blend)
+    except RuntimeError as e:
+        print(f"无法读取 {blend}: {e}")
+        sys.exit(1)
+    if frame_range is None:
+        parser.error(f"{blend} 中没有动画关键帧，请使用已完成导入阶段的任务文件（例如 outputs/<任务ID>/vis.blend）")
+    print(f"{blend}: 动画帧 {frame_range[0]}-{frame_range[1]}")
+    results = calibrate(blend, args.profiles, args.frames, args.tile_sizes)
+    if not results:
+        print("没有成功的渲染，未写入校准文件")
+        sys.exit(1)
+    # 与已有的校准结果合并，本次未校准的档位保留原值
+    calibration = {}
+    if os.path.exists(args.output):
+        with open(args.output) as f:
+            calibration = json.load(f)
+        if calibration.get('cpu_count') != os.cpu_count():
+            calibration = {}
+    calibration.update({
+        'cpu_count': os.cpu_count(),
+        'device': 'CPU',
+        'blend': blend,
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'time': time.strftime('%Y-%m-%d %H:%M:%S')},
+    })
+    calibration.setdefault('profiles', {}).update(results)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(calibration, f, indent=2, ensure_ascii=False)
+    print(f"校准结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
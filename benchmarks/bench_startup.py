@@ -0,0 +1,121 @@
+###
+#  Web进程启动开销的基准测试：在全新的子进程中分别导入入口模块，记录导入耗时、导入后的RSS以及
+#  被连带加载的重量级依赖；main.py以 --startup-probe 启动，测量构建完整个应用（即将开始服务）时的耗时和RSS。
+#  用法：python benchmarks/bench_startup.py [--repeat 5] [--output startup.json]
+#        python benchmarks/bench_startup.py --compare old.json new.json
+###
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from bench_hotpaths import environment_info  # noqa: E402
+
+# 单独导入的模块：Web入口及其依赖的主要模块
+MODULES = ['interfaces', 'utils', 'pipeline', 'npy_to_2d_image', 'preview_cache', 'task_store', 'http_routes']
+# 只应在需要时（或只在工作进程中）加载的依赖，出现在导入结果中说明仍被提前导入
+HEAVY_MODULES = ['bpy', 'trimesh', 'scipy.ndimage', 'matplotlib.pyplot', 'gradio', 'pandas', 'fastapi']
+
+_PROBE = r'''
+import json, os, sys, time
+tic = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - tic
+with open('/proc/self/statm') as f:
+    rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print("STARTUP_PROBE " + json.dumps({{'seconds': seconds, 'rss_bytes': rss, 'heavy_modules': heavy}}))
+'''
+
+
+def _run_probe(args, cwd):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    result = subprocess.run([sys.executable] + args, cwd=cwd, env=env, capture_output=True, text=True)
+    for line in result.stdout.splitlines():
+        if line.startswith("STARTUP_PROBE "):
+            return json.loads(line[len("STARTUP_PROBE "):])
+    error = (result.stderr.strip().splitlines() or ['no output'])[-1]
+    return {'error': error}
+
+
+def probe_module(module: str, cwd: str) -> dict:
+    """在新进程中导入module"""
+    return _run_probe(['-c', _PROBE.format(module=module, heavy=HEAVY_MODULES)], cwd)
+
+
+def probe_main(cwd: str) -> dict:
+    """以 --startup-probe 运行main.py：构建完界面和HTTP应用后输出耗时与RSS并退出，不开始服务"""
+    return _run_probe([os.path.join(REPO_ROOT, 'main.py'), '--startup-probe'], cwd)
+
+
+def run_benchmarks(repeat: int, workdir: str):
+    results = []
+    cases = [('main.py --startup-probe', probe_main)] + [(f'import {m}', lambda cwd, m=m: probe_module(m, cwd))
+                                                          for m in MODULES]
+    for name, probe in cases:
+        runs = [probe(workdir) for _ in range(repeat)]
+        ok = [r for r in runs if 'error' not in r]
+        if not ok:
+            print(f"{name:<28} 失败: {runs[0]['error']}")
+            results.append({'name': name, 'error': runs[0]['error']})
+            continue
+        result = {
+            'name': name,
+            'seconds': [round(r['seconds'], 4) for r in ok],
+            'best_s': min(r['seconds'] for r in ok),
+            'median_s': statistics.median(r['seconds'] for r in ok),
+            'rss_bytes': statistics.median(r['rss_bytes'] for r in ok),
+            'heavy_modules': ok[0]['heavy_modules'],
+        }
+        print(f"{name:<28} best={result['best_s']:.3f}s median={result['median_s']:.3f}s "
+              f"rss={result['rss_bytes'] / 2**20:.1f}MB heavy={','.join(result['heavy_modules']) or '-'}")
+        results.append(result)
+    return results
+
+
+def compare(old_path: str, new_path: str):
+    """对比两次运行的结果，按名称匹配，输出导入耗时和RSS的变化"""
+    with open(old_path) as f:
+        old = {r['name']: r for r in json.load(f)['results'] if 'error' not in r}
+    with open(new_path) as f:
+        new = [r for r in json.load(f)['results'] if 'error' not in r]
+    for r in new:
+        o = old.get(r['name'])
+        if o is None:
+            continue
+        print(f"{r['name']:<28} time {o['median_s']:.3f}s -> {r['median_s']:.3f}s "
+              f"rss {o['rss_bytes'] / 2**20:.1f}MB -> {r['rss_bytes'] / 2**20:.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='measure import time and RSS of the web entry point')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default='bench_startup.json', help='where to write the json results')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    output = os.path.abspath(args.output)
+    # 部分模块导入时会在当前目录下创建缓存目录和数据库，在临时目录中运行以免污染仓库
+    workdir = tempfile.mkdtemp(prefix='lingo_startup_')
+    try:
+        results = run_benchmarks(args.repeat, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    with open(output, 'w') as f:
+        json.dump({'environment': environment_info(), 'results': results}, f, indent=2, ensure_ascii=False)
+    print(f"结果已写入 {output}")
+
+
+if __name__ == "__main__":
+    main()
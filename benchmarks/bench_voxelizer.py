@@ -0,0 +1,89 @@
+###
+#  体素化引擎对比：在不同面数的合成网格上比较 'subdivide'（trimesh）与 'fast'（voxelizer.voxelize_fast）
+#  的结果一致性与耗时。用法：python benchmarks/bench_voxelizer.py [--repeat 3] [--output result.json]
+###
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import trimesh
+from scipy.ndimage import binary_dilation
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from voxelizer import normalize_mesh_to_grid, voxelize_mesh  # noqa: E402
+
+
+def make_room(n_boxes: int, seed: int = 0) -> trimesh.Trimesh:
+    """生成一个带地板和若干随机家具（长方体）的合成房间"""
+    rng = np.random.default_rng(seed)
+    parts = [trimesh.creation.box(extents=[6.0, 0.05, 4.0])]
+    for _ in range(n_boxes):
+        box = trimesh.creation.box(extents=rng.uniform(0.2, 1.5, size=3))
+        box.apply_translation([rng.uniform(-2.5, 2.5), rng.uniform(0.1, 1.0), rng.uniform(-1.5, 1.5)])
+        parts.append(box)
+    return trimesh.util.concatenate(parts)
+
+
+def make_meshes():
+    meshes = {f"icosphere_sub{k}": trimesh.creation.icosphere(subdivisions=k) for k in (2, 4, 6)}
+    meshes.update({f"room_{n}boxes": make_room(n) for n in (10, 40)})
+    return meshes
+
+
+def compare(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    """比较两个体素矩阵；形状不同时按公共部分比较"""
+    common = tuple(slice(0, min(a, b)) for a, b in zip(reference.shape, candidate.shape))
+    ref, cand = reference[common], candidate[common]
+    inter = np.logical_and(ref, cand).sum()
+    union = np.logical_or(ref, cand).sum()
+    # 允许1个体素的偏差：落在对方膨胀一圈范围内的体素比例
+    near_ref = np.logical_and(cand, binary_dilation(ref)).sum() / max(cand.sum(), 1)
+    near_cand = np.logical_and(ref, binary_dilation(cand)).sum() / max(ref.sum(), 1)
+    return {
+        "shape_equal": reference.shape == candidate.shape,
+        "iou": float(inter / max(union, 1)),
+        "only_subdivide": int(np.logical_and(ref, ~cand).sum()),
+        "only_fast": int(np.logical_and(cand, ~ref).sum()),
+        "within_1_voxel": float(min(near_ref, near_cand)),
+    }
+
+
+def time_method(mesh, method, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        result = voxelize_mesh(mesh.copy(), 1, method=method)
+        best = min(best, time.perf_counter() - tic)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='compare voxelization engines on synthetic meshes')
+    parser.add_argument('--repeat', type=int, default=3, help='timing repetitions, the best run is reported')
+    parser.add_argument('--target-shape', type=int, nargs=3, default=[400, 100, 600])
+    parser.add_argument('--output', default=None, help='write results as json to this path')
+    args = parser.parse_args()
+
+    results = []
+    for name, mesh in make_meshes().items():
+        normalize_mesh_to_grid(mesh, tuple(args.target_shape))
+        t_sub, ref = time_method(mesh, 'subdivide', args.repeat)
+        t_fast, cand = time_method(mesh, 'fast', args.repeat)
+        row = {"mesh": name, "faces": int(len(mesh.faces)),
+               "subdivide_s": t_sub, "fast_s": t_fast, "speedup": t_sub / t_fast}
+        row.update(compare(ref, cand))
+        results.append(row)
+        print(f"{name:>18} faces={row['faces']:>6} subdivide={t_sub:.3f}s fast={t_fast:.3f}s "
+              f"x{row['speedup']:.1f} iou={row['iou']:.4f} within1={row['within_1_voxel']:.4f} "
+              f"shape_equal={row['shape_equal']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+###
+#  常驻的bpy工作进程池：每个进程只启动一次解释器并导入bpy，之后通过本地IPC接收导入场景、渲染视频的命令，
+#  每个任务结束后重置场景，渲染时逐帧汇报进度。bpy始终运行在子进程中，与Gradio进程隔离
+###
+import os
+import queue
+import sys
+
+from metrics import track_process
+from worker_process import WorkerProcess, serve
+
+
+class BlenderPool:
+    """父进程侧的bpy工作进程池
+
+    参数:
+        size (int, optional): 工作进程数量. Defaults to 2.
+    """
+
+    def __init__(self, size: int = 2):
+        self.workers = [WorkerProcess([sys.executable, os.path.abspath(__file__)], name=f"blender worker {i}")
+                        for i in range(size)]
+        self._idle = queue.Queue()
+        for worker in self.workers:
+            self._idle.put(worker)
+
+    def request(self, message: dict, on_progress=None):
+        """在一个空闲的工作进程上执行命令，没有空闲进程时等待"""
+        worker = self._idle.get()
+        track_process(worker)
+        try:
+            return worker.request(message, on_progress)
+        finally:
+            self._idle.put(worker)
+
+    def import_obj(self, blend_file_path: str, obj_file_path: str):
+        """参数含义同utils.open_blend_and_import_obj"""
+        return self.request({'cmd': 'import', 'blend_path': os.path.abspath(blend_file_path),
+                             'obj_path': os.path.abspath(obj_file_path)})
+
+    def render(self, blend_file_path: str, output: str, device: str = "CUDA", profile: str = "standard",
+               on_progress=None):
+        """参数含义同video_renderer.render_example_video，on_progress在每一帧渲染完成后被调用，
+        参数为包含frame、frame_start、frame_end字段的dict"""
+        return self.request({'cmd': 'render', 'blend_path': os.path.abspath(blend_file_path),
+                             'output': os.path.abspath(output), 'device': device, 'profile': profile}, on_progress)
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+###
+#  以下为子进程侧
+###
+
+def _reset_scene():
+    """清空当前场景和本进程注册的回调（persistent回调在重置后仍会保留，需要先移除），避免上一个任务的数据泄漏到下一个任务"""
+    import bpy
+    bpy.app.handlers.render_write.clear()
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+
+
+def main():
+    import bpy
+    from utils import open_blend_and_import_obj
+    from video_renderer import render_example_video
+
+    def handle(message, send_progress):
+        cmd = message['cmd']
+        try:
+            if cmd == 'import':
+                open_blend_and_import_obj(message['blend_path'], message['obj_path'])
+                return None
+            elif cmd == 'render':
+                # render_example_video会打开.blend文件，加载文件时Blender会移除非persistent的回调
+                @bpy.app.handlers.persistent
+                def on_frame_written(scene, *args):
+                    send_progress(frame=scene.frame_current, frame_start=scene.frame_start, frame_end=scene.frame_end)
+                bpy.app.handlers.render_write.append(on_frame_written)
+                render_example_video(message['blend_path'], message['output'], device=message.get('device', 'CUDA'),
+                                     profile=message.get('profile', 'standard'))
+                return message['output']
+            raise ValueError(f"未知命令: {cmd}")
+        finally:
+            _reset_scene()
+
+    serve(handle)
+
+
+if __name__ == "__main__":
+    main()
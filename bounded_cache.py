@@ -0,0 +1,125 @@
+###
+#  线程安全、按内存占用和条目数双重限制的LRU缓存，可选按存活时间过期，供需要在进程内缓存按任务划分的数据的模块使用
+###
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class BoundedLRUCache:
+    """按最近使用顺序淘汰的缓存
+
+    参数:
+        max_bytes (int): 所有条目估算占用之和的上限
+        max_entries (int, optional): 条目数上限. Defaults to 1024.
+        sizeof (callable, optional): 估算单个值占用字节数的函数. Defaults to sys.getsizeof.
+        ttl (float, optional): 条目自最后一次访问起的存活秒数，为None时不过期. Defaults to None.
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int = 1024, sizeof=sys.getsizeof, ttl: float = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.sizeof = sizeof
+        self.ttl = ttl
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()  # key -> (value, size, last_access)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            self._expire()
+            return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            self._expire()
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self._data[key] = (item[0], item[1], time.monotonic())
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._discard(key)
+            size = self.sizeof(value)
+            self._data[key] = (value, size, time.monotonic())
+            self.current_bytes += size
+            self._expire()
+            self._evict(keep=key)
+
+    def resize(self, key):
+        """条目的值被原地修改后重新估算其占用，并在超出上限时淘汰其他条目"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return
+            size = self.sizeof(item[0])
+            self.current_bytes += size - item[1]
+            self._data[key] = (item[0], size, item[2])
+            self._evict(keep=key)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._discard(key)
+            return default if item is None else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        """当前占用和命中/淘汰计数，供metrics导出"""
+        with self._lock:
+            self._expire()
+            return {
+                'entries': len(self._data),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    def _expire(self):
+        # 条目按访问顺序排列，从最久未访问的一端删除超时条目
+        if self.ttl is None:
+            return
+        deadline = time.monotonic() - self.ttl
+        while self._data:
+            oldest = next(iter(self._data))
+            if self._data[oldest][2] > deadline:
+                break
+            self._discard(oldest)
+            self.expirations += 1
+
+    def _discard(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.current_bytes -= item[1]
+        return item
+
+    def _evict(self, keep=None):
+        while self._data and (self.current_bytes > self.max_bytes or len(self._data) > self.max_entries):
+            oldest = next(iter(self._data))
+            if oldest == keep:
+                # 只剩正在写入的条目时不再淘汰
+                if len(self._data) == 1:
+                    break
+                self._data.move_to_end(oldest)
+                continue
+            self._discard(oldest)
+            self.evictions += 1
@@ -1,10 +1,8 @@
 from datetime import datetime
 import pandas as pd
 import uuid
-from collections import UserDict
-import os
-import pickle as pkl
 class Task:
+    status_listener = None  # 状态变化时的回调（例如task_store.TaskStore.on_status），接收Task对象
     def __init__(self, obj_path):
         self.timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         self.task_id = str(self.generate_uuid_with_timestamp())  # 生成唯一任务ID
@@ -13,38 +11,27 @@ class Task:
         self.obj_path = obj_path
         self.image_path = './images/default.jpg'
         self.video_path = None
+        self.preview_path = None  # 轨迹预览（mp4或gif），见trajectory_preview
+        self.motion_path = None  # 本次提交的Lingo输出文件，见pipeline.stage_lingo
+        self.pixel_to_scene_ratio = None  # 投影图片像素坐标与场景坐标之比
+        self.voxel_scale = None  # 体素化时的缩放因子（每单位场景长度的体素数），见interfaces.voxelize_obj
         self.result_path = None
         self.npy_path = None
         self.data:pd.DataFrame = None
         self.blend_path=None
+        self.stage = None  # 正在执行的阶段（见scheduler.TaskScheduler）
+        self.stages = []  # 本次提交需要执行的全部阶段名称
+        self.progress = None  # 当前阶段的进度描述，例如渲染到第几帧
+        self.error = None  # 失败时的错误信息
+        self.cancel_requested = False  # 由调度器在阶段之间检查
+        self.timeline = []  # 各阶段的耗时、内存和写入量记录，见metrics.trace_stage
+        self.result_key = None  # 场景内容与动作规划的哈希，相同的提交复用结果，见result_memo
+        self.following = None  # 合并到的相同提交的任务ID，见scheduler.TaskScheduler.submit
     def update_status(self, status):
         self.status = status
+        if Task.status_listener is not None:
+            Task.status_listener(self)
 
     def generate_uuid_with_timestamp(self):
         # 使用时间戳和随机数生成UUID
-        return uuid.uuid5(uuid.NAMESPACE_DNS, f"{self.timestamp}-{uuid.uuid4()}")    
-class PersistentDict(UserDict):
-    def __init__(self, id):
-        self.id = id
-        # 从文件加载现有数据
-        if os.path.exists(f'/cache/{self.id}.pkl'):
-            with open(f'/cache/{self.id}.pkl', 'rb') as f:
-                self.data = pkl.load(f)
-        else:
-            self.data = {}
-
-    def save(self):
-        # 将数据保存到文件
-        try:
-            with open(f'{self.id}.pkl', 'r') as f:
-                return pkl.load(f)
-        except FileNotFoundError:
-            return None
-
-    def __setitem__(self, key, value):
-        super().__setitem__(key, value)
-        self.save()  # 每次修改后自动保存
-
-    def __delitem__(self, key):
-        super().__delitem__(key)
-        self.save()
\ No newline at end of file
+        return uuid.uuid5(uuid.NAMESPACE_DNS, f"{self.timestamp}-{uuid.uuid4()}")
@@ -0,0 +1,47 @@
+###
+#  挂载在Gradio应用之外的HTTP接口
+###
+import os
+import re
+
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+
+from metrics import render_cache_metrics, stage_metrics
+
+from result_packaging import archive_path_for, is_archive_current, iter_result_zip
+
+OUTPUT_ROOT = "./outputs"
+TASK_ID_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+
+def task_output_dir(task_id: str) -> str:
+    """校验任务ID并返回其输出目录，防止通过路径穿越访问其他文件"""
+    if not TASK_ID_PATTERN.match(task_id):
+        raise HTTPException(status_code=400, detail="invalid task id")
+    folder = os.path.join(OUTPUT_ROOT, task_id)
+    if not os.path.isdir(folder):
+        raise HTTPException(status_code=404, detail="task not found")
+    return folder
+
+
+def download_result(task_id: str):
+    """下载任务结果：压缩包已是最新时直接返回文件，否则边打包边输出"""
+    folder = task_output_dir(task_id)
+    filename = f"{task_id}.zip"
+    if is_archive_current(folder):
+        return FileResponse(archive_path_for(folder), media_type="application/zip", filename=filename)
+    return StreamingResponse(iter_result_zip(folder), media_type="application/zip",
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+def metrics():
+    """以Prometheus文本格式导出各阶段和进程内缓存的统计"""
+    body = stage_metrics.render_prometheus() + render_cache_metrics()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
+def register_routes(app):
+    """在FastAPI应用上注册本模块的接口"""
+    app.add_api_route("/download/{task_id}", download_result, methods=["GET"])
+    app.add_api_route("/metrics", metrics, methods=["GET"])
@@ -0,0 +1,131 @@
+###
+#  批量导入场景库：用多进程对目录下的所有.obj场景执行体素化和投影，结果写入场景库（见scene_library），
+#  之后上传相同场景时Web应用直接使用库中的结果。已导入（内容和参数都相同）的场景会被跳过
+#  用法：python ingest_scenes.py <场景目录> [--library ./scene_library] [--workers 4] [--recursive]
+###
+import argparse
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os.path import join as path_join
+
+from scene_library import DEFAULT_LIBRARY_DIR, UPLOAD_VOXEL_METHOD, SceneLibrary
+from voxel_cache import hash_file, make_cache_key
+
+TARGET_SHAPE = (400, 100, 600)
+
+
+def find_scenes(input_dir: str, recursive: bool = False):
+    """列出目录下的.obj文件（按路径排序）"""
+    if recursive:
+        paths = [path_join(root, name) for root, _, files in os.walk(input_dir) for name in files]
+    else:
+        paths = [path_join(input_dir, name) for name in os.listdir(input_dir)]
+    return sorted(p for p in paths if p.lower().endswith('.obj') and os.path.isfile(p))
+
+
+def ingest_scene(path: str, library_root: str, target_shape=TARGET_SHAPE, pitch=1, method: str = UPLOAD_VOXEL_METHOD,
+                 voxel_format: str = '.svox', projections=('average',), force: bool = False):
+    """在工作进程中处理单个场景
+
+    返回:
+        tuple: (状态, 缓存键, 场景条目)，状态为 'ingested' 或 'skipped'
+    """
+    library = SceneLibrary(library_root)
+    digest = hash_file(path)
+    # 与interfaces.voxelize_obj_cached使用相同的键，上传相同场景时才能命中
+    key = make_cache_key(digest, target_shape=list(target_shape), pitch=pitch, method=method)
+    entry = library.lookup(key)
+    if entry is not None and not force and all(p in entry["images"] for p in projections):
+        return 'skipped', key, entry
+
+    # 只有需要处理时才导入体素化相关的模块，跳过已导入的场景时不必付出导入开销
+    from interfaces import mesh_cache, voxelize_obj
+    from npy_to_2d_image import npy_to_2d_images
+
+    tic = time.perf_counter()
+    # 解析结果同时写入网格缓存，Web应用之后处理同一场景时也能直接使用
+    mesh = mesh_cache.load(path)
+    bounds = mesh.metadata['mesh_cache']["bounds"]
+    extents = mesh.metadata['mesh_cache']["extents"]
+    # 先写入临时目录再整体重命名，中途失败不会留下不完整的条目
+    scene_dir = library.scene_dir(key)
+    tmp_dir = f"{scene_dir}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp_dir)
+    try:
+        voxel_name = "voxels" + voxel_format
+        _, ratio, scale = voxelize_obj(path, output=path_join(tmp_dir, voxel_name), target_shape=tuple(target_shape),
+                                       pitch=pitch, method=method, mesh=mesh)
+        images = {p: f"projection_{p}.png" for p in projections}
+        npy_to_2d_images(path_join(tmp_dir, voxel_name), {p: path_join(tmp_dir, name) for p, name in images.items()})
+        shutil.rmtree(scene_dir, ignore_errors=True)
+        os.rename(tmp_dir, scene_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    entry = {
+        "name": os.path.basename(path),
+        "source": os.path.abspath(path),
+        "sha256": digest,
+        "params": {"target_shape": list(target_shape), "pitch": pitch, "method": method},
+        "ratio": ratio,
+        "scale": scale,
+        "bounds": bounds,
+        "extents": extents,
+        "voxels": path_join(key, voxel_name),
+        "images": {p: path_join(key, name) for p, name in images.items()},
+        "seconds": round(time.perf_counter() - tic, 3),
+        "created": time.time(),
+    }
+    return 'ingested', key, entry
+
+
+def ingest_directory(input_dir: str, library_root: str = DEFAULT_LIBRARY_DIR, workers: int = None,
+                     recursive: bool = False, **options) -> dict:
+    """用进程池导入目录下的所有场景，每完成一个就写回清单，返回各状态的数量"""
+    scenes = find_scenes(input_dir, recursive)
+    library = SceneLibrary(library_root)
+    counts = {'ingested': 0, 'skipped': 0, 'failed': 0}
+    print(f"共 {len(scenes)} 个场景，使用 {workers or os.cpu_count()} 个进程")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(ingest_scene, path, library_root, **options): path for path in scenes}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                status, key, entry = future.result()
+            except Exception as e:
+                counts['failed'] += 1
+                print(f"[{done}/{len(scenes)}] 失败 {path}: {e}")
+                continue
+            counts[status] += 1
+            if status == 'ingested':
+                library.add(key, entry)
+                print(f"[{done}/{len(scenes)}] 已导入 {path}（{entry['seconds']}s，ratio={entry['ratio']:.4f}）")
+            else:
+                print(f"[{done}/{len(scenes)}] 已存在，跳过 {path}")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='voxelize and project a directory of .obj scenes into the scene library')
+    parser.add_argument('input_dir', help='directory containing .obj scenes')
+    parser.add_argument('--library', default=DEFAULT_LIBRARY_DIR, help='scene library directory')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: CPU count)')
+    parser.add_argument('--recursive', action='store_true', help='also search sub-directories')
+    parser.add_argument('--method', default=UPLOAD_VOXEL_METHOD, choices=['subdivide', 'fast'],
+                        help='voxelize engine; must match the web app for uploads to hit the library')
+    parser.add_argument('--format', default='.svox', choices=['.svox', '.pvox', '.npy'], help='voxel file format')
+    parser.add_argument('--projections', nargs='+', default=['average'], choices=['max', 'average', 'height'])
+    parser.add_argument('--force', action='store_true', help='re-process scenes that are already in the library')
+    args = parser.parse_args()
+
+    tic = time.perf_counter()
+    counts = ingest_directory(args.input_dir, args.library, args.workers, args.recursive, method=args.method,
+                              voxel_format=args.format, projections=tuple(args.projections), force=args.force)
+    print(f"完成：导入 {counts['ingested']}，跳过 {counts['skipped']}，失败 {counts['failed']}，"
+          f"耗时 {time.perf_counter() - tic:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,77 +1,124 @@
 
 import numpy as np
-import trimesh
-from  trimesh.voxel.creation import voxelize
-from datetime import datetime
 from classes import *
-from utils import *
-import json
+from utils import zip_input_into_pickle
 import os
-from os.path import isdir,isfile,join as path_join,exists as path_exists
-from  shutil import copy2
-import warnings
-import matplotlib.pyplot as plt
-from utils import *
+from contextlib import nullcontext
+from PIL import Image
+from npy_to_2d_image import npy_to_2d_image, project_voxels
+from voxel_cache import VoxelCache
+from scene_library import SceneLibrary
+from mesh_cache import MeshCache
+from asset_store import AssetStore, link_or_copy
+from voxel_format import save_voxels, export_dense_npy
+from sparse_voxels import SPARSE_SUFFIX, SparseVoxelGrid
+from voxelizer import grid_scale, normalize_mesh_to_grid, voxelize_mesh, voxelize_fast
 
-def voxelize_obj(path:str,output:str="./cache/default.npy")->np.ndarray:
+voxel_cache = VoxelCache() # 体素化结果缓存，同一场景被重复上传时直接复制缓存结果
+mesh_cache = MeshCache() # 解析并补洞后的网格，同一场景的各个阶段不再重复解析.obj文本
+scene_library = SceneLibrary() # ingest_scenes批量预处理的场景库，上传的场景在库中时不需要体素化
+asset_store = AssetStore() # 按内容保存不可变文件，任务目录中的模板、场景文件以reflink/硬链接的方式共享
+
+def voxelize_obj(path:str,output:str="./cache/default.npy",target_shape=(400, 100, 600),pitch=1,method:str='subdivide',mesh=None)->np.ndarray:
     '''
     “体素化”，类似于把矢量图“像素化”，是把一个三维模型采样为一个三维数组，每个元素描述对应位置的“体素”是否与模型重合
     从指定路径下读取场景文件，并将其采样，转化为高维数组，存储至输入数据缓存区（./cache）
     @param path:str 场景文件（.obj）的路径
-    @param output:str="./cache/default.npy" 存储.npy文件的路径和文件名
-    @return:np.ndarray 高维np数组的转化结果
+    @param output:str="./cache/default.npy" 存储体素文件的路径和文件名，以.pvox结尾时使用位压缩格式（见voxel_format），
+                                            以.svox结尾时使用稀疏格式且不分配稠密网格（见sparse_voxels）
+    @param target_shape:tuple=(400, 100, 600) 目标体素尺寸
+    @param pitch:float=1 体素的大小
+    @param method:str='subdivide' 体素化引擎，'subdivide' 为trimesh细分体素化，'fast' 为批量格点体素化（见voxelizer）
+    @param mesh=None 已读取并补洞的网格（会被就地修改），为None时从网格缓存读取
+    @return:tuple (体素矩阵, pixel_to_scene_cordinate_ratio, 体素缩放因子)。体素矩阵为高维np数组，稀疏格式时为SparseVoxelGrid；
+                  缩放因子为场景中每单位长度对应的体素数，网格高度不足时小于pixel_to_scene_cordinate_ratio（见route_check）
     '''
 
-    # 读取 .obj 文件
-    mesh = trimesh.load_mesh(path)
+    # 读取 .obj 文件（解析和fill_holes的结果由mesh_cache缓存，同一场景只执行一次）
+    if mesh is None:
+        mesh = mesh_cache.load(path)
     x,z,y=mesh.extents
-    
-    # 目标体素尺寸
-    target_shape = (400, 100, 600)
-    mesh.fill_holes()
 
-    # 计算模型的长宽高
-    bounds_min, bounds_max = mesh.bounds
-    model_size = bounds_max - bounds_min  # 长宽高
+    # 将模型等比缩放、平移到目标体素网格中
+    voxel_scale = normalize_mesh_to_grid(mesh, target_shape)
 
-    # 计算每个维度的缩放因子，保持长宽高比
-    scaling_factors = np.array(target_shape) / model_size
+    # # 体素化模型
+    # 将网格转换为体素网格，pitch是体素的大小
+    voxel_grid = voxelize_mesh(mesh, pitch, method=method, sparse=output.endswith(SPARSE_SUFFIX))
 
-    # 取最小的缩放因子，以保证场景尺寸不超过目标尺寸
-    scaling_factor = min(scaling_factors)
+    save_voxels(output, voxel_grid)
+    pixel_to_scene_cordinate_ratio=min(target_shape[0]/x,target_shape[2]/y)
+    return voxel_grid,pixel_to_scene_cordinate_ratio,float(voxel_scale)
 
-    # 计算模型边界范围
-    bounds_min, bounds_max = mesh.bounds
-    model_size = bounds_max - bounds_min
+def voxelize_obj_cached(path:str,output:str,image_path:str,projection_type:str='average',target_shape=(400, 100, 600),pitch=1,method:str='subdivide',cache:VoxelCache=None,trace=None,library:SceneLibrary=None)->float:
+    '''
+    带缓存的体素化+投影：以场景文件内容和体素化参数为键依次查找场景库和缓存，命中时直接使用体素矩阵和投影图片，
+    未命中时调用voxelize_obj和npy_to_2d_image并将结果写入缓存
+    @param path:str 场景文件（.obj）的路径
+    @param output:str 存储体素矩阵的路径和文件名
+    @param image_path:str 投影图片的输出路径
+    @param projection_type:str='average' 投影方式，见npy_to_2d_image
+    @param cache:VoxelCache=None 使用的缓存，默认为模块级的voxel_cache
+    @param library:SceneLibrary=None 预处理的场景库，默认为模块级的scene_library
+    @param trace=None 各步骤的计时上下文工厂，trace(步骤名) 返回上下文管理器，例如绑定了任务的metrics.trace_stage
+    @return:tuple (pixel_to_scene_cordinate_ratio, 体素缩放因子)
+    '''
+    cache = cache or voxel_cache
+    library = library or scene_library
+    trace = trace or (lambda name: nullcontext())
+    with trace('voxel_cache_fetch'):
+        key = cache.make_key(path, target_shape=target_shape, pitch=pitch, method=method)
+        hit = library.fetch(key, output, image_path, projection_type)
+        if hit is None:
+            hit = cache.fetch(key, output, image_path, projection_type)
+    if hit is not None:
+        ratio, scale = hit
+        if scale is None:
+            # 旧版本写入的条目没有记录缩放因子，由场景尺寸按normalize_mesh_to_grid的规则计算
+            scale = grid_scale(mesh_cache.load(path).extents, target_shape)
+        return ratio, scale
+    with trace('voxelize_obj'):
+        _,ratio,scale=voxelize_obj(path, output=output, target_shape=target_shape, pitch=pitch, method=method)
+    with trace('npy_to_2d_image'):
+        npy_to_2d_image(output, image_path, projection_type=projection_type)
+    with trace('voxel_cache_store'):
+        cache.store(key, output, ratio, image_path, projection_type, scale=scale)
+    return ratio, scale
 
-    # 计算缩放比例，使模型正好适配目标体素网格
-    scaling_factors = np.array(target_shape) / model_size
-    scaling_factor = min(scaling_factors)*0.995  # 保证模型按最小比例等比缩放
-    # 缩放模型
-    mesh.apply_scale(scaling_factor)
-    # 平移模型到体素网格中心
-    mesh.apply_translation(-mesh.bounds[0])  # 移动到原点
-    mesh.apply_translation([0,0.2,0])  # 移动到原点
-    grid_size = np.array(target_shape)
-    mesh.apply_translation(grid_size / 2 - model_size * scaling_factor / 2)
 
-    # # 体素化模型
-    # 将网格转换为体素网格
-    voxel_grid = voxelize(mesh,1) # pitch是体素的大小
+def coarse_projection(path:str,image_path:str,target_shape=(400, 100, 600),factor:int=4)->float:
+    '''
+    快速生成低分辨率的平均值投影，供上传后先行展示：在缩小factor倍的网格上做稀疏体素化，
+    投影后按最近邻放大到与完整分辨率投影大致相同的尺寸。像素/场景坐标比只取决于场景尺寸，与完整结果一致
+    @param path:str 场景文件（.obj）的路径
+    @param image_path:str 投影图片的输出路径
+    @param target_shape:tuple=(400, 100, 600) 完整分辨率的目标体素尺寸
+    @param factor:int=4 分辨率缩小的倍数
+    @return:float pixel_to_scene_cordinate_ratio
+    '''
+    mesh = mesh_cache.load(path)
+    x,z,y=mesh.extents
+    coarse_shape = tuple(max(1, -(-size // factor)) for size in target_shape)
+    normalize_mesh_to_grid(mesh, coarse_shape)
+    projection = project_voxels(voxelize_fast(mesh, sparse=True), ('average',))['average']
+    image = Image.fromarray(np.stack((projection,) * 3, axis=-1))
+    image = image.resize((image.width * factor, image.height * factor), Image.NEAREST)
+    image.save(image_path)
+    return min(target_shape[0]/x,target_shape[2]/y)
 
-    # 获取体素网格的布尔值表示
-    voxel_grid = voxel_grid.matrix
-    np.save(output, voxel_grid)
-    pixel_to_scene_cordinate_ratio=min(400/x,600/y)
-    return voxel_grid,pixel_to_scene_cordinate_ratio
-        
-    
 def prep_lingo_job(task:Task):
     zip_input_into_pickle(task)
-    copy2(task.npy_path, f"./lingo_model/dataset/Scene_vis/{task.task_id}.npy")
+    # Lingo模型只接受.npy，稀疏/位压缩格式的体素文件在此逐切片导出；相同场景只导出一次，之后以链接方式共享
+    dense_key = f"{asset_store.digest(task.npy_path)}.npy"
+    dense_path = asset_store.put_derived(dense_key, lambda tmp: export_dense_npy(task.npy_path, tmp))
+    link_or_copy(dense_path, f"./lingo_model/dataset/Scene_vis/{task.task_id}.npy")
 
 def show_voxelized_result(ndarray:np.ndarray,path:str):
-    processed_arr_summary=-np.sum(ndarray[:,:70,:],axis=1)
+    import matplotlib.pyplot as plt # 只在需要绘图时导入，Web进程启动时不加载matplotlib
+    if isinstance(ndarray, SparseVoxelGrid):
+        processed_arr_summary=-ndarray.column_counts(0, 70)
+    else:
+        processed_arr_summary=-np.sum(ndarray[:,:70,:],axis=1)
     # 使用 imshow 函数将数组显示为图片
     plt.imshow(processed_arr_summary, cmap='gray') 
     plt.rcParams['figure.autolayout'] = True
@@ -0,0 +1,172 @@
+###
+#  常驻的Lingo推理进程：模型和Hydra配置只加载一次，之后通过本地IPC接收推理任务，
+#  排队中的多个任务会被合并成一批发送。父进程侧使用LingoWorkerClient，子进程侧直接运行本文件
+###
+import os
+import queue
+import runpy
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+from metrics import track_process
+from worker_process import WorkerProcess, WorkerCrashed, serve
+
+LINGO_CODE_DIR = "./lingo_model/code"
+
+
+class LingoWorkerClient:
+    """父进程侧的Lingo推理客户端，负责启动/重启常驻推理进程并按批次派发任务
+
+    参数:
+        code_dir (str, optional): sample_lingo.py 所在目录. Defaults to "./lingo_model/code".
+        max_batch (int, optional): 每批最多合并的任务数. Defaults to 4.
+        batch_window (float, optional): 收到第一个任务后等待更多任务加入同一批的时间（秒）. Defaults to 0.5.
+    """
+
+    def __init__(self, code_dir: str = LINGO_CODE_DIR, max_batch: int = 4, batch_window: float = 0.5):
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.worker = WorkerProcess([sys.executable, os.path.abspath(__file__)],
+                                    cwd=code_dir, name="lingo worker")
+        self._jobs = queue.Queue()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="lingo-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, input_path: str, output_path: str, npy_name: str) -> Future:
+        """提交一个推理任务，返回Future。参数含义同utils.run_lingo_code_in_subprocess"""
+        future = Future()
+        job = {
+            'input_path': str(Path(input_path).resolve()),
+            'output_path': str(Path(output_path).resolve()),
+            'npy_name': npy_name,
+        }
+        self._jobs.put((job, future))
+        return future
+
+    def run(self, input_path: str, output_path: str, npy_name: str):
+        """提交推理任务并阻塞等待其完成，等待期间推理进程的内存计入当前阶段"""
+        track_process(self.worker)
+        return self.submit(input_path, output_path, npy_name).result()
+
+    def _dispatch_loop(self):
+        while True:
+            batch = [self._jobs.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._jobs.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                # 派发线程不能退出，否则本批和之后的任务都会一直等待
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _run_batch(self, batch):
+        jobs = [job for job, _ in batch]
+        results = None
+        for attempt in range(2):
+            try:
+                results = self.worker.request({'cmd': 'run', 'jobs': jobs})
+                break
+            except WorkerCrashed as e:
+                # 推理进程崩溃：下一次请求会自动重启，整批重试一次
+                print(f"{e}，重试本批任务")
+                error = e
+            except Exception as e:
+                error = e
+                break
+        if results is None:
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            if result.get('error'):
+                future.set_exception(RuntimeError(result['error']))
+            else:
+                future.set_result(result)
+
+
+###
+#  以下为子进程侧
+###
+
+def _reset_hydra():
+    """sample_lingo以hydra.main为入口时，同一进程内重复运行需要先清理全局Hydra状态"""
+    try:
+        from hydra.core.global_hydra import GlobalHydra
+        GlobalHydra.instance().clear()
+    except ImportError:
+        pass
+
+
+class LingoRunner:
+    """在常驻进程中执行推理。优先使用sample_lingo提供的钩子函数复用已加载的模型：
+        load_model() -> model
+        run_inference(model, input_path, output_path, npy_name)
+        run_inference_batch(model, jobs)       （可选，jobs为dict列表）
+    若sample_lingo未提供钩子，则在当前（已预热的）解释器内以脚本方式运行，仍可省去解释器启动和依赖导入的开销
+    """
+
+    def __init__(self):
+        sys.path.insert(0, os.getcwd())
+        import sample_lingo
+        self.module = sample_lingo
+        self.model = None
+        if hasattr(sample_lingo, 'load_model'):
+            tic = time.perf_counter()
+            self.model = sample_lingo.load_model()
+            print(f"Lingo模型加载完成，用时 {time.perf_counter() - tic:.1f}s")
+
+    def run_script(self, job):
+        _reset_hydra()
+        argv = sys.argv
+        sys.argv = ["sample_lingo.py", job['input_path'], job['output_path'], job['npy_name']]
+        try:
+            runpy.run_path("sample_lingo.py", run_name="__main__")
+        except SystemExit as e:
+            if e.code not in (0, None):
+                raise RuntimeError(f"sample_lingo.py 退出码 {e.code}")
+        finally:
+            sys.argv = argv
+
+    def run_batch(self, jobs):
+        if self.model is not None and len(jobs) > 1 and hasattr(self.module, 'run_inference_batch'):
+            self.module.run_inference_batch(self.model, jobs)
+            return [{'npy_name': job['npy_name']} for job in jobs]
+        results = []
+        for job in jobs:
+            # 单个任务失败不影响同一批的其他任务
+            try:
+                if self.model is not None and hasattr(self.module, 'run_inference'):
+                    self.module.run_inference(self.model, job['input_path'], job['output_path'], job['npy_name'])
+                else:
+                    self.run_script(job)
+                results.append({'npy_name': job['npy_name']})
+            except Exception as e:
+                results.append({'npy_name': job['npy_name'], 'error': repr(e)})
+        return results
+
+
+def main():
+    runner = LingoRunner()
+
+    def handle(message, send_progress):
+        if message['cmd'] == 'run':
+            return runner.run_batch(message['jobs'])
+        raise ValueError(f"未知命令: {message['cmd']}")
+
+    serve(handle)
+
+
+if __name__ == "__main__":
+    main()
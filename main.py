@@ -1,18 +1,26 @@
-import gradio as gr
-import zipfile
+import time
+_STARTED = time.perf_counter()  # 启动计时，见 --startup-probe
+import json
 import os
+import sys
 import queue
-import threading
-import json
-import time
-import shutil
-from PIL import Image, ImageDraw, ImageFont
-from matplotlib import pyplot as plt
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import gradio as gr
+import uvicorn
+from fastapi import FastAPI
 import pandas as pd
-from interfaces import *
-from npy_to_2d_image import *
-from utils import *
+# 只导入Web进程需要的名称；trimesh、scipy、matplotlib在第一次处理场景时才加载，bpy只在Blender工作进程中加载
+from classes import Task
+from interfaces import voxelize_obj_cached, coarse_projection, asset_store
+from scheduler import TaskScheduler, TaskBusy
+from preview_cache import PreviewCanvasCache
+from http_routes import register_routes
+from metrics import trace_stage, register_cache, current_rss
+from pipeline import TASK_STAGES, RENDER_STAGES, BLEND_TEMPLATE, render_settings
+from task_store import TaskStore
+from route_check import RouteChecker
+from scene_library import UPLOAD_VOXEL_METHOD
+from result_memo import ResultMemo, result_key
 # 定义任务类
 
 
@@ -23,22 +31,28 @@ act_ops = ["walk", "run", "pick up", "put down", "lie down"]
 # 预览轨迹的颜色设置
 act_color = ["red", "orange", "blue", "yellow", "green"]
 
-is_init = False
-image_name_to_p2c_ratio_map={} # 用来装载每张npy可视化图片的像素坐标对应场景的实际坐标之比
 components_visible=[] # 装载在结果生成完毕后需要切换可见性的组件
-
-
-# 初始空表格，有5列，初始化时包含一条数据行
-df = pd.DataFrame(columns=["起点x1", "起点y1", "终点x2", "终点y2", "动作"])
-
-# 表格的更新函数
-def update_table(selected_option, table):
+# 预览画布缓存，按任务保存解码后的图像、坐标换算和已绘制的图层；总内存和闲置时间都有上限
+preview_canvas_cache = PreviewCanvasCache(act_color, ttl=3600)
+register_cache('preview_canvas', preview_canvas_cache.cache)
+# 各场景的可行走区域，提交前检查动作规划，不可行的任务不进入队列
+route_checker = RouteChecker(asset_store)
+register_cache('route_map', route_checker.cache)
+
+# 动作规划表的列
+ROUTE_COLUMNS = ["起点x1", "起点y1", "终点x2", "终点y2", "动作"]
+
+def empty_route_table():
+    """初始空表格，有5列；每个会话各自创建，互不影响"""
+    return pd.DataFrame(columns=ROUTE_COLUMNS)
+
+# 表格的更新函数。table_initialized是会话级状态，记录本会话的表格是否已添加过第一条动作
+def update_table(selected_option, table, table_initialized):
     lt = len(table)
-    global is_init
-    if not is_init:
+    updated_table = table
+    if not table_initialized:
         print("first add")
-        is_init = True
-        updated_table = pd.DataFrame([["", "", "", "", selected_option]], columns=["起点x1", "起点y1", "终点x2", "终点y2", "动作"])
+        updated_table = pd.DataFrame([["", "", "", "", selected_option]], columns=ROUTE_COLUMNS)
     elif lt < 5:
         print(f"{lt}th add")
         # 提取表格最后一行的 '终点x2' 和 '终点y2'
@@ -48,10 +62,17 @@ def update_table(selected_option, table):
 
         new_row = pd.DataFrame([[last_end_x2, last_end_y2, "", "", selected_option]], columns=table.columns)
         updated_table = pd.concat([table, new_row], ignore_index=True)  # 使用pd.concat合并
-    return updated_table
+    return updated_table, True
 
 
-# 处理文件上传并创建任务
+# 上传后的体素化和投影在后台线程池中执行，不占用Gradio的工作线程
+upload_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="upload")
+
+def _discard_file(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+# 处理文件上传并创建任务。生成器：先推送任务ID，再推送低分辨率的粗略投影，完整投影完成后替换为最终结果
 def process_file(file):
     task = Task(file.name)  # 创建任务对象
     print(f"processing {file.name}")
@@ -59,172 +80,166 @@ def process_file(file):
     # 创建输出目录
     task.output_dir = f"./outputs/{task.task_id}"
     task.blend_path = task.output_dir+"/vis.blend"
-    shutil.copy2("./assets/vis.blend", task.blend_path)
     os.makedirs(task.output_dir, exist_ok=True)
-    global is_init
-    is_init = False
 
     # 文件转存：复制上传的文件到目标目录
     task.obj_path = os.path.join(task.output_dir, os.path.basename(file.name))
 
-    shutil.copy(file.name, task.obj_path)
+    # 模板和场景文件按内容只保存一份，任务目录中为reflink或硬链接；需要修改时先断开链接（见asset_store.make_private）
+    with trace_stage(task, 'copy'):
+        asset_store.place(BLEND_TEMPLATE, task.blend_path)
+        asset_store.place(file.name, task.obj_path)
 
     print(f"task file path uploaded: {task.obj_path}")
     task.update_status('uploaded')  # 更新任务状态为上传成功
+    # 体素化完成前不更新会话中的Task，避免用户在没有完整投影时预览或提交
+    yield task.task_id, gr.update(), gr.update(), False  # 新场景的动作规划从第一条重新开始
 
     # 保存图像路径
     img_path = f"./{task.output_dir}/processed_images.png"
-    NPY_PATH =f"{task.output_dir}/{task.task_id}.npy"
+    coarse_path = f"{task.output_dir}/coarse_images.png"
+    NPY_PATH =f"{task.output_dir}/{task.task_id}.svox" # 稀疏体素文件，只记录被占据的区段，提交给Lingo时再导出为.npy
     task.npy_path=NPY_PATH
-    # 体素化图像
-    voxelized_result,pixel_to_scene_cordinate_ratio=voxelize_obj(task.obj_path, output=NPY_PATH)
-    image_name_to_p2c_ratio_map[img_path]=pixel_to_scene_cordinate_ratio
+    # 体素化图像（相同场景重复上传时直接使用缓存结果），同时计算粗略投影先行展示
+    full = upload_executor.submit(voxelize_obj_cached, task.obj_path, NPY_PATH, img_path, projection_type='average',
+                                  method=UPLOAD_VOXEL_METHOD, trace=lambda name: trace_stage(task, name))
+    coarse = upload_executor.submit(coarse_projection, task.obj_path, coarse_path)
+    wait([full, coarse], return_when=FIRST_COMPLETED)
+    if not full.done():
+        try:
+            coarse.result()
+            yield task.task_id, coarse_path, gr.update(), False
+        except Exception as e:
+            # 粗略投影只用于提前展示，失败时等待完整结果即可
+            print(f"粗略投影失败: {e}")
+    pixel_to_scene_cordinate_ratio,voxel_scale=full.result()
+    task.pixel_to_scene_ratio=pixel_to_scene_cordinate_ratio
+    task.voxel_scale=voxel_scale
     print(img_path)
-    # show_voxelized_result(voxelized_result, img_path)
-    npy_to_2d_image(NPY_PATH, img_path, projection_type='average')
-    
-    
+    # 完整结果已就绪：粗略投影还没开始就取消，否则在其结束后删除粗略投影图片（不打包进结果）
+    if not coarse.cancel():
+        coarse.add_done_callback(lambda _: _discard_file(coarse_path))
+
     # 更新任务的图片路径
     task.image_path = img_path
     task.update_status('npy')
+    task_store.save(task)  # 体素化后补齐图片、体素文件路径和坐标比例
+    # 在用户编辑动作规划的同时预先计算可行走区域，提交时只需查表
+    upload_executor.submit(route_checker.route_map, task.npy_path, task.voxel_scale)
 
-    # 将任务信息发送到消息队列
-    # task_queue.put(task)
-
-    return task.task_id, img_path, task
+    yield task.task_id, img_path, task, False
 
 # 根据表格内容修改图像的函数
 
 def preview_action(task, table:pd.DataFrame):
-    # 确保 img 是一个 PIL 图像对象
-    global act_color
-    img = task.image_path
-    print(f"task:{task}")
-    print(img)
-    ratio=image_name_to_p2c_ratio_map[img]
-    if isinstance(img, str):
-        img = Image.open(img)  # 如果 img 是文件路径，加载图像
-    draw = ImageDraw.Draw(img)
-    width, height = img.size
-    r = min(width, height) / 100  # 计算圆的半径
-
-    # 选择字体，这里使用默认字体
-    try:
-        font = ImageFont.truetype("arial.ttf", 15)
-    except IOError:
-        font = ImageFont.load_default()
+    """在场景图像上绘制动作规划的起点和终点。解码后的图像、字体和坐标换算按任务缓存，只重画变化的行"""
     task.data=table
-    # 确保表格中的坐标列是数字类型，无法转换的会被设置为 NaN，默认值为 0
-    table_scaled=table.copy()
-    table_scaled["起点x1"] = pd.to_numeric(table["起点x1"], errors='coerce').fillna(0).astype("float").multiply(ratio).astype("int")
-    table_scaled["起点y1"] = pd.to_numeric(table["起点y1"], errors='coerce').fillna(0).astype("float").multiply(ratio).astype("int")
-    table_scaled["终点x2"] = pd.to_numeric(table["终点x2"], errors='coerce').fillna(0).astype("float").multiply(ratio).astype("int")
-    table_scaled["终点y2"] = pd.to_numeric(table["终点y2"], errors='coerce').fillna(0).astype("float").multiply(ratio).astype("int")
-
-    # 获取图像的中心点坐标
-    center_x = width / 2
-    center_y = height / 2
-
-    # 遍历表格中的数据，绘制点并标注数字
-    for idx, row in table_scaled.iterrows():
+    return preview_canvas_cache.render(task.task_id, task.image_path, task.pixel_to_scene_ratio, table)
+
+# 后台任务调度器：提交后的推理、渲染和打包都在工作线程中执行，不再阻塞Gradio的请求处理
+task_scheduler = TaskScheduler(TASK_STAGES, num_workers=2, max_queue=32)
+
+# 任务记录持久化到SQLite，状态变化时只更新对应的字段
+task_store = TaskStore()
+Task.status_listener = task_store.on_status
+
+# 相同场景和动作规划的提交复用已完成的结果；排队或执行中的相同提交完成后同样复用
+result_memo = ResultMemo(task_store)
+task_scheduler.on_duplicate = lambda task, leader: result_memo.adopt(task, leader, task.stages)
+
+def recover_interrupted_tasks():
+    """服务启动时将上次未完成的任务重新放入队列，从中断的阶段继续执行；任务目录已不存在的保持interrupted"""
+    stage_functions = dict(TASK_STAGES + RENDER_STAGES)
+    for task_id, stage in task_store.recover_in_flight():
+        task = task_store.load_task(task_id)
+        if task is None or not task.output_dir or not os.path.isdir(task.output_dir) or not task.stages:
+            print(f"任务 {task_id} 无法恢复，保持interrupted")
+            continue
+        remaining = task.stages[task.stages.index(stage):] if stage in task.stages else task.stages
         try:
-            # 获取表格中的坐标
-            x1_center = row["起点x1"]
-            y1_center = row["起点y1"]
-
-            # 打印坐标进行调试
-            print(f"Point {idx + 1}: (center_x={x1_center}, center_y={y1_center})")
-
-            # 将表格中的中心坐标转换为相对于图像左上角的坐标
-            start_x = center_x + x1_center  # 从图像中心计算起点x
-            start_y = center_y - y1_center  # 从图像中心计算起点y
-
-            # 将中心点坐标转换为圆形绘制范围
-            start_x1 = start_x - r  # 圆形的左上角x坐标
-            start_y1 = start_y - r  # 圆形的左上角y坐标
-            start_x2 = start_x + r  # 圆形的右下角x坐标
-            start_y2 = start_y + r  # 圆形的右下角y坐标
-
-            # 绘制点
-            draw.ellipse([start_x1, start_y1, start_x2, start_y2], fill=act_color[idx], outline="black")  # 画点
-
-            # 在点上标注数字
-            text_x = start_x + r  # 标注数字的x位置
-            text_y = start_y - (2 * r)  # 标注数字的y位置
-
-            # 如果文本位置超出了图像的范围，做一些调整
-            text_x = max(0, min(text_x, width - 20))  # 确保文本x坐标在图像范围内
-            text_y = max(0, min(text_y, height - 20))  # 确保文本y坐标在图像范围内
-
-            draw.text((text_x, text_y), str(idx + 1), fill="black", font=font)  # 标注数字，idx+1表示从1开始
-
-
-            # 获取表格中的坐标
-            x2_center = row["终点x2"]
-            y2_center = row["终点y2"]
-
-            # 打印坐标进行调试
-            print(f"Point {idx + 1}: (center_x={x2_center}, center_y={y2_center})")
-
-            # 将表格中的中心坐标转换为相对于图像左上角的坐标
-            start_x = center_x + x2_center  # 从图像中心计算起点x
-            start_y = center_y - y2_center  # 从图像中心计算起点y
-
-            # 将中心点坐标转换为圆形绘制范围
-            start_x1 = start_x - (2*r)  # 圆形的左上角x坐标
-            start_y1 = start_y - (2*r)  # 圆形的左上角y坐标
-            start_x2 = start_x + (2*r)  # 圆形的右下角x坐标
-            start_y2 = start_y + (2*r)  # 圆形的右下角y坐标
-
-            # 绘制点
-            draw.ellipse([start_x1, start_y1, start_x2, start_y2], fill=act_color[idx], outline="black")  # 画点
-
-            # 在点上标注数字
-            text_x = start_x + r  # 标注数字的x位置
-            text_y = start_y - (2 * r)  # 标注数字的y位置
-
-            # 如果文本位置超出了图像的范围，做一些调整
-            text_x = max(0, min(text_x, width - 20))  # 确保文本x坐标在图像范围内
-            text_y = max(0, min(text_y, height - 20))  # 确保文本y坐标在图像范围内
-
-            draw.text((text_x, text_y), str(idx + 1), fill="black", font=font)  # 标注数字，idx+1表示从1开始
-
-        except Exception as e:
-            print(f"Error drawing row {row}: {e}")
-
-    return img
-
-# 用于提交数据，返回视频和结果文件路径
+            task_scheduler.submit(task, [(name, stage_functions[name]) for name in remaining])
+            print(f"任务 {task_id} 已从阶段 {remaining[0]} 恢复")
+        except queue.Full:
+            print(f"等待队列已满，任务 {task_id} 保持interrupted")
+            task.update_status('interrupted')
+
+BUSY_MESSAGE = "任务正在排队或执行中，请等待完成或先取消任务"
+
+def _run_and_stream(task, stages):
+    """提交任务到后台队列，并以生成器的方式持续推送任务状态，完成后推送预览、视频和结果文件路径。
+    场景和动作规划都相同的提交直接复用已完成任务的结果，正在处理中的则由调度器合并"""
+    unchanged = (gr.update(),) * 4
+    if task_scheduler.active(task):
+        yield (BUSY_MESSAGE,) + unchanged
+        return
+    stage_names = [name for name, _ in stages]
+    with trace_stage(task, 'result_memo'):
+        task.result_key = result_key(task, render_settings() if 'render' in stage_names else None)
+        source = result_memo.lookup(task, stage_names)
+        if source is not None:
+            result_memo.adopt(task, source, stage_names)
+    if source is None:
+        try:
+            task_scheduler.submit(task, stages)
+        except (queue.Full, TaskBusy) as e:
+            yield (str(e),) + unchanged
+            return
+
+        for status_text in task_scheduler.wait(task):
+            yield (status_text,) + unchanged
+
+    if task.status == 'completed':
+        for each_component in components_visible:
+            each_component.visible=True
+        # 轨迹预览为gif时显示在图片组件中，为mp4时与渲染视频共用视频组件
+        preview_is_gif = task.preview_path is not None and task.preview_path.endswith('.gif')
+        video_path = task.video_path or (None if preview_is_gif else task.preview_path)
+        yield (task_scheduler.status_text(task),
+               gr.update(value=task.preview_path, visible=True) if preview_is_gif else gr.update(),
+               gr.update(value=video_path, visible=True),
+               gr.update(value=video_path, visible=True),
+               gr.update(value=f"/download/{task.task_id}", visible=True))
+
+# 用于提交数据，先生成轨迹预览，返回预览和结果文件路径
 def submit_task(task, route_df):
-    # 这里可以模拟视频生成与处理
-    video_path = f"./outputs/{task.task_id}/processed_videos.mp4"
-    result_path = f"./outputs/{task.task_id}/processed_results.zip"
-
-    ## process task by lingo model
-
-
-    # 将模型输出封包为pkl文件
-    zip_input_into_pickle(task)
-    # 运行lingo
-    run_lingo_code_in_subprocess(task)
-    open_blend_and_import_obj("./vis.blend", task.obj_path)
-    # 将动画渲染并输出为视频
-    render_video_in_subprocess("./vis.blend",f"./lingo_web/outputs/{task.task_id}/processed_videos.mp4")
-    result_path=zip_folder_files(task.output_dir)
-
-    for each_component in components_visible:
-        each_component.visible=True
-        print(each_component)
-    task.video_path = video_path
-    task.result_path = result_path
-    task.update_status('completed')  # 更新状态为已完成
-
-    return video_path,video_path,result_path,gr.update(visible=True), gr.update(visible=True), gr.update(visible=True)
+    if task is None:
+        yield ("请先上传场景文件",) + (gr.update(),) * 4
+        return
+    if task_scheduler.active(task):
+        # 排队或执行中的任务不能修改动作规划，否则正在执行的阶段会读到新的内容
+        yield (BUSY_MESSAGE,) + (gr.update(),) * 4
+        return
+    with trace_stage(task, 'route_check'):
+        problems = route_checker.check(task, route_df)
+    if problems:
+        yield ("轨迹不可行，请修改后重新提交：\n" + "\n".join(problems),) + (gr.update(),) * 4
+        return
+    task.data = route_df
+    task.video_path = None
+    yield from _run_and_stream(task, TASK_STAGES)
+
+# 确认轨迹后按需执行Cycles高清渲染，返回视频和结果文件路径
+def render_task(task):
+    if task is None or task.preview_path is None:
+        yield ("请先提交任务并确认轨迹预览",) + (gr.update(),) * 4
+        return
+    yield from _run_and_stream(task, RENDER_STAGES)
+
+def cancel_task(task):
+    """取消排队中或正在执行的任务"""
+    if task is None or not task_scheduler.cancel(task):
+        return "没有可取消的任务"
+    return task_scheduler.status_text(task)
+
+def task_status(task):
+    """查询任务状态，供界面刷新和API轮询使用"""
+    return task_scheduler.status_text(task)
 
 # 创建Gradio界面
 with gr.Blocks() as demo:
     gr.HTML("<h1 style='text-align:center;'>3D 场景人物动态交互测试</h1>")  # 标题居中
-    state = gr.State()
+    state = gr.State()  # 本会话的Task
+    table_initialized = gr.State(False)  # 本会话的动作规划表是否已添加过动作
 
     # 添加自定义CSS来调整下拉框和按钮的高度
     gr.HTML("""
@@ -248,7 +263,7 @@ with gr.Blocks() as demo:
         # img_path.visible = False
         
         # 创建表格
-        table = gr.DataFrame(df, label="动作规划")
+        table = gr.DataFrame(empty_route_table(), label="动作规划")
 
         with gr.Row():  # 创建一行，包含下拉框和按钮
             # 创建下拉框
@@ -260,21 +275,48 @@ with gr.Blocks() as demo:
 
 
         preview_button = gr.Button("预览")
-        submit_button = gr.Button("提交")
+        with gr.Row():
+            submit_button = gr.Button("提交")
+            render_button = gr.Button("高清渲染")
+            cancel_button = gr.Button("取消任务")
+            status_button = gr.Button("刷新状态")
+        status_output = gr.Textbox(label="任务状态", interactive=False)
        
+        preview_image = gr.Image(label="轨迹预览", interactive=False)
         video_display = gr.Video(label="视频播放")
         video_output = gr.Textbox(label="视频链接", interactive=False)
         download_output = gr.Textbox(label="下载链接", interactive=False)
         components_visible.append(video_display)
         components_visible.append(video_output)
         components_visible.append(download_output)
-        file_input.upload(process_file, inputs=file_input, outputs=[task_id_output, img_output, state])
+        # 上传处理是生成器，只等待后台线程池中的体素化结果，不占用有限的并发名额
+        file_input.upload(process_file, inputs=file_input, outputs=[task_id_output, img_output, state, table_initialized],
+                          concurrency_limit=None)
 
         # 按钮事件
-        add_button.click(update_table, inputs=[act_dropdown, table], outputs=table)  # 更新表格
-        preview_button.click(preview_action, inputs=[state, table], outputs=img_output)  # 点击预览时，根据表格内容生成图像并展示
-
-        # 提交时处理任务并显示结果
-        submit_button.click(submit_task, inputs=[state, table], outputs=[video_display, video_output, download_output,video_display, video_output, download_output])
-
-demo.launch()
+        add_button.click(update_table, inputs=[act_dropdown, table, table_initialized], outputs=[table, table_initialized])  # 更新表格
+        preview_button.click(preview_action, inputs=[state, table], outputs=img_output, concurrency_limit=None)  # 点击预览时，根据表格内容生成图像并展示
+
+        # 提交时将任务放入后台队列，并持续推送状态直到任务结束；轮询只是等待，不占用有限的并发名额
+        result_outputs = [status_output, preview_image, video_display, video_output, download_output]
+        submit_button.click(submit_task, inputs=[state, table], outputs=result_outputs, concurrency_limit=None)
+        render_button.click(render_task, inputs=state, outputs=result_outputs, concurrency_limit=None)
+        cancel_button.click(cancel_task, inputs=state, outputs=status_output, concurrency_limit=None)
+        status_button.click(task_status, inputs=state, outputs=status_output, concurrency_limit=None, api_name="task_status")
+
+demo.queue(max_size=256)
+
+# 在Gradio之外挂载结果下载等HTTP接口
+app = FastAPI()
+register_routes(app)
+app = gr.mount_gradio_app(app, demo, path="/")
+
+if __name__ == "__main__":
+    if "--startup-probe" in sys.argv:
+        # 供benchmarks/bench_startup.py测量：应用构建完毕、即将开始服务时的耗时和内存，不实际启动服务
+        heavy = [m for m in ('bpy', 'trimesh', 'scipy.ndimage', 'matplotlib.pyplot') if m in sys.modules]
+        print("STARTUP_PROBE " + json.dumps({'seconds': time.perf_counter() - _STARTED, 'rss_bytes': current_rss(),
+                                             'heavy_modules': heavy}))
+        sys.exit(0)
+    recover_interrupted_tasks()
+    uvicorn.run(app, host="127.0.0.1", port=7860)
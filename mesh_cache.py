@@ -0,0 +1,95 @@
+###
+#  解析后网格的二进制缓存：场景.obj的文本解析和fill_holes只在第一次使用时执行，
+#  结果以顶点/面片数组（.npy，可内存映射）和包围盒等元数据保存，之后的各个阶段直接读取
+###
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from os.path import join as path_join, exists as path_exists
+
+import numpy as np
+
+from voxel_cache import META_NAME, VoxelCache, hash_file
+
+DEFAULT_MESH_CACHE_DIR = "./cache/mesh_cache"
+DEFAULT_MESH_CACHE_MAX_BYTES = 4 * 1024 ** 3
+MESH_CACHE_VERSION = 1
+
+
+class MeshCache(VoxelCache):
+    """按场景文件内容哈希缓存解析并补洞后的网格。每个条目包含:
+        vertices.npy    float64 (V, 3) 顶点
+        faces.npy       int64 (F, 3) 面片
+        meta.json       包围盒、尺寸以及面片数等信息
+    条目目录的组织和LRU淘汰与VoxelCache相同
+
+    参数:
+        cache_dir (str, optional): 缓存目录. Defaults to "./cache/mesh_cache".
+        max_bytes (int, optional): 磁盘占用上限. Defaults to 4GB.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_MESH_CACHE_DIR, max_bytes: int = DEFAULT_MESH_CACHE_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+        self._key_locks = {}
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        # 同一场景被并发读取时（例如上传后的粗略投影和完整体素化）只解析一次
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def load_arrays(self, path: str):
+        """返回 (vertices, faces, meta)，数组以只读内存映射方式打开；未缓存时先解析场景文件"""
+        key = f"{hash_file(path)}-v{MESH_CACHE_VERSION}"
+        entry = self._entry_dir(key)
+        with self._key_lock(key):
+            if not path_exists(path_join(entry, META_NAME)):
+                self._build(path, entry)
+        with open(path_join(entry, META_NAME), 'r') as f:
+            meta = json.load(f)
+        vertices = np.load(path_join(entry, "vertices.npy"), mmap_mode='r')
+        faces = np.load(path_join(entry, "faces.npy"), mmap_mode='r')
+        now = time.time()
+        os.utime(entry, (now, now))
+        return vertices, faces, meta
+
+    def load(self, path: str):
+        """读取已补洞的网格（trimesh.Trimesh），顶点为可修改的副本，面片为只读内存映射；
+        缓存的元数据（补洞前的包围盒等）放在mesh.metadata['mesh_cache']中"""
+        import trimesh
+        vertices, faces, meta = self.load_arrays(path)
+        mesh = trimesh.Trimesh(vertices=np.array(vertices), faces=faces, process=False)
+        mesh.metadata['mesh_cache'] = meta
+        return mesh
+
+    def _build(self, path: str, entry: str):
+        import trimesh
+        tic = time.perf_counter()
+        mesh = trimesh.load_mesh(path)
+        bounds = mesh.bounds.tolist()
+        extents = mesh.extents.tolist()
+        mesh.fill_holes()
+        tmp_dir = path_join(self.cache_dir, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        try:
+            np.save(path_join(tmp_dir, "vertices.npy"), np.asarray(mesh.vertices, dtype=np.float64))
+            np.save(path_join(tmp_dir, "faces.npy"), np.asarray(mesh.faces, dtype=np.int64))
+            with open(path_join(tmp_dir, META_NAME), 'w') as f:
+                json.dump({
+                    "bounds": bounds,  # 补洞前的包围盒与尺寸，与直接读取场景文件得到的一致
+                    "extents": extents,
+                    "n_vertices": int(len(mesh.vertices)),
+                    "n_faces": int(len(mesh.faces)),
+                    "watertight": bool(mesh.is_watertight),
+                    "created": time.time(),
+                }, f)
+            os.rename(tmp_dir, entry)
+            print(f"网格缓存写入: {path}（{time.perf_counter() - tic:.2f}s）")
+        except OSError:
+            # 其他进程抢先写入了同一条目
+            pass
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict()
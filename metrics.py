@@ -0,0 +1,263 @@
+###
+#  流水线各阶段的耗时/内存/写入量统计：按任务记录时间线并写入任务目录，
+#  同时在进程内汇总，以Prometheus文本格式导出（见http_routes中的/metrics）
+###
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows没有resource模块
+    resource = None
+
+TIMELINE_NAME = "pipeline_timeline.json"
+# 阶段耗时直方图的分桶上限（秒）
+DURATION_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800)
+_RSS_SAMPLE_INTERVAL = 0.05
+
+
+def current_rss() -> int:
+    """当前进程的常驻内存（字节）。优先读取/proc，其次使用psutil（已安装时），
+    都不可用时退化为resource给出的历史峰值；Windows上没有psutil时返回0"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    if resource is None:
+        return 0
+    # ru_maxrss在macOS上以字节为单位，Linux上以KB为单位
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def process_rss(pid: int):
+    """其他进程（例如Lingo、Blender工作进程）的常驻内存（字节），进程不存在或无法读取时返回None"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except ImportError:
+        return None
+    except Exception:  # psutil.NoSuchProcess、AccessDenied等
+        return None
+
+
+def directory_size(path: str) -> int:
+    """目录下（递归）所有文件大小之和，不计入时间线文件本身"""
+    total = 0
+    if path and os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for name in files:
+                if name == TIMELINE_NAME:
+                    continue
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+    return total
+
+
+class _RssSampler(threading.Thread):
+    """阶段执行期间周期性采样RSS，记录峰值。登记了子进程（见track_process）时，
+    同时记录各子进程RSS之和的峰值"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = current_rss()
+        self.worker_peak = None
+        self._workers = []
+        self._stop_event = threading.Event()
+
+    def track(self, pid_source):
+        self._workers.append(pid_source)
+
+    def _sample(self):
+        self.peak = max(self.peak, current_rss())
+        if not self._workers:
+            return
+        pids = {pid_source() if callable(pid_source) else getattr(pid_source, 'pid', None)
+                for pid_source in list(self._workers)}
+        total = sum(process_rss(pid) or 0 for pid in pids if pid is not None)
+        self.worker_peak = max(self.worker_peak or 0, total)
+
+    def run(self):
+        while not self._stop_event.wait(_RSS_SAMPLE_INTERVAL):
+            self._sample()
+
+    def stop(self) -> int:
+        self._stop_event.set()
+        self.join()
+        self._sample()
+        return self.peak
+
+
+# 当前正在执行的阶段的采样器，供阶段内启动或使用子进程的代码登记进程
+_current_sampler = contextvars.ContextVar('current_sampler', default=None)
+
+
+def track_process(pid_source):
+    """把子进程计入当前阶段（见trace_stage）的内存采样，不在阶段内时不做任何事
+
+    参数:
+        pid_source: 每次采样时读取pid的来源：带pid属性的对象（例如WorkerProcess，重启后自动跟随新进程），
+            或返回pid的函数；pid为None时表示进程未运行，不计入
+    """
+    sampler = _current_sampler.get()
+    if sampler is not None:
+        sampler.track(pid_source)
+
+
+class StageMetrics:
+    """进程内所有阶段的汇总统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def observe(self, record: dict):
+        with self._lock:
+            s = self._stages.setdefault(record['stage'], {
+                'count': 0, 'errors': 0, 'duration_sum': 0.0, 'duration_max': 0.0,
+                'bytes_written_sum': 0, 'peak_rss_max': 0, 'buckets': [0] * len(DURATION_BUCKETS),
+            })
+            s['count'] += 1
+            s['errors'] += record['status'] != 'ok'
+            s['duration_sum'] += record['duration_s']
+            s['duration_max'] = max(s['duration_max'], record['duration_s'])
+            s['bytes_written_sum'] += max(record['bytes_written'], 0)
+            s['peak_rss_max'] = max(s['peak_rss_max'], record['peak_rss_bytes'])
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if record['duration_s'] <= bound:
+                    s['buckets'][i] += 1
+
+    def render_prometheus(self) -> str:
+        """以Prometheus文本格式导出汇总统计"""
+        lines = [
+            "# HELP lingo_stage_duration_seconds Duration of pipeline stages.",
+            "# TYPE lingo_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            stages = {name: dict(s, buckets=list(s['buckets'])) for name, s in self._stages.items()}
+        for name, s in sorted(stages.items()):
+            for bound, count in zip(DURATION_BUCKETS, s['buckets']):
+                lines.append(f'lingo_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'lingo_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {s["count"]}')
+            lines.append(f'lingo_stage_duration_seconds_sum{{stage="{name}"}} {s["duration_sum"]:.6f}')
+            lines.append(f'lingo_stage_duration_seconds_count{{stage="{name}"}} {s["count"]}')
+        for metric, key, help_text, kind in (
+            ("lingo_stage_errors_total", 'errors', "Pipeline stages that raised.", "counter"),
+            ("lingo_stage_duration_max_seconds", 'duration_max', "Slowest observed run of each stage.", "gauge"),
+            ("lingo_stage_bytes_written_total", 'bytes_written_sum', "Bytes added to task directories by each stage.", "counter"),
+            ("lingo_stage_peak_rss_bytes", 'peak_rss_max',
+             "Highest RSS sampled while each stage ran: the Lingo/Blender worker processes for stages run there, "
+             "the web process otherwise.",
+             "gauge"),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, s in sorted(stages.items()):
+                lines.append(f'{metric}{{stage="{name}"}} {s[key]}')
+        lines.append("# HELP lingo_process_rss_bytes Current RSS of the web process.")
+        lines.append("# TYPE lingo_process_rss_bytes gauge")
+        lines.append(f"lingo_process_rss_bytes {current_rss()}")
+        return "\n".join(lines) + "\n"
+
+
+stage_metrics = StageMetrics()
+
+# 需要导出占用和命中率的进程内缓存：名称 -> 提供stats()的对象（见bounded_cache.BoundedLRUCache）
+_caches = {}
+
+
+def register_cache(name: str, cache):
+    """登记一个进程内缓存，其统计随/metrics一起导出"""
+    _caches[name] = cache
+
+
+def render_cache_metrics() -> str:
+    """以Prometheus文本格式导出已登记缓存的条目数、占用和命中/淘汰计数"""
+    stats = {name: cache.stats() for name, cache in sorted(_caches.items())}
+    lines = []
+    for metric, key, help_text, kind in (
+        ("lingo_cache_entries", 'entries', "Entries held by in-process caches.", "gauge"),
+        ("lingo_cache_bytes", 'bytes', "Estimated memory held by in-process caches.", "gauge"),
+        ("lingo_cache_max_bytes", 'max_bytes', "Memory limit of in-process caches.", "gauge"),
+        ("lingo_cache_hits_total", 'hits', "Cache lookups that found an entry.", "counter"),
+        ("lingo_cache_misses_total", 'misses', "Cache lookups that found nothing.", "counter"),
+        ("lingo_cache_evictions_total", 'evictions', "Entries evicted to stay within the limits.", "counter"),
+        ("lingo_cache_expirations_total", 'expirations', "Entries dropped after their time to live.", "counter"),
+    ):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, s in stats.items():
+            lines.append(f'{metric}{{cache="{name}"}} {s[key]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_timeline(task):
+    """将任务的时间线写入任务目录下的pipeline_timeline.json"""
+    if not task.output_dir or not os.path.isdir(task.output_dir):
+        return
+    path = os.path.join(task.output_dir, TIMELINE_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'task_id': task.task_id, 'stages': task.timeline}, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def trace_stage(task, stage: str):
+    """记录一个阶段的耗时、RSS峰值和任务目录写入量，追加到task.timeline并汇总到stage_metrics
+
+    阶段内通过track_process登记了子进程（Lingo推理、Blender导入和渲染）时，peak_rss_bytes为这些子进程RSS之和的峰值，
+    rss_scope为'worker'，Web进程的峰值另记为web_peak_rss_bytes；否则为Web进程的峰值，rss_scope为'web_process'
+    """
+    started = datetime.now().isoformat(timespec='milliseconds')
+    size_before = directory_size(task.output_dir)
+    sampler = _RssSampler()
+    sampler.start()
+    token = _current_sampler.set(sampler)
+    tic = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        _current_sampler.reset(token)
+        web_peak = sampler.stop()
+        record = {
+            'stage': stage,
+            'start': started,
+            'duration_s': round(time.perf_counter() - tic, 6),
+        }
+        if sampler.worker_peak is None:
+            record.update(peak_rss_bytes=web_peak, rss_scope='web_process')
+        else:
+            record.update(peak_rss_bytes=sampler.worker_peak, rss_scope='worker', web_peak_rss_bytes=web_peak)
+        record.update(bytes_written=directory_size(task.output_dir) - size_before, status=status)
+        task.timeline.append(record)
+        stage_metrics.observe(record)
+        try:
+            write_timeline(task)
+        except OSError as e:
+            print(f"写入任务时间线失败: {e}")
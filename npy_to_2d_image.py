@@ -1,6 +1,7 @@
 import numpy as np
-import matplotlib.pyplot as plt
 from PIL import Image
+from voxel_format import open_voxels, DenseVoxelGrid
+from sparse_voxels import SparseVoxelGrid
 # 定义对数映射函数
 
 def log_mapping(x, base=2.71828):  # 默认底数为 e
@@ -9,51 +10,110 @@ def log_mapping(x, base=2.71828):  # 默认底数为 e
     c = max_val / (np.log(max_val + 1) )
     return c * (np.log(x + 1) / np.log(base))
 
-def npy_to_2d_image(npy_file: str, output_image_path: str, projection_type='max',show_img=False):
-    """
-    将npy格式的体素化数据转换为2D图像。
-    
-    参数:
-    npy_file (str): 输入的npy文件路径，包含体素化的数据。
-    output_image_path (str): 输出图像的路径。
-    projection_type (str): 投影方式，'max' 或 'average'。默认为 'max'。
-    返回:
-    None
-    """
-    # 加载npy文件
-    voxel_data = np.load(npy_file)
+PROJECTION_TYPES = ('max', 'average', 'height')
 
-    # 验证数据是否是三维
-    if voxel_data.ndim != 3:
-        raise ValueError(f"输入的npy文件应为三维数组，当前维度为 {voxel_data.ndim}")
 
-    # 根据不同的投影方式生成二维图像
+def _render_view(projection_type, count, top, y_size):
+    """将累加器转换为某种投影方式的uint8二维图像"""
     if projection_type == 'max':
         # 使用最大值投影，布尔类型最大值是True
-        projected_data = np.max(voxel_data, axis=1).astype(np.uint8)
+        return (count > 0).astype(np.uint8)
     elif projection_type == 'average':
         # 使用平均值投影，布尔类型平均值是True的概率
-        projected_data = (255-log_mapping(np.mean(voxel_data, axis=1)*255,base=3)).astype(np.uint8).T
-    else:
-        raise ValueError("投影方式不支持，仅支持 'max' 或 'average'")
+        return (255-log_mapping(count/y_size*255,base=3)).astype(np.uint8).T
+    elif projection_type == 'height':
+        # 顶面高度图：每一列最高的被占据体素的高度，越高越亮，空列为0
+        return ((top.astype(np.int32)+1)*255//y_size).astype(np.uint8).T
+    raise ValueError(f"投影方式不支持，仅支持 {', '.join(PROJECTION_TYPES)}")
+
+
+def project_voxels(voxels, projection_types=('max',), chunk: int = 16) -> dict:
+    """
+    沿y轴（竖直方向）分块流式投影体素数据。体素文件以内存映射方式打开，每次只解包chunk个x切片，
+    并用整数累加器统计每一列的占据数量和最高占据高度，因此峰值内存与网格大小基本无关。
+    一次遍历即可同时得到多种投影结果。稀疏体素（.svox）直接由各列的区段计算，不展开网格。
+
+    参数:
+    voxels: 体素文件路径（.npy、.pvox或.svox），或voxel_format.open_voxels返回的对象，或三维np数组。
+    projection_types (tuple): 需要生成的投影方式，可选 'max'、'average'、'height'。
+    chunk (int): 每次处理的x切片数。
+    返回:
+    dict: 投影方式 -> uint8二维数组
+    """
+    for projection_type in projection_types:
+        if projection_type not in PROJECTION_TYPES:
+            raise ValueError(f"投影方式不支持，仅支持 {', '.join(PROJECTION_TYPES)}")
+    if isinstance(voxels, str):
+        voxels = open_voxels(voxels)
+    elif isinstance(voxels, np.ndarray):
+        voxels = DenseVoxelGrid(voxels)
+
+    # 验证数据是否是三维
+    if voxels.ndim != 3:
+        raise ValueError(f"输入的体素数据应为三维数组，当前维度为 {voxels.ndim}")
 
+    X, Y, Z = voxels.shape
+    if isinstance(voxels, SparseVoxelGrid):
+        count = voxels.column_counts()
+        top = voxels.column_top() if 'height' in projection_types else None
+        return {projection_type: _render_view(projection_type, count, top, Y) for projection_type in projection_types}
 
+    count = np.zeros((X, Z), dtype=np.uint16 if Y < 2**16 else np.uint32)
+    top = np.full((X, Z), -1, dtype=np.int16 if Y < 2**15 else np.int32)
+    need_top = 'height' in projection_types
+    for x0, slab in voxels.iter_slabs(chunk):
+        x1 = x0 + slab.shape[0]
+        np.sum(slab, axis=1, dtype=count.dtype, out=count[x0:x1])
+        if need_top:
+            # 从上往下找第一个被占据的体素
+            first_from_top = np.argmax(slab[:, ::-1, :], axis=1)
+            top[x0:x1] = np.where(count[x0:x1] > 0, Y - 1 - first_from_top, -1)
+    return {projection_type: _render_view(projection_type, count, top, Y) for projection_type in projection_types}
 
-    # #将数据归一化为 [0, 255] 范围，便于生成图像 (bool类型无需数值归一化)
-    # projected_data = (projected_data - np.min(projected_data)) / (np.max(projected_data) - np.min(projected_data)) * 255
-    # projected_data = projected_data.astype(np.uint8)
 
+def _save_projection(projected_data, output_image_path, show_img=False):
     rgb_image = np.stack((projected_data,) * 3, axis=-1)
     # 使用PIL保存为图像
     image = Image.fromarray(rgb_image)
     image.save(output_image_path)
     print(f"转换完成，图像保存至 {output_image_path}")
     if show_img:
-    # 显示图像
+    # 显示图像（matplotlib只在需要显示时导入）
+        import matplotlib.pyplot as plt
         plt.imshow(rgb_image, cmap='gray')
         plt.axis('off')  # 不显示坐标轴
         plt.show()
 
+
+def npy_to_2d_image(npy_file: str, output_image_path: str, projection_type='max',show_img=False):
+    """
+    将npy格式的体素化数据转换为2D图像。
+    
+    参数:
+    npy_file (str): 输入的体素文件路径（.npy、位压缩的.pvox或稀疏的.svox），包含体素化的数据。
+    output_image_path (str): 输出图像的路径。
+    projection_type (str): 投影方式，'max'、'average' 或 'height'（顶面高度图）。默认为 'max'。
+    返回:
+    None
+    """
+    projected_data = project_voxels(npy_file, (projection_type,))[projection_type]
+    _save_projection(projected_data, output_image_path, show_img)
+
+
+def npy_to_2d_images(npy_file: str, output_image_paths: dict):
+    """
+    一次遍历体素数据，同时生成多种投影图像。
+
+    参数:
+    npy_file (str): 输入的体素文件路径（.npy、.pvox或.svox）。
+    output_image_paths (dict): 投影方式 -> 输出图像路径，例如 {'average': 'a.png', 'height': 'h.png'}。
+    返回:
+    None
+    """
+    projections = project_voxels(npy_file, tuple(output_image_paths))
+    for projection_type, output_image_path in output_image_paths.items():
+        _save_projection(projections[projection_type], output_image_path)
+
 if __name__=="__main__":
     # 路径
     npy_file = './cache/livingroom_voxelized.npy'  # 文件路径（需更改）
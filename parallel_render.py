@@ -0,0 +1,105 @@
+###
+#  分块并行渲染：把动画帧范围切成若干段，由多个video_renderer.py子进程（平分CPU线程）同时渲染，
+#  最后用ffmpeg的concat demuxer以流复制（-c copy）的方式无损拼接为一个mp4
+###
+import contextvars
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from metrics import track_process
+
+RENDERER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "video_renderer.py")
+
+
+def detect_frame_range(blend_file_path: str):
+    """在子进程中打开.blend文件，返回自动检测到的动画帧范围 (起始帧, 结束帧)"""
+    completed = subprocess.run([sys.executable, RENDERER_SCRIPT, blend_file_path, "--detect-range"],
+                               capture_output=True, text=True, check=True)
+    match = re.search(r"FRAME_RANGE (-?\d+) (-?\d+)", completed.stdout)
+    if match is None:
+        raise RuntimeError(f"无法检测动画帧范围:\n{completed.stdout}\n{completed.stderr}")
+    return int(match.group(1)), int(match.group(2))
+
+
+def split_frame_range(frame_start: int, frame_end: int, chunks: int):
+    """将闭区间 [frame_start, frame_end] 尽量均匀地切成不超过chunks段"""
+    total = frame_end - frame_start + 1
+    chunks = max(1, min(chunks, total))
+    bounds = [frame_start + total * i // chunks for i in range(chunks + 1)]
+    return [(bounds[i], bounds[i + 1] - 1) for i in range(chunks)]
+
+
+def concat_videos(parts, output: str):
+    """用ffmpeg concat demuxer无损拼接编码参数相同的视频片段"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("未找到ffmpeg，无法拼接分块渲染结果")
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+        for part in parts:
+            f.write("file '%s'\n" % os.path.abspath(part).replace("'", r"'\''"))
+        list_path = f.name
+    try:
+        subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                        "-i", list_path, "-c", "copy", output], check=True)
+    finally:
+        os.remove(list_path)
+
+
+def render_video_parallel(blend_file_path: str, output: str, processes: int = None, device: str = "NONE",
+                          profile: str = "standard", on_progress=None):
+    """分块并行渲染示例视频，结果与video_renderer.render_example_video相同
+
+    参数:
+        blend_file_path (str): .blend文件的路径
+        output (str): 输出视频路径（.mp4）
+        processes (int, optional): 并行的渲染进程数，默认为CPU核心数的一半（至少为1）
+        device (str, optional): 渲染设备，含义同render_example_video；CPU渲染机上使用"NONE". Defaults to "NONE".
+        profile (str, optional): 渲染档位，见render_profiles；各进程的线程数由本函数平分CPU核心. Defaults to "standard".
+        on_progress (callable, optional): 每完成一个分块调用一次，参数为 (已完成分块数, 分块总数)
+    """
+    cpu_count = os.cpu_count() or 1
+    processes = processes or max(1, cpu_count // 2)
+    frame_start, frame_end = detect_frame_range(blend_file_path)
+    ranges = split_frame_range(frame_start, frame_end, processes)
+    threads = max(1, cpu_count // len(ranges))
+    if shutil.which("ffmpeg") is None or len(ranges) == 1:
+        # 无法拼接或只有一段时退化为单进程渲染
+        ranges, threads = [(frame_start, frame_end)], None
+
+    chunk_dir = tempfile.mkdtemp(prefix=".render_chunks_", dir=os.path.dirname(os.path.abspath(output)))
+    parts = [os.path.join(chunk_dir, f"chunk_{i:03d}.mp4") for i in range(len(ranges))]
+
+    def render_chunk(i):
+        start, end = ranges[i]
+        args = [sys.executable, RENDERER_SCRIPT, blend_file_path, parts[i], f"-d{device}", f"--frames={start}-{end}",
+                f"--profile={profile}"]
+        if threads:
+            args.append(f"--threads={threads}")
+        process = subprocess.Popen(args, stdout=subprocess.DEVNULL)
+        # 各分块进程的内存之和计入渲染阶段
+        track_process(lambda: process.pid if process.returncode is None else None)
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, args)
+        return i
+
+    try:
+        print(f"分块渲染: {len(ranges)} 个进程，每个 {threads or '自动'} 线程，帧范围 {ranges}")
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            # 在调用者的上下文中运行，分块进程才能登记到当前阶段的内存采样
+            futures = [executor.submit(contextvars.copy_context().run, render_chunk, i) for i in range(len(ranges))]
+            for done, future in enumerate(as_completed(futures), 1):
+                future.result()
+                if on_progress is not None:
+                    on_progress(done, len(ranges))
+        if len(parts) == 1:
+            shutil.move(parts[0], output)
+        else:
+            concat_videos(parts, output)
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+    return output
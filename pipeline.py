@@ -0,0 +1,119 @@
+###
+#  提交任务后在后台依次执行的各个阶段，由scheduler.TaskScheduler调度
+###
+import os
+import time
+
+from classes import Task
+from asset_store import make_private
+from interfaces import prep_lingo_job, asset_store
+from utils import zip_folder_files
+from lingo_worker import LingoWorkerClient
+from blender_server import BlenderPool
+from parallel_render import render_video_parallel
+from trajectory_preview import find_lingo_output, load_lingo_motion, render_trajectory_preview
+
+# 大于1时，渲染阶段把帧范围切块，由多个Blender进程并行渲染后无损拼接（适用于只有CPU的渲染机）；
+# 否则在常驻bpy工作进程中单进程渲染
+PARALLEL_RENDER_PROCESSES = 1
+RENDER_DEVICE = "CUDA"  # 只有CPU的渲染机上使用"NONE"
+# 渲染档位（draft/standard/final），见render_profiles；CPU渲染机上可先运行benchmarks/bench_render_profiles.py校准
+RENDER_PROFILE = "standard"
+BLEND_TEMPLATE = "./assets/vis.blend"  # 任务目录中vis.blend的空白模板
+
+_lingo_client = None
+_blender_pool = None
+
+
+def get_lingo_client() -> LingoWorkerClient:
+    """常驻Lingo推理进程的客户端，第一次使用时才启动推理进程"""
+    global _lingo_client
+    if _lingo_client is None:
+        _lingo_client = LingoWorkerClient()
+    return _lingo_client
+
+
+def get_blender_pool() -> BlenderPool:
+    """常驻bpy工作进程池，第一次使用时才启动"""
+    global _blender_pool
+    if _blender_pool is None:
+        _blender_pool = BlenderPool()
+    return _blender_pool
+
+
+def render_settings() -> dict:
+    """决定渲染视频内容的设置，计入result_memo.result_key"""
+    return {'profile': RENDER_PROFILE, 'device': RENDER_DEVICE}
+
+
+def stage_prepare(task: Task):
+    """将动作规划表打包为pkl，并导出Lingo模型所需的场景体素文件"""
+    prep_lingo_job(task)
+
+
+def stage_lingo(task: Task):
+    """在常驻推理进程中运行Lingo模型，输入与输出都在任务目录下。
+    只把本阶段开始后写入的文件记为输出，Lingo没有写出结果时不会误用之前提交留下的文件"""
+    task.motion_path = None
+    started = time.time() - 2  # 部分文件系统的修改时间只精确到秒
+    get_lingo_client().run(task.output_dir, task.output_dir, task.task_id)
+    task.motion_path = find_lingo_output(task.output_dir, task.task_id, exclude=[task.npy_path], since=started)
+    if task.motion_path is None:
+        raise FileNotFoundError(f"Lingo没有在 {task.output_dir} 中写出结果")
+
+
+def stage_preview(task: Task):
+    """把Lingo输出的人物轨迹画在场景投影图上，生成几秒即可完成的预览视频"""
+    if task.motion_path is None or not os.path.exists(task.motion_path):
+        raise FileNotFoundError(f"任务 {task.task_id} 没有本次Lingo推理的输出，请重新提交")
+    motion = load_lingo_motion(task.motion_path)
+    task.preview_path = render_trajectory_preview(motion, task.image_path, task.pixel_to_scene_ratio,
+                                                  f"{task.output_dir}/trajectory_preview.mp4")
+
+
+def stage_import(task: Task):
+    """在bpy工作进程中向任务目录下的vis.blend导入场景文件"""
+    # 导入会原地保存vis.blend，修改路线后再次渲染时先换回空白模板，否则场景几何体会被重复导入；
+    # 放回的模板与资源存储共享数据，导入前先换成独立副本
+    asset_store.place(BLEND_TEMPLATE, task.blend_path)
+    make_private(task.blend_path)
+    get_blender_pool().import_obj(task.blend_path, task.obj_path)
+
+
+def stage_render(task: Task):
+    """将动画渲染并输出为视频，并更新任务进度"""
+    task.video_path = f"{task.output_dir}/processed_videos.mp4"
+    if PARALLEL_RENDER_PROCESSES > 1:
+        def on_chunk_done(done, total):
+            task.progress = f"分块 {done}/{total}"
+
+        render_video_parallel(task.blend_path, task.video_path, processes=PARALLEL_RENDER_PROCESSES,
+                              device=RENDER_DEVICE, profile=RENDER_PROFILE, on_progress=on_chunk_done)
+        return
+
+    def on_progress(message):
+        task.progress = f"帧 {message['frame']}/{message['frame_end']}"
+
+    get_blender_pool().render(task.blend_path, task.video_path, device=RENDER_DEVICE, profile=RENDER_PROFILE,
+                              on_progress=on_progress)
+
+
+def stage_zip(task: Task):
+    """将任务目录打包为zip供下载"""
+    task.result_path = zip_folder_files(task.output_dir)
+
+
+# 提交任务后默认执行的阶段：推理并生成轨迹预览
+TASK_STAGES = [
+    ('prepare', stage_prepare),
+    ('lingo', stage_lingo),
+    ('preview', stage_preview),
+    ('zip', stage_zip),
+]
+
+# 用户确认轨迹后按需执行的Cycles高清渲染
+RENDER_STAGES = [
+    ('import', stage_import),
+    ('render', stage_render),
+    ('zip', stage_zip),
+]
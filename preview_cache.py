@@ -0,0 +1,120 @@
+###
+#  预览画布缓存：按任务缓存解码后的场景投影图、字体和场景/像素坐标换算，
+#  以及每画完一行动作后的图层快照。再次预览时只重画发生变化的那一行及其之后的行
+###
+import threading
+
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw, ImageFont
+
+from bounded_cache import BoundedLRUCache
+
+COORDINATE_COLUMNS = ["起点x1", "起点y1", "终点x2", "终点y2"]
+
+_font = None
+
+
+def get_font():
+    """加载一次标注用字体，找不到arial.ttf时使用默认字体"""
+    global _font
+    if _font is None:
+        try:
+            _font = ImageFont.truetype("arial.ttf", 15)
+        except IOError:
+            _font = ImageFont.load_default()
+    return _font
+
+
+def scale_route_table(table: pd.DataFrame, ratio: float) -> np.ndarray:
+    """把动作规划表的坐标列一次性转换为像素偏移（int），无法转换的值按0处理"""
+    coords = table[COORDINATE_COLUMNS].apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(dtype=float)
+    return (coords * ratio).astype(int)
+
+
+class PreviewCanvas:
+    """单个任务的预览画布
+
+    参数:
+        image_path (str): 场景投影图路径
+        ratio (float): 像素坐标与场景坐标之比
+        colors (list): 每一行动作使用的颜色
+    """
+
+    def __init__(self, image_path: str, ratio: float, colors):
+        self.image_path = image_path
+        self.ratio = ratio
+        self.colors = colors
+        base = Image.open(image_path)
+        base.load()
+        self.width, self.height = base.size
+        self.r = min(self.width, self.height) / 100  # 计算圆的半径
+        # 获取图像的中心点坐标
+        self.center_x = self.width / 2
+        self.center_y = self.height / 2
+        self.rows = []  # 已绘制的行：(x1, y1, x2, y2)像素偏移
+        self.layers = [base]  # layers[i] 为绘制完前i行后的图像
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(layer.getbands()) * layer.width * layer.height for layer in self.layers)
+
+    def _draw_point(self, draw, idx, x, y, radius):
+        # 将表格中的中心坐标转换为相对于图像左上角的坐标
+        px = self.center_x + x
+        py = self.center_y - y
+        draw.ellipse([px - radius, py - radius, px + radius, py + radius], fill=self.colors[idx], outline="black")
+        # 在点上标注数字，如果文本位置超出了图像的范围，做一些调整
+        text_x = max(0, min(px + self.r, self.width - 20))
+        text_y = max(0, min(py - (2 * self.r), self.height - 20))
+        draw.text((text_x, text_y), str(idx + 1), fill="black", font=get_font())  # idx+1表示从1开始
+
+    def _draw_row(self, image, idx, row):
+        draw = ImageDraw.Draw(image)
+        try:
+            x1, y1, x2, y2 = row
+            self._draw_point(draw, idx, x1, y1, self.r)  # 起点
+            self._draw_point(draw, idx, x2, y2, 2 * self.r)  # 终点
+        except Exception as e:
+            print(f"Error drawing row {idx}: {e}")
+
+    def render(self, scaled_rows) -> Image.Image:
+        """根据像素偏移后的动作规划绘制预览，返回的图像不应被调用者修改"""
+        rows = [tuple(row) for row in scaled_rows]
+        # 找到第一处与已绘制内容不同的行，之前的图层可以直接复用
+        keep = 0
+        while keep < min(len(rows), len(self.rows)) and rows[keep] == self.rows[keep]:
+            keep += 1
+        del self.layers[keep + 1:]
+        for idx in range(keep, len(rows)):
+            layer = self.layers[-1].copy()
+            self._draw_row(layer, idx, rows[idx])
+            self.layers.append(layer)
+        self.rows = rows
+        return self.layers[-1]
+
+
+class PreviewCanvasCache:
+    """按任务ID缓存预览画布，总占用超出max_bytes时淘汰最久未使用的任务
+
+    参数:
+        colors (list): 每一行动作使用的颜色
+        max_bytes (int, optional): 所有画布图层占用之和的上限. Defaults to 256MB.
+        max_entries (int, optional): 最多缓存的任务数. Defaults to 256.
+        ttl (float, optional): 画布自最后一次预览起保留的秒数，会话结束后的画布由此释放. Defaults to 1小时.
+    """
+
+    def __init__(self, colors, max_bytes: int = 256 * 1024 ** 2, max_entries: int = 256, ttl: float = 3600):
+        self.colors = colors
+        self.cache = BoundedLRUCache(max_bytes, max_entries, sizeof=lambda canvas: canvas.nbytes, ttl=ttl)
+
+    def render(self, task_id: str, image_path: str, ratio: float, table: pd.DataFrame) -> Image.Image:
+        canvas = self.cache.get(task_id)
+        if canvas is None or canvas.image_path != image_path or canvas.ratio != ratio:
+            canvas = PreviewCanvas(image_path, ratio, self.colors)
+            self.cache.put(task_id, canvas)
+        with canvas.lock:
+            image = canvas.render(scale_route_table(table, ratio))
+        self.cache.resize(task_id)
+        return image
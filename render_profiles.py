@@ -0,0 +1,89 @@
+###
+#  Cycles渲染档位：draft（草稿）、standard（默认，与原先的固定设置相同）、final（成片）。
+#  每个档位规定采样数、自适应采样阈值、分辨率、持久化数据、线程数和分块大小；
+#  CPU渲染机上可以先运行benchmarks/bench_render_profiles.py，把按本机核心数测得的最快线程数/分块大小
+#  和每帧耗时写入校准文件，渲染时自动使用，调度时可据此估计渲染时间。本模块不依赖bpy
+###
+import json
+import os
+
+DEFAULT_PROFILE = "standard"
+DEFAULT_CALIBRATION_PATH = "./cache/render_calibration.json"
+
+RENDER_PROFILES = {
+    'draft': {
+        'samples': 16,
+        'adaptive_threshold': 0.1,  # 噪声低于阈值的像素提前停止采样，越大越快
+        'adaptive_min_samples': 4,
+        'resolution': (640, 480),
+        'resolution_percentage': 50,
+        'use_persistent_data': True,  # 帧之间保留场景数据和BVH，动画渲染不必每帧重建
+        'threads': None,  # None为按核心数自动决定
+        'tile_size': 64,
+        'denoise': True,
+    },
+    'standard': {
+        'samples': 32,
+        'adaptive_threshold': 0.05,
+        'adaptive_min_samples': 8,
+        'resolution': (640, 480),
+        'resolution_percentage': 80,
+        'use_persistent_data': True,
+        'threads': None,
+        'tile_size': 64,
+        'denoise': True,
+    },
+    'final': {
+        'samples': 128,
+        'adaptive_threshold': 0.01,
+        'adaptive_min_samples': 32,
+        'resolution': (1280, 720),
+        'resolution_percentage': 100,
+        'use_persistent_data': True,
+        'threads': None,
+        'tile_size': 128,
+        'denoise': True,
+    },
+}
+
+# 校准时可以覆盖的设置
+CALIBRATED_KEYS = ('threads', 'tile_size')
+
+
+def load_calibration(path: str = DEFAULT_CALIBRATION_PATH):
+    """读取校准结果；文件不存在、无法解析或是在核心数不同的机器上测得时返回None"""
+    try:
+        with open(path, 'r') as f:
+            calibration = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if calibration.get('cpu_count') != os.cpu_count():
+        print(f"渲染校准文件 {path} 是在 {calibration.get('cpu_count')} 核的机器上测得的，本机为 {os.cpu_count()} 核，不使用")
+        return None
+    return calibration
+
+
+def get_profile(name: str = DEFAULT_PROFILE, device: str = "CPU", calibration_path: str = DEFAULT_CALIBRATION_PATH) -> dict:
+    """返回档位的设置（副本）。CPU渲染时用校准文件中的线程数和分块大小覆盖默认值
+
+    参数:
+        name (str, optional): 档位名称. Defaults to "standard".
+        device (str, optional): 实际使用的设备，'CPU'或'GPU'. Defaults to "CPU".
+        calibration_path (str, optional): 校准文件. Defaults to "./cache/render_calibration.json".
+    """
+    if name not in RENDER_PROFILES:
+        raise ValueError(f"未知的渲染档位: {name}，可选 {', '.join(RENDER_PROFILES)}")
+    profile = dict(RENDER_PROFILES[name])
+    profile['name'] = name
+    if device == "CPU":
+        calibration = load_calibration(calibration_path)
+        calibrated = (calibration or {}).get('profiles', {}).get(name, {})
+        profile.update({key: calibrated[key] for key in CALIBRATED_KEYS if key in calibrated})
+    return profile
+
+
+def estimate_render_seconds(name: str, frames: int, calibration_path: str = DEFAULT_CALIBRATION_PATH):
+    """按校准测得的每帧耗时估计CPU渲染frames帧所需的秒数，没有校准结果时返回None"""
+    calibration = load_calibration(calibration_path)
+    seconds_per_frame = (calibration or {}).get('profiles', {}).get(name, {}).get('seconds_per_frame')
+    return None if seconds_per_frame is None else seconds_per_frame * frames
@@ -0,0 +1,94 @@
+###
+#  结果复用：以场景内容哈希和规范化的动作规划为键，相同的提交（刷新页面后重新提交、预览后连续点击提交等）
+#  直接复用已完成任务的预览、视频等文件，不再重新执行Lingo推理、导入、渲染和打包。
+#  正在排队或执行中的相同提交由scheduler.TaskScheduler合并，见其submit
+###
+import hashlib
+import json
+import os
+from os.path import join as path_join, exists as path_exists
+
+from asset_store import link_or_copy
+from metrics import TIMELINE_NAME
+from result_packaging import MANIFEST_NAME, archive_path_for
+from utils import canonical_route
+from voxel_cache import hash_file
+
+RESULT_KEY_VERSION = 1
+
+
+def result_key(task, render_settings: dict = None) -> str:
+    """场景文件、体素文件的内容哈希与规范化的动作规划（见utils.canonical_route）共同决定的键
+
+    参数:
+        render_settings (dict, optional): 包含渲染阶段时传入决定视频内容的设置（见pipeline.render_settings），
+            档位或设备不同的渲染结果不会互相复用. Defaults to None.
+    """
+    payload = {
+        'version': RESULT_KEY_VERSION,
+        'scene': hash_file(task.obj_path),
+        'voxels': hash_file(task.npy_path),
+        'route': canonical_route(task.data),
+    }
+    if render_settings is not None:
+        payload['render'] = render_settings
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def result_field(stage_names) -> str:
+    """一次提交产出的结果字段：包含渲染阶段时为视频，否则为轨迹预览"""
+    return 'video_path' if 'render' in stage_names else 'preview_path'
+
+
+class ResultMemo:
+    """按result_key在任务存储中查找已完成的任务，并把其结果放到新任务的目录中
+
+    参数:
+        store (TaskStore): 任务存储
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def lookup(self, task, stage_names):
+        """返回可以复用的已完成任务（结果文件仍然存在），没有时返回None"""
+        field = result_field(stage_names)
+        for task_id in self.store.find_completed(task.result_key, field):
+            source = self.store.load_task(task_id)
+            if source is not None and source.output_dir and path_exists(getattr(source, field)):
+                return source
+        return None
+
+    def _translate(self, path: str, source, task) -> str:
+        """source目录下的路径 -> task目录下对应的路径，文件名中的任务ID替换为新任务的ID"""
+        rel = os.path.relpath(path, source.output_dir).replace(source.task_id, task.task_id)
+        return path_join(task.output_dir, rel)
+
+    def adopt(self, task, source, stage_names):
+        """将source目录中的结果文件以reflink或复制放到task目录（覆盖task之前提交留下的同名文件，
+        task自己的场景、模板、体素和投影图除外），设置本次提交的结果路径并将task标记为完成。
+        之后的提交会原地重写这些文件（输入pkl、Lingo输出、预览和视频），不能使用硬链接，否则会改动source的结果。
+        压缩包不复制，下载时按task目录重新生成"""
+        if source.task_id != task.task_id:
+            skipped = {os.path.basename(archive_path_for(source.output_dir)), MANIFEST_NAME, TIMELINE_NAME}
+            own = {os.path.abspath(p) for p in (task.obj_path, task.blend_path, task.npy_path, task.image_path) if p}
+            for root, _, files in os.walk(source.output_dir):
+                for name in files:
+                    if root == source.output_dir and (name in skipped or name.startswith('.')):
+                        continue
+                    src = path_join(root, name)
+                    dst = self._translate(src, source, task)
+                    if os.path.abspath(dst) in own:
+                        continue
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    link_or_copy(src, dst, allow_hardlink=False)
+        field = result_field(stage_names)
+        setattr(task, field, self._translate(getattr(source, field), source, task))
+        if getattr(source, 'motion_path', None):
+            task.motion_path = self._translate(source.motion_path, source, task)
+        task.result_path = None
+        task.stages = list(stage_names)
+        task.stage = None
+        task.error = None
+        task.update_status('completed')
+        print(f"task {task.task_id}: 复用任务 {source.task_id} 的结果")
@@ -0,0 +1,181 @@
+###
+#  结果打包：已经压缩过的格式（mp4/png等）直接存储不再压缩，其余文件在线程池中并行deflate；
+#  打包过程以字节块的形式产出，可以边打包边写入下载响应。目录未变化时直接复用已有的压缩包
+###
+import json
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import TIMELINE_NAME
+
+# 已经是压缩格式的文件，再次deflate几乎没有收益
+STORED_SUFFIXES = {'.mp4', '.mkv', '.webm', '.mov', '.png', '.jpg', '.jpeg', '.gif', '.zip', '.gz', '.bz2', '.xz', '.7z'}
+MANIFEST_NAME = ".result_manifest.json"
+CHUNK_SIZE = 1 << 20
+_ZIP64_LIMIT = 0xFFFFFFFF
+
+
+def archive_path_for(folder_path: str) -> str:
+    """任务目录对应的压缩包路径：<目录>/<目录名>.zip"""
+    folder_name = os.path.basename(os.path.normpath(folder_path))
+    return os.path.join(folder_path, f'{folder_name}.zip')
+
+
+def list_result_files(folder_path: str):
+    """返回需要打包的文件名（只包含目录下的文件，不包含压缩包自身、清单、时间线和临时文件），按名称排序"""
+    archive_name = os.path.basename(archive_path_for(folder_path))
+    names = []
+    for filename in sorted(os.listdir(folder_path)):
+        # 时间线在每个阶段（包括打包本身）结束后都会更新，不计入压缩包
+        if filename in (archive_name, TIMELINE_NAME) or filename.startswith('.'):
+            continue
+        if os.path.isfile(os.path.join(folder_path, filename)):
+            names.append(filename)
+    return names
+
+
+def _snapshot(folder_path: str, names) -> dict:
+    snapshot = {}
+    for name in names:
+        st = os.stat(os.path.join(folder_path, name))
+        snapshot[name] = [st.st_size, st.st_mtime_ns]
+    return snapshot
+
+
+def _dos_datetime(mtime: float):
+    t = time.localtime(max(mtime, 315532800))  # zip格式最早只能表示1980年
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def _prepare_entry(path: str, name: str):
+    """在工作线程中计算crc32，需要压缩的文件同时完成deflate（zlib压缩时会释放GIL）"""
+    stored = os.path.splitext(name)[1].lower() in STORED_SUFFIXES
+    crc, size = 0, 0
+    compressed = None if stored else []
+    compressor = None if stored else zlib.compressobj(6, zlib.DEFLATED, -15)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            if compressor is not None:
+                compressed.append(compressor.compress(chunk))
+    if compressor is not None:
+        compressed.append(compressor.flush())
+        compressed = b''.join(compressed)
+    return {
+        'name': name, 'path': path, 'crc': crc, 'size': size,
+        'method': 0 if stored else 8,
+        'compressed': compressed,
+        'compressed_size': size if stored else len(compressed),
+        'mtime': os.path.getmtime(path),
+    }
+
+
+def iter_result_zip(folder_path: str, names=None, workers: int = None):
+    """生成器：按顺序产出zip文件的字节块。各文件的压缩在线程池中并行进行，
+    前面的文件一旦准备好就可以开始输出，不必等待整个压缩包完成
+
+    参数:
+        folder_path (str): 需要打包的目录
+        names (list, optional): 需要打包的文件名，默认为list_result_files的结果
+        workers (int, optional): 并行压缩的线程数，默认为CPU核心数
+    """
+    names = list_result_files(folder_path) if names is None else names
+    workers = workers or os.cpu_count() or 1
+    central = []
+    offset = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        queued = iter(names)
+
+        def fill():
+            # 只提前准备有限数量的文件，避免压缩结果全部堆积在内存中
+            while len(pending) < workers * 2:
+                name = next(queued, None)
+                if name is None:
+                    return
+                pending.append(executor.submit(_prepare_entry, os.path.join(folder_path, name), name))
+
+        fill()
+        while pending:
+            entry = pending.popleft().result()
+            fill()
+            if entry['compressed_size'] >= _ZIP64_LIMIT or offset >= _ZIP64_LIMIT:
+                raise ValueError(f"{entry['name']} 过大，当前打包格式不支持超过4GB的文件")
+            name = entry['name'].encode('utf-8')
+            dos_time, dos_date = _dos_datetime(entry['mtime'])
+            # 通用标志位0x800：文件名使用UTF-8编码
+            fields = (20, 0x800, entry['method'], dos_time, dos_date, entry['crc'],
+                      entry['compressed_size'], entry['size'])
+            header = struct.pack('<IHHHHHIIIHH', 0x04034b50, *fields, len(name), 0) + name
+            central.append(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, 20, *fields, len(name), 0, 0, 0, 0, 0,
+                                       offset) + name)
+            yield header
+            offset += len(header)
+            if entry['compressed'] is not None:
+                yield entry['compressed']
+            else:
+                with open(entry['path'], 'rb') as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                        yield chunk
+            offset += entry['compressed_size']
+    central_dir = b''.join(central)
+    yield central_dir
+    count = len(central)
+    if offset >= _ZIP64_LIMIT or len(central_dir) >= _ZIP64_LIMIT or count >= 0xFFFF:
+        # 中央目录的位置、大小或条目数超出普通结束记录的范围时，写入ZIP64结束记录及其定位符，
+        # 普通结束记录中对应字段填最大值
+        zip64_end = offset + len(central_dir)
+        yield struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, count, count, len(central_dir), offset)
+        yield struct.pack('<IIQI', 0x07064b50, 0, zip64_end, 1)
+        count = min(count, 0xFFFF)
+        yield struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, count, count, min(len(central_dir), _ZIP64_LIMIT),
+                          min(offset, _ZIP64_LIMIT), 0)
+        return
+    yield struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, count, count, len(central_dir), offset, 0)
+
+
+def is_archive_current(folder_path: str) -> bool:
+    """压缩包存在且目录内容与上次打包时的清单一致"""
+    archive = archive_path_for(folder_path)
+    manifest_path = os.path.join(folder_path, MANIFEST_NAME)
+    if not (os.path.exists(archive) and os.path.exists(manifest_path)):
+        return False
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return manifest.get('files') == _snapshot(folder_path, list_result_files(folder_path))
+
+
+def package_result(folder_path: str, workers: int = None) -> str:
+    """将任务目录打包为 <目录>/<目录名>.zip，目录自上次打包后没有变化时直接返回已有的压缩包
+
+    参数:
+        folder_path (str): 需要打包的目录
+        workers (int, optional): 并行压缩的线程数
+    返回:
+        str: 压缩包路径
+    """
+    archive = archive_path_for(folder_path)
+    if is_archive_current(folder_path):
+        print(f"{folder_path} 未发生变化，复用已有压缩包 {archive}")
+        return archive
+    names = list_result_files(folder_path)
+    snapshot = _snapshot(folder_path, names)
+    tmp_path = os.path.join(folder_path, f".{os.path.basename(archive)}.tmp")
+    with open(tmp_path, 'wb') as f:
+        for chunk in iter_result_zip(folder_path, names, workers):
+            f.write(chunk)
+    os.replace(tmp_path, archive)
+    with open(os.path.join(folder_path, MANIFEST_NAME), 'w') as f:
+        json.dump({'archive': os.path.basename(archive), 'files': snapshot}, f)
+    print(f"已将 {folder_path} 下的所有文件打包为 {archive}")
+    return archive
@@ -0,0 +1,247 @@
+###
+#  轨迹可行性检查：由体素网格计算场景的可行走区域（在场景范围内、且人物身高范围内没有障碍的列），
+#  并用距离变换预先算好每个像素到最近障碍的距离和最近的可行走像素。提交任务前逐个检查动作的起点、终点和线段，
+#  不可行的任务在进入队列之前就被拒绝，不再占用Lingo和Blender工作进程。
+#  只有移动类动作（walk、run）要求整条线段可行走；拿起、放下、躺下等交互动作的终点就在桌面或床上，
+#  只要求在场景范围内、且在REACH距离内有可以站立的位置。
+#  坐标换算：像素 = 图像中心 + 场景坐标 * 体素缩放因子（Task.voxel_scale，体素化时每单位场景长度对应的体素数），y轴向上。
+#  网格高度不足时缩放因子小于pixel_to_scene_ratio（后者只考虑水平尺寸），高度带、安全距离和坐标都按缩放因子换算
+###
+import numpy as np
+import pandas as pd
+
+from bounded_cache import BoundedLRUCache
+from voxel_format import open_voxels
+from sparse_voxels import SparseVoxelGrid
+from preview_cache import COORDINATE_COLUMNS
+
+ROUTE_MAP_VERSION = 2
+ACTION_COLUMN = "动作"
+OBSTACLE_BAND = (0.2, 1.8)  # 离地高度在此范围（场景单位）内的体素视为人物无法穿过的障碍
+CLEARANCE = 0.2  # 可行走位置与障碍、场景边缘的最小距离（场景单位），约为人物的半身宽
+LOCOMOTION_ACTIONS = ('walk', 'run')  # 需要检查路线可行走的动作，其余视为与物体交互的动作
+REACH = 1.0  # 交互动作的目标与最近的可站立位置之间的最大距离（场景单位）
+
+
+def _layer_areas(voxels) -> np.ndarray:
+    """每一层y上被占据的列数"""
+    Y = voxels.shape[1]
+    if isinstance(voxels, SparseVoxelGrid):
+        # 同一列的区段互不重叠，对区段起止做差分即可
+        delta = np.zeros(Y + 1, dtype=np.int64)
+        np.add.at(delta, voxels.starts.astype(np.int64), 1)
+        np.add.at(delta, voxels.starts.astype(np.int64) + voxels.lengths, -1)
+        return np.cumsum(delta[:Y])
+    areas = np.zeros(Y, dtype=np.int64)
+    for _, slab in voxels.iter_slabs(32):
+        areas += slab.sum(axis=(0, 2))
+    return areas
+
+
+def _vertical_extent(voxels, footprint_area: int):
+    """(地面高度, 最高的被占据层)。地面为最低的、被占据面积不小于场景范围一半的层；
+    没有这样的层（场景不含地板）时取最低的被占据层"""
+    areas = _layer_areas(voxels)
+    occupied = np.flatnonzero(areas)
+    if not len(occupied):
+        return 0, 0
+    floors = np.flatnonzero(areas * 2 >= max(footprint_area, 1))
+    return int(floors[0] if len(floors) else occupied[0]), int(occupied[-1])
+
+
+def _column_counts(voxels, y0: int, y1: int) -> np.ndarray:
+    """每一列在 [y0, y1) 高度范围内被占据的体素数，形状为 (X, Z)"""
+    if isinstance(voxels, SparseVoxelGrid):
+        return voxels.column_counts(y0, y1)
+    X, _, Z = voxels.shape
+    counts = np.zeros((X, Z), dtype=np.int64)
+    for x0, slab in voxels.iter_slabs(32):
+        counts[x0:x0 + slab.shape[0]] = slab[:, y0:y1, :].sum(axis=1)
+    return counts
+
+
+class RouteMap:
+    """单个场景的可行走区域，按投影图的像素（行为体素z，列为体素x）存储
+
+    参数:
+        walkable (np.ndarray): bool (H, W)，与障碍和场景边缘的距离不小于CLEARANCE的像素
+        clearance (np.ndarray): float32 (H, W)，每个像素到最近的障碍或场景边缘的距离（像素）
+        nearest (np.ndarray): int32 (2, H, W)，每个像素最近的可行走像素的行列坐标
+        scale (float): 体素缩放因子，即每单位场景长度对应的像素（体素）数
+    """
+
+    def __init__(self, walkable, clearance, nearest, scale: float):
+        self.walkable = walkable
+        self.clearance = clearance
+        self.nearest = nearest
+        self.scale = float(scale)
+        self.height, self.width = walkable.shape
+        self.center_x = self.width / 2
+        self.center_y = self.height / 2
+
+    @property
+    def nbytes(self) -> int:
+        return self.walkable.nbytes + self.clearance.nbytes + self.nearest.nbytes
+
+    @classmethod
+    def build(cls, voxels, scale: float, band=OBSTACLE_BAND, clearance: float = CLEARANCE):
+        """由体素文件（或open_voxels返回的对象）和体素缩放因子计算可行走区域"""
+        from scipy.ndimage import distance_transform_edt # scipy只在需要时导入
+        if isinstance(voxels, str):
+            voxels = open_voxels(voxels)
+        Y = voxels.shape[1]
+        # 投影图的行为体素z、列为体素x（见npy_to_2d_image），以下都按图像的布局计算
+        occupied = np.ascontiguousarray((_column_counts(voxels, 0, Y) > 0).T)
+        # 场景范围：有体素的列所在的矩形，之外是体素化时补齐的空白区域
+        inside = np.zeros(occupied.shape, dtype=bool)
+        if occupied.any():
+            rows, cols = np.flatnonzero(occupied.any(axis=1)), np.flatnonzero(occupied.any(axis=0))
+            inside[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1] = True
+        # 高度带从地面起按缩放因子换算；上界严格低于最高的被占据层，天花板不会被当作障碍
+        floor, top = _vertical_extent(voxels, int(inside.sum()))
+        y0 = min(top, floor + max(1, int(round(band[0] * scale))))
+        y1 = min(top, floor + int(round(band[1] * scale)))
+        blocked = np.ascontiguousarray((_column_counts(voxels, y0, y1) > 0).T)
+        free = inside & ~blocked
+        # 图像边缘外也视为障碍，先补一圈再做距离变换
+        distance = distance_transform_edt(np.pad(free, 1))[1:-1, 1:-1].astype(np.float32)
+        walkable = distance >= max(1.0, clearance * scale)
+        if walkable.any():
+            nearest = distance_transform_edt(~walkable, return_distances=False, return_indices=True)
+            nearest = nearest.astype(np.int32)
+        else:
+            nearest = np.full((2,) + walkable.shape, -1, dtype=np.int32)
+        return cls(walkable, distance, nearest, scale)
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:
+            np.savez(f, walkable=self.walkable, clearance=self.clearance, nearest=self.nearest,
+                     scale=np.float64(self.scale))
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls(data['walkable'], data['clearance'], data['nearest'], float(data['scale']))
+
+    def to_pixel(self, x: float, y: float):
+        """场景坐标 -> (行, 列)"""
+        return int(np.floor(self.center_y - y * self.scale)), int(np.floor(self.center_x + x * self.scale))
+
+    def to_scene(self, row: int, col: int):
+        """像素中心 -> 场景坐标"""
+        return (round((col + 0.5 - self.center_x) / self.scale, 3),
+                round((self.center_y - row - 0.5) / self.scale, 3))
+
+    def _inside(self, row: int, col: int) -> bool:
+        return 0 <= row < self.height and 0 <= col < self.width
+
+    def nearest_walkable(self, x: float, y: float):
+        """离(x, y)最近的可行走位置（场景坐标），场景中没有可行走区域时返回None"""
+        row, col = self.to_pixel(x, y)
+        row, col = min(max(row, 0), self.height - 1), min(max(col, 0), self.width - 1)
+        if self.nearest[0, row, col] < 0:
+            return None
+        return self.to_scene(int(self.nearest[0, row, col]), int(self.nearest[1, row, col]))
+
+    def reach_distance(self, x: float, y: float):
+        """(x, y)到最近的可行走位置的距离（场景单位），场景中没有可行走区域时返回None"""
+        row, col = self.to_pixel(x, y)
+        row, col = min(max(row, 0), self.height - 1), min(max(col, 0), self.width - 1)
+        if self.nearest[0, row, col] < 0:
+            return None
+        return float(np.hypot(self.nearest[0, row, col] - row, self.nearest[1, row, col] - col)) / self.scale
+
+    def check_target(self, x: float, y: float, reach: float = REACH):
+        """交互动作的目标：返回无法到达的原因，可以到达时返回None"""
+        row, col = self.to_pixel(x, y)
+        if not self._inside(row, col):
+            return "在场景范围之外"
+        distance = self.reach_distance(x, y)
+        if distance is None or distance > reach:
+            return f"周围{reach:g}以内没有可以站立的位置"
+        return None
+
+    def check_point(self, x: float, y: float):
+        """返回位置不可行走的原因，可行走时返回None"""
+        row, col = self.to_pixel(x, y)
+        if not self._inside(row, col):
+            return "在场景范围之外"
+        if not self.walkable[row, col]:
+            return "位于障碍物内或离障碍物太近"
+        return None
+
+    def check_segment(self, start, end):
+        """沿线段逐像素检查，返回第一个不可行走的位置（场景坐标），全部可行走时返回None"""
+        (r0, c0), (r1, c1) = self.to_pixel(*start), self.to_pixel(*end)
+        n = max(abs(r1 - r0), abs(c1 - c0)) + 1
+        rows = np.round(np.linspace(r0, r1, n)).astype(int)
+        cols = np.round(np.linspace(c0, c1, n)).astype(int)
+        inside = (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.width)
+        ok = np.zeros(n, dtype=bool)
+        ok[inside] = self.walkable[rows[inside], cols[inside]]
+        if ok.all():
+            return None
+        i = int(np.argmin(ok))
+        return self.to_scene(rows[i], cols[i])
+
+    def check_route(self, table: pd.DataFrame):
+        """检查动作规划表的每一行，返回问题描述的列表，全部可行时为空列表。
+        移动类动作检查起点、终点和线段是否可行走；交互动作只检查起点在场景内、终点可以到达"""
+        coords = table[COORDINATE_COLUMNS].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+        actions = table[ACTION_COLUMN] if ACTION_COLUMN in table else pd.Series([None] * len(table))
+        problems = []
+        for idx, ((x1, y1, x2, y2), action) in enumerate(zip(coords, actions), 1):
+            if np.isnan([x1, y1, x2, y2]).any():
+                problems.append(f"第{idx}行：坐标不是有效的数字")
+                continue
+            locomotion = action is None or str(action).strip() in LOCOMOTION_ACTIONS
+            point_errors = []
+            for name, (x, y) in (("起点", (x1, y1)), ("终点", (x2, y2))):
+                if locomotion:
+                    reason = self.check_point(x, y)
+                elif name == "起点":
+                    reason = None if self._inside(*self.to_pixel(x, y)) else "在场景范围之外"
+                else:
+                    reason = self.check_target(x, y)
+                if reason is not None:
+                    suggestion = self.nearest_walkable(x, y)
+                    hint = f"，最近的可行走位置为 ({suggestion[0]}, {suggestion[1]})" if suggestion else ""
+                    point_errors.append(f"第{idx}行：{name}({x:g}, {y:g}){reason}{hint}")
+            problems.extend(point_errors)
+            if locomotion and not point_errors:
+                blocked = self.check_segment((x1, y1), (x2, y2))
+                if blocked is not None:
+                    problems.append(f"第{idx}行：从起点到终点的直线在 ({blocked[0]}, {blocked[1]}) 处被障碍物阻挡")
+        return problems
+
+
+class RouteChecker:
+    """按场景缓存RouteMap：内存中按LRU保留，磁盘上作为派生文件存入资源存储，相同场景的任务共享
+
+    参数:
+        store (AssetStore, optional): 保存计算结果的资源存储，为None时只缓存在内存中. Defaults to None.
+        max_bytes (int, optional): 内存中所有RouteMap占用之和的上限. Defaults to 128MB.
+    """
+
+    def __init__(self, store=None, max_bytes: int = 128 * 1024 ** 2):
+        self.store = store
+        self.cache = BoundedLRUCache(max_bytes, max_entries=256, sizeof=lambda route_map: route_map.nbytes)
+
+    def route_map(self, voxel_path: str, scale: float) -> RouteMap:
+        from voxel_cache import hash_file
+        key = f"{hash_file(voxel_path)}-{scale!r}-route{ROUTE_MAP_VERSION}.npz"
+        route_map = self.cache.get(key)
+        if route_map is None:
+            if self.store is None:
+                route_map = RouteMap.build(voxel_path, scale)
+            else:
+                path = self.store.put_derived(key, lambda tmp: RouteMap.build(voxel_path, scale).save(tmp))
+                route_map = RouteMap.load(path)
+            self.cache.put(key, route_map)
+        return route_map
+
+    def check(self, task, table: pd.DataFrame):
+        """检查动作规划，返回问题描述的列表；任务还没有体素文件或缩放因子（旧版本创建的任务）时不检查"""
+        if task.npy_path is None or getattr(task, 'voxel_scale', None) is None:
+            return []
+        return self.route_map(task.npy_path, task.voxel_scale).check_route(table)
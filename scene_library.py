@@ -0,0 +1,92 @@
+###
+#  预处理场景库：由ingest_scenes批量生成的体素文件、投影图片和清单（manifest.json）。
+#  清单以与体素缓存相同的键（场景内容哈希 + 体素化参数）索引，上传的场景在库中时直接使用库中的结果
+###
+import json
+import os
+import threading
+import time
+import uuid
+from os.path import join as path_join, exists as path_exists
+
+DEFAULT_LIBRARY_DIR = "./scene_library"
+MANIFEST_NAME = "manifest.json"
+# Web应用上传场景时使用的体素化引擎：稀疏体素文件（.svox）用voxelizer.voxelize_fast直接收集命中的体素，不分配稠密网格。
+# 体素化引擎是缓存键的一部分，ingest_scenes默认使用同一引擎才能命中
+UPLOAD_VOXEL_METHOD = 'fast'
+
+
+class SceneLibrary:
+    """场景库的读写。清单在被其他进程（例如正在运行的ingest_scenes）更新后会自动重新读取
+
+    参数:
+        root (str, optional): 场景库目录. Defaults to "./scene_library".
+    """
+
+    def __init__(self, root: str = DEFAULT_LIBRARY_DIR):
+        self.root = root
+        self.manifest_path = path_join(root, MANIFEST_NAME)
+        self._scenes = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def scene_dir(self, key: str) -> str:
+        return path_join(self.root, key)
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            self._scenes, self._mtime = {}, None
+            return
+        if mtime != self._mtime:
+            with open(self.manifest_path, 'r') as f:
+                self._scenes = json.load(f).get("scenes", {})
+            self._mtime = mtime
+
+    def scenes(self) -> dict:
+        """键 -> 场景条目"""
+        with self._lock:
+            self._reload()
+            return dict(self._scenes)
+
+    def lookup(self, key: str):
+        """返回键对应的场景条目，不存在或文件已缺失时返回None"""
+        with self._lock:
+            self._reload()
+            entry = self._scenes.get(key)
+        if entry is None or not path_exists(path_join(self.root, entry["voxels"])):
+            return None
+        return entry
+
+    def fetch(self, key: str, voxel_output: str, image_output: str = None, projection_type: str = 'average'):
+        """与VoxelCache.fetch相同：命中时将体素文件（以及投影图片）放到指定路径并返回
+        (pixel_to_scene_cordinate_ratio, 体素缩放因子)，旧条目没有缩放因子时其为None；未命中、体素格式不同或缺少所需投影时返回None"""
+        from asset_store import link_or_copy
+        entry = self.lookup(key)
+        if entry is None or os.path.splitext(entry["voxels"])[1] != os.path.splitext(voxel_output)[1]:
+            return None
+        image = entry["images"].get(projection_type)
+        if image_output is not None and image is None:
+            return None
+        try:
+            link_or_copy(path_join(self.root, entry["voxels"]), voxel_output)
+            if image_output is not None:
+                link_or_copy(path_join(self.root, image), image_output)
+        except OSError as e:
+            print(f"场景库读取失败，按未命中处理: {e}")
+            return None
+        print(f"场景库命中: {entry['name']}")
+        return entry["ratio"], entry.get("scale")
+
+    def add(self, key: str, entry: dict):
+        """登记一个场景并写回清单。清单只应由一个进程写入（ingest_scenes的主进程）"""
+        with self._lock:
+            self._reload()
+            self._scenes[key] = entry
+            os.makedirs(self.root, exist_ok=True)
+            tmp = f"{self.manifest_path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump({"updated": time.time(), "scenes": self._scenes}, f, indent=2, ensure_ascii=False)
+            os.replace(tmp, self.manifest_path)
+            self._mtime = os.stat(self.manifest_path).st_mtime_ns
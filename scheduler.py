@@ -0,0 +1,237 @@
+###
+#  后台任务调度：有界等待队列 + 固定数量的工作线程，按阶段执行任务并在Task上记录状态
+#  Gradio的请求处理函数只负责提交任务和轮询状态，不再同步等待推理和渲染
+###
+import collections
+import queue
+import threading
+import time
+import traceback
+
+from metrics import trace_stage
+
+# 任务的终止状态；interrupted由task_store在服务重启时标记
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled', 'interrupted')
+
+
+class TaskCancelled(Exception):
+    """任务在阶段之间被取消"""
+
+
+class TaskBusy(RuntimeError):
+    """任务已在排队、执行或跟随其他任务，不能以不同的内容再次提交"""
+
+
+class TaskScheduler:
+    """按阶段执行任务的调度器
+
+    参数:
+        stages (list): [(阶段名称, 阶段函数)]，阶段函数接收Task对象，按顺序执行
+        num_workers (int, optional): 工作线程数，即同时执行的任务数. Defaults to 2.
+        max_queue (int, optional): 等待队列的最大长度，超出时submit抛出queue.Full. Defaults to 32.
+
+    同一个任务在结束之前不能以不同的阶段或result_key再次提交，submit抛出TaskBusy；完全相同的重复提交被忽略。
+
+    result_key相同、阶段也相同的任务（见result_memo）已在排队或执行时，后提交的任务不再进入队列，
+    而是跟随先提交的任务，其完成后通过on_duplicate(跟随者, 先提交的任务)复用结果
+    """
+
+    def __init__(self, stages, num_workers: int = 2, max_queue: int = 32):
+        self.stages = list(stages)
+        self.max_queue = max_queue
+        self.on_duplicate = None
+        self._pending = collections.deque()
+        self._running = {}
+        self._leaders = {}  # (result_key, 阶段名称) -> 排队或执行中的任务
+        self._followers = {}  # 任务ID -> 跟随它的任务列表
+        self._cond = threading.Condition()
+        self._workers = []
+        for i in range(num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"task-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, task, stages=None):
+        """将任务放入等待队列
+
+        参数:
+            task (Task): 需要执行的任务
+            stages (list, optional): 覆盖默认阶段列表，例如只执行部分阶段
+        """
+        stages = stages or self.stages
+        stage_names = [name for name, _ in stages]
+        key = self._dedupe_key(task, stage_names)
+        with self._cond:
+            leader = self._leaders.get(key) if key is not None else None
+            if self._active(task):
+                if leader is task or (leader is not None and task.following == leader.task_id):
+                    # 同一个任务重复提交（例如连续点击），已在排队、执行或跟随，不再重复加入
+                    return
+                # 同一个输出目录不能同时执行两次，旧的执行结束时也会把结果交给错误的跟随者
+                raise TaskBusy(f"任务 {task.task_id} 正在处理中，请等待完成或先取消")
+            if leader is None and len(self._pending) >= self.max_queue:
+                raise queue.Full(f"等待队列已满（{self.max_queue}），请稍后再试")
+            task.cancel_requested = False
+            task.error = None
+            task.stages = stage_names
+            task.stage = None
+            task.following = None if leader is None else leader.task_id
+            task.update_status('queued')
+            if task.following is not None:
+                self._followers.setdefault(leader.task_id, []).append((task, stages))
+                return
+            if key is not None:
+                self._leaders[key] = task
+            self._pending.append((task, stages))
+            self._cond.notify()
+
+    @staticmethod
+    def _dedupe_key(task, stage_names):
+        result_key = getattr(task, 'result_key', None)
+        return None if result_key is None else (result_key, tuple(stage_names))
+
+    def _leader_of(self, task):
+        """跟随者所跟随的任务，没有时返回None"""
+        following = getattr(task, 'following', None)
+        if following is None:
+            return None
+        for leader in self._leaders.values():
+            if leader.task_id == following:
+                return leader
+        return None
+
+    def _active(self, task) -> bool:
+        return (task.task_id in self._running or self._leader_of(task) is not None
+                or any(pending.task_id == task.task_id for pending, _ in self._pending))
+
+    def active(self, task) -> bool:
+        """任务是否正在排队、执行或跟随其他任务"""
+        with self._cond:
+            return self._active(task)
+
+    def position(self, task):
+        """返回任务在等待队列中的位置（0表示下一个执行），不在等待队列中时返回None"""
+        with self._cond:
+            task = self._leader_of(task) or task
+            for i, (pending, _) in enumerate(self._pending):
+                if pending.task_id == task.task_id:
+                    return i
+        return None
+
+    def cancel(self, task) -> bool:
+        """取消任务：仍在排队的任务直接移出队列，正在执行的任务在当前阶段结束后停止
+
+        返回:
+            bool: 任务是否处于可取消的状态
+        """
+        with self._cond:
+            leader = self._leader_of(task)
+            if leader is not None:
+                # 跟随者只退出跟随，不影响正在执行的任务
+                followers = self._followers.get(leader.task_id, [])
+                followers[:] = [item for item in followers if item[0].task_id != task.task_id]
+                task.following = None
+                task.update_status('cancelled')
+                return True
+            for item in self._pending:
+                if item[0].task_id == task.task_id:
+                    self._pending.remove(item)
+                    task.update_status('cancelled')
+                    self._finish(task)
+                    return True
+            running = self._running.get(task.task_id)
+            if running is not None:
+                running.cancel_requested = True
+                return True
+        return False
+
+    def status_text(self, task) -> str:
+        """生成供界面显示的任务状态描述"""
+        if task is None:
+            return "尚未上传场景"
+        with self._cond:
+            leader = self._leader_of(task)
+        if leader is not None:
+            return f"已有相同的任务在处理，完成后直接复用其结果（{self.status_text(leader)}）"
+        position = self.position(task)
+        if position is not None:
+            return f"排队中，前面还有 {position} 个任务"
+        if task.status == 'completed':
+            return "任务已完成"
+        if task.status == 'failed':
+            return f"任务失败: {task.error}"
+        if task.status == 'cancelled':
+            return "任务已取消"
+        if task.status == 'interrupted':
+            return "任务因服务重启而中断"
+        stages = getattr(task, 'stages', None)
+        if stages and task.stage in stages:
+            text = f"正在执行: {task.stage}（{stages.index(task.stage) + 1}/{len(stages)}）"
+            if getattr(task, 'progress', None):
+                text += f"，{task.progress}"
+            if getattr(task, 'cancel_requested', False):
+                text += "，正在取消"
+            return text
+        return f"当前状态: {task.status}"
+
+    def wait(self, task, poll_interval: float = 1.0):
+        """生成器：任务结束前每隔poll_interval产出一次状态描述，结束时产出最终状态"""
+        while task.status not in FINISHED_STATUSES:
+            yield self.status_text(task)
+            time.sleep(poll_interval)
+        yield self.status_text(task)
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                task, stages = self._pending.popleft()
+                self._running[task.task_id] = task
+            try:
+                self._run(task, stages)
+            finally:
+                self._finish(task)
+
+    def _finish(self, task):
+        """任务结束后处理跟随它的任务：成功时复用其结果；被取消时重新提交（相同的跟随者合并到第一个之后）；
+        失败时以同样的错误结束"""
+        with self._cond:
+            # 移出执行列表与释放跟随关系在同一次加锁内完成，其间提交的同一任务不会被当作重复提交忽略
+            self._running.pop(task.task_id, None)
+            for key in [key for key, leader in self._leaders.items() if leader is task]:
+                del self._leaders[key]
+            followers = self._followers.pop(task.task_id, [])
+        for follower, stages in followers:
+            follower.following = None
+            try:
+                if task.status == 'completed' and self.on_duplicate is not None:
+                    self.on_duplicate(follower, task)
+                elif task.status == 'cancelled':
+                    self.submit(follower, stages)
+                else:
+                    follower.error = task.error
+                    follower.update_status(task.status)
+            except Exception as e:
+                traceback.print_exc()
+                follower.error = str(e)
+                follower.update_status('failed')
+
+    def _run(self, task, stages):
+        try:
+            for name, stage in stages:
+                if task.cancel_requested:
+                    raise TaskCancelled()
+                task.stage = name
+                task.progress = None
+                task.update_status(name)
+                print(f"task {task.task_id}: {name}")
+                with trace_stage(task, name):
+                    stage(task)
+            task.update_status('completed')
+        except TaskCancelled:
+            task.update_status('cancelled')
+        except Exception as e:
+            traceback.print_exc()
+            task.error = str(e)
+            task.update_status('failed')
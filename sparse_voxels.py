@@ -0,0 +1,221 @@
+###
+#  稀疏体素格式（.svox）：场景网格大部分是空气，只记录每一竖直列（x, z）上沿y轴连续占据的区段（run）。
+#  列按 x*Z+z 的顺序排列，indptr[c]:indptr[c+1] 为第c列的区段，类似CSR稀疏矩阵。
+#  与PackedVoxelGrid/DenseVoxelGrid接口一致（slab/iter_slabs/to_dense），投影可直接在区段上计算
+###
+import json
+import struct
+
+import numpy as np
+
+from voxel_format import _ALIGN
+
+SPARSE_MAGIC = b"LVOXSP01"
+SPARSE_SUFFIX = ".svox"
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _index_dtypes(shape, n_runs):
+    """按网格尺寸选择最小的整数类型：indptr取决于区段总数，start/length取决于y方向的高度"""
+    indptr_dtype = np.uint32 if n_runs < 2**32 else np.uint64
+    run_dtype = np.uint16 if shape[1] < 2**16 else np.uint32
+    return np.dtype(indptr_dtype), np.dtype(run_dtype)
+
+
+def _runs_of_columns(columns: np.ndarray):
+    """columns为 (列数, Y) 的布尔数组，返回每个区段所在的列、起点和长度，按列、起点排序"""
+    n, Y = columns.shape
+    padded = np.zeros((n, Y + 2), dtype=np.int8)
+    padded[:, 1:-1] = columns
+    edges = np.diff(padded, axis=1)
+    col, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    return col, starts, ends - starts
+
+
+class SparseVoxelGrid:
+    """按列记录y方向占据区段的稀疏体素矩阵
+
+    参数:
+        shape (tuple): 体素矩阵形状 (X, Y, Z)
+        indptr (np.ndarray): 长度为 X*Z+1，第c列的区段为 [indptr[c], indptr[c+1])
+        starts (np.ndarray): 每个区段的起始y
+        lengths (np.ndarray): 每个区段的长度
+        meta (dict, optional): 元数据
+    """
+
+    def __init__(self, shape, indptr, starts, lengths, meta: dict = None):
+        self.shape = tuple(int(s) for s in shape)
+        self.indptr = indptr
+        self.starts = starts
+        self.lengths = lengths
+        self.meta = meta or {}
+        self.dtype = np.dtype(bool)
+        self.ndim = 3
+        self.path = None
+
+    @property
+    def n_runs(self) -> int:
+        return len(self.starts)
+
+    @property
+    def nbytes(self) -> int:
+        return self.indptr.nbytes + self.starts.nbytes + self.lengths.nbytes
+
+    @classmethod
+    def from_dense(cls, voxels, chunk: int = 32, meta: dict = None):
+        """由三维布尔数组或提供iter_slabs的体素对象逐切片构建，不需要一次性展开整个网格"""
+        if isinstance(voxels, np.ndarray):
+            from voxel_format import DenseVoxelGrid
+            voxels = DenseVoxelGrid(voxels)
+        X, Y, Z = voxels.shape
+        counts = np.zeros(X * Z, dtype=np.int64)
+        starts, lengths = [], []
+        for x0, slab in voxels.iter_slabs(chunk):
+            n = slab.shape[0]
+            columns = np.ascontiguousarray(slab.transpose(0, 2, 1)).reshape(n * Z, Y)
+            col, s, l = _runs_of_columns(columns)
+            counts[x0 * Z:(x0 + n) * Z] = np.bincount(col, minlength=n * Z)
+            starts.append(s)
+            lengths.append(l)
+        return cls._from_parts((X, Y, Z), counts, np.concatenate(starts), np.concatenate(lengths), meta)
+
+    @classmethod
+    def from_coords(cls, coords: np.ndarray, shape, meta: dict = None):
+        """由被占据体素的整数坐标 (N, 3) 构建，坐标可以重复、无序"""
+        _, Y, Z = shape
+        coords = np.asarray(coords, dtype=np.int64)
+        return cls.from_linear((coords[:, 0] * Z + coords[:, 2]) * Y + coords[:, 1], shape, meta)
+
+    @classmethod
+    def from_linear(cls, linear: np.ndarray, shape, meta: dict = None):
+        """由按 (x*Z+z)*Y+y 编码的体素索引构建，索引可以重复、无序"""
+        X, Y, Z = shape
+        # 排序去重后，同一列内y不连续的位置即为新区段的起点
+        linear = np.unique(linear)
+        col, y = np.divmod(linear, Y)
+        new_run = np.ones(len(linear), dtype=bool)
+        new_run[1:] = (col[1:] != col[:-1]) | (y[1:] != y[:-1] + 1)
+        run_starts = np.flatnonzero(new_run)
+        lengths = np.diff(np.r_[run_starts, len(linear)])
+        counts = np.bincount(col[run_starts], minlength=X * Z)
+        return cls._from_parts((X, Y, Z), counts, y[run_starts], lengths, meta)
+
+    @classmethod
+    def _from_parts(cls, shape, counts, starts, lengths, meta):
+        indptr_dtype, run_dtype = _index_dtypes(shape, len(starts))
+        indptr = np.zeros(len(counts) + 1, dtype=indptr_dtype)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(shape, indptr, starts.astype(run_dtype), lengths.astype(run_dtype), meta)
+
+    def _column_ids(self, c0: int, c1: int) -> np.ndarray:
+        """[c0, c1) 范围内每个区段所属的列（相对c0）"""
+        return np.repeat(np.arange(c1 - c0), np.diff(self.indptr[c0:c1 + 1].astype(np.int64)))
+
+    def slab(self, x0: int, x1: int) -> np.ndarray:
+        """展开 [x0, x1) 范围内的x切片，返回形状为 (x1-x0, Y, Z) 的布尔数组"""
+        _, Y, Z = self.shape
+        c0, c1 = x0 * Z, x1 * Z
+        r0, r1 = int(self.indptr[c0]), int(self.indptr[c1])
+        col = self._column_ids(c0, c1)
+        starts = self.starts[r0:r1].astype(np.int64)
+        ends = starts + self.lengths[r0:r1]
+        # 区段互不相邻，起点和终点各自唯一，差分后累加即为占据标记
+        delta = np.zeros((c1 - c0, Y + 1), dtype=np.int8)
+        delta[col, starts] = 1
+        delta[col, ends] = -1
+        columns = np.cumsum(delta[:, :Y], axis=1, dtype=np.int8).astype(bool)
+        return np.ascontiguousarray(columns.reshape(x1 - x0, Z, Y).transpose(0, 2, 1))
+
+    def iter_slabs(self, chunk: int = 16):
+        """按x轴依次产出 (x0, slab)，每次最多展开chunk个切片"""
+        for x0 in range(0, self.shape[0], chunk):
+            yield x0, self.slab(x0, min(x0 + chunk, self.shape[0]))
+
+    def to_dense(self) -> np.ndarray:
+        """展开为完整的布尔数组"""
+        return self.slab(0, self.shape[0])
+
+    def column_counts(self, y0: int = 0, y1: int = None) -> np.ndarray:
+        """每一列在 [y0, y1) 高度范围内被占据的体素数，形状为 (X, Z)"""
+        X, Y, Z = self.shape
+        y1 = Y if y1 is None else y1
+        starts = self.starts.astype(np.int64)
+        ends = starts + self.lengths
+        if y0 > 0 or y1 < Y:
+            lengths = np.clip(np.minimum(ends, y1) - np.maximum(starts, y0), 0, None)
+        else:
+            lengths = ends - starts
+        cumulative = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=cumulative[1:])
+        indptr = self.indptr.astype(np.int64)
+        return (cumulative[indptr[1:]] - cumulative[indptr[:-1]]).reshape(X, Z)
+
+    def column_top(self) -> np.ndarray:
+        """每一列最高的被占据体素的y，空列为-1，形状为 (X, Z)"""
+        X, _, Z = self.shape
+        indptr = self.indptr.astype(np.int64)
+        top = np.full(X * Z, -1, dtype=np.int64)
+        filled = indptr[1:] > indptr[:-1]
+        last = indptr[1:][filled] - 1  # 列内区段按起点排序，最后一个区段最高
+        top[filled] = self.starts[last].astype(np.int64) + self.lengths[last] - 1
+        return top.reshape(X, Z)
+
+
+def save_sparse_voxels(path: str, voxels, meta: dict = None):
+    """将体素矩阵保存为.svox文件
+
+    参数:
+        path (str): 输出文件路径，建议以.svox结尾
+        voxels: SparseVoxelGrid、三维布尔数组或提供iter_slabs的体素对象
+        meta (dict, optional): 需要一并保存的元数据（需可被json序列化）
+    """
+    if not isinstance(voxels, SparseVoxelGrid):
+        voxels = SparseVoxelGrid.from_dense(voxels)
+    arrays = (voxels.indptr, voxels.starts, voxels.lengths)
+    header = json.dumps({
+        "shape": list(voxels.shape),
+        "n_runs": voxels.n_runs,
+        "dtypes": [a.dtype.str for a in arrays],
+        "meta": meta if meta is not None else voxels.meta,
+    }).encode()
+    with open(path, 'wb') as f:
+        f.write(SPARSE_MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for array in arrays:
+            f.write(b'\0' * (_align(f.tell()) - f.tell()))
+            f.write(np.ascontiguousarray(array).tobytes())
+
+
+def is_sparse(path: str) -> bool:
+    """根据文件头判断是否为.svox格式"""
+    with open(path, 'rb') as f:
+        return f.read(len(SPARSE_MAGIC)) == SPARSE_MAGIC
+
+
+def open_sparse_voxels(path: str) -> SparseVoxelGrid:
+    """以内存映射方式打开.svox文件"""
+    with open(path, 'rb') as f:
+        if f.read(len(SPARSE_MAGIC)) != SPARSE_MAGIC:
+            raise ValueError(f"{path} 不是有效的.svox体素文件")
+        (header_len,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_len))
+        offset = f.tell()
+    X, _, Z = header["shape"]
+    lengths = (X * Z + 1, header["n_runs"], header["n_runs"])
+    arrays = []
+    for dtype, length in zip(header["dtypes"], lengths):
+        dtype = np.dtype(dtype)
+        offset = _align(offset)
+        if length:
+            arrays.append(np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(length,)))
+        else:
+            arrays.append(np.zeros(0, dtype=dtype))
+        offset += dtype.itemsize * length
+    grid = SparseVoxelGrid(header["shape"], *arrays, meta=header.get("meta", {}))
+    grid.path = path
+    return grid
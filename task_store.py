@@ -0,0 +1,209 @@
+###
+#  持久化任务存储：SQLite（WAL模式）保存全部任务的状态和路径，服务重启后任务记录不会丢失。
+#  每个线程/进程使用自己的连接，WAL允许读写并发，多个写入者由busy_timeout排队；
+#  状态更新只改动对应行的几个字段，不会像PersistentDict那样每次重写全部数据
+###
+import json
+import os
+import sqlite3
+import threading
+import time
+from io import StringIO
+
+import pandas as pd
+
+from classes import Task
+from scheduler import FINISHED_STATUSES
+
+DEFAULT_DB_PATH = "./cache/tasks.sqlite3"
+# 数据库被其他写入者锁定时最多等待的时间（毫秒）
+BUSY_TIMEOUT_MS = 30000
+# 上传阶段的状态，任务此时还没有进入调度器
+IDLE_STATUSES = ('init', 'uploaded', 'npy')
+
+# 与Task属性同名的列，data（动作规划表）和stages单独序列化为json
+_COLUMNS = (
+    'task_id', 'timestamp', 'status', 'stage', 'error', 'output_dir', 'obj_path', 'image_path',
+    'npy_path', 'blend_path', 'video_path', 'preview_path', 'result_path', 'pixel_to_scene_ratio', 'result_key',
+    'motion_path', 'voxel_scale',
+)
+_JSON_COLUMNS = ('stages', 'data')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    timestamp TEXT,
+    status TEXT NOT NULL,
+    stage TEXT,
+    error TEXT,
+    output_dir TEXT,
+    obj_path TEXT,
+    image_path TEXT,
+    npy_path TEXT,
+    blend_path TEXT,
+    video_path TEXT,
+    preview_path TEXT,
+    result_path TEXT,
+    pixel_to_scene_ratio REAL,
+    result_key TEXT,
+    motion_path TEXT,
+    voxel_scale REAL,
+    stages TEXT,
+    data TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, updated_at);
+"""
+# 旧版本数据库中没有的列，打开时补上
+_ADDED_COLUMNS = {'result_key': 'TEXT', 'motion_path': 'TEXT', 'voxel_scale': 'REAL'}
+
+
+def _encode(column, value):
+    if column == 'data':
+        return None if value is None else value.to_json(orient='split', force_ascii=False)
+    if column == 'stages':
+        return json.dumps(list(value or []))
+    return value
+
+
+def _decode(column, value):
+    if column == 'data':
+        return None if value is None else pd.read_json(StringIO(value), orient='split', dtype=False)
+    if column == 'stages':
+        return json.loads(value) if value else []
+    return value
+
+
+class TaskStore:
+    """任务记录的SQLite存储
+
+    参数:
+        path (str, optional): 数据库文件路径. Defaults to "./cache/tasks.sqlite3".
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        existing = {row['name'] for row in conn.execute("PRAGMA table_info(tasks)")}
+        for column, column_type in _ADDED_COLUMNS.items():
+            if column not in existing:
+                try:
+                    conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} {column_type}")
+                except sqlite3.OperationalError:
+                    # 其他进程同时补上了这一列
+                    pass
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_result_key ON tasks (result_key, status)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """当前线程的连接；fork出的子进程不能沿用父进程的连接，按pid区分"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            # isolation_level=None：每条语句自动提交，需要多条语句原子执行时显式BEGIN
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def save(self, task: Task):
+        """写入（或覆盖）任务的完整记录"""
+        columns = _COLUMNS + _JSON_COLUMNS
+        values = [_encode(c, getattr(task, c, None)) for c in columns]
+        placeholders = ", ".join("?" for _ in range(len(columns) + 1))
+        self._conn().execute(
+            f"INSERT OR REPLACE INTO tasks ({', '.join(columns)}, updated_at) VALUES ({placeholders})",
+            values + [time.time()])
+
+    def update_fields(self, task_id: str, **fields) -> bool:
+        """只更新给定的字段，返回任务记录是否存在"""
+        unknown = set(fields) - set(_COLUMNS + _JSON_COLUMNS)
+        if unknown:
+            raise ValueError(f"未知的任务字段: {sorted(unknown)}")
+        assignments = ", ".join(f"{c} = ?" for c in fields)
+        values = [_encode(c, v) for c, v in fields.items()]
+        cursor = self._conn().execute(
+            f"UPDATE tasks SET {assignments}, updated_at = ? WHERE task_id = ?",
+            values + [time.time(), task_id])
+        return cursor.rowcount > 0
+
+    def get(self, task_id: str):
+        """按任务ID读取记录，返回dict，不存在时返回None"""
+        row = self._conn().execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None:
+            return None
+        return {k: _decode(k, row[k]) for k in row.keys()}
+
+    def load_task(self, task_id: str):
+        """按任务ID恢复Task对象，不存在时返回None"""
+        record = self.get(task_id)
+        if record is None:
+            return None
+        task = Task(record['obj_path'])
+        for column in _COLUMNS + _JSON_COLUMNS:
+            setattr(task, column, record[column])
+        return task
+
+    def list_by_status(self, status, limit: int = 100):
+        """按状态列出最近更新的任务ID，status可以是单个状态或状态列表"""
+        statuses = [status] if isinstance(status, str) else list(status)
+        placeholders = ", ".join("?" for _ in statuses)
+        rows = self._conn().execute(
+            f"SELECT task_id FROM tasks WHERE status IN ({placeholders}) ORDER BY updated_at DESC LIMIT ?",
+            statuses + [limit]).fetchall()
+        return [row['task_id'] for row in rows]
+
+    def count_by_status(self) -> dict:
+        rows = self._conn().execute("SELECT status, COUNT(*) AS n FROM tasks GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    def find_completed(self, result_key: str, require: str, limit: int = 5):
+        """列出result_key相同、已完成且给定路径字段（例如video_path）不为空的任务ID，最近完成的在前"""
+        if require not in _COLUMNS:
+            raise ValueError(f"未知的任务字段: {require}")
+        rows = self._conn().execute(
+            f"SELECT task_id FROM tasks WHERE result_key = ? AND status = 'completed' AND {require} IS NOT NULL "
+            f"ORDER BY updated_at DESC LIMIT ?", (result_key, limit)).fetchall()
+        return [row['task_id'] for row in rows]
+
+    def recover_in_flight(self):
+        """服务启动时调用：上次退出时仍在排队或执行中的任务标记为interrupted
+
+        返回:
+            list: 被标记的任务ID及其中断前所在阶段 [(task_id, stage)]
+        """
+        excluded = FINISHED_STATUSES + IDLE_STATUSES
+        placeholders = ", ".join("?" for _ in excluded)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(f"SELECT task_id, stage FROM tasks WHERE status NOT IN ({placeholders})",
+                                excluded).fetchall()
+            conn.execute(
+                f"UPDATE tasks SET status = 'interrupted', error = ?, updated_at = ? "
+                f"WHERE status NOT IN ({placeholders})",
+                ("服务重启时任务尚未完成", time.time()) + excluded)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [(row['task_id'], row['stage']) for row in rows]
+
+    def on_status(self, task: Task):
+        """Task.update_status的回调：只写入随状态变化的字段，进入队列时额外记录阶段列表和动作规划表以便重启后恢复"""
+        fields = dict(status=task.status, stage=task.stage, error=task.error, video_path=task.video_path,
+                      preview_path=task.preview_path, result_path=task.result_path, result_key=task.result_key,
+                      motion_path=task.motion_path)
+        if task.status == 'queued':
+            fields.update(stages=task.stages, data=task.data)
+        try:
+            if not self.update_fields(task.task_id, **fields):
+                self.save(task)
+        except sqlite3.Error as e:
+            # 存储故障不应中断任务本身
+            print(f"写入任务状态失败 {task.task_id}: {e}")
@@ -0,0 +1,76 @@
+###
+#  route_check的回归测试：带天花板的房间（高度不足使体素缩放因子小于pixel_to_scene_ratio），
+#  检查坐标换算、高度带和安全距离都按体素化时的真实缩放因子计算
+#  用法：python -m pytest -q tests
+###
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+import trimesh
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from interfaces import voxelize_obj  # noqa: E402
+from route_check import RouteMap  # noqa: E402
+
+ROOM = (6.0, 3.0, 8.0)  # 宽、高、深（场景单位）
+WALL = 0.05
+
+
+def make_room() -> trimesh.Trimesh:
+    """以原点为中心的房间：地板、高度为3的天花板、四面墙和房间中央的一张桌子"""
+    w, h, d = ROOM
+
+    def box(extents, center):
+        return trimesh.creation.box(extents=extents, transform=trimesh.transformations.translation_matrix(center))
+    return trimesh.util.concatenate([
+        box([w, WALL, d], [0, 0, 0]),
+        box([w, WALL, d], [0, h, 0]),
+        box([WALL, h, d], [-w / 2, h / 2, 0]),
+        box([WALL, h, d], [w / 2, h / 2, 0]),
+        box([w, h, WALL], [0, h / 2, -d / 2]),
+        box([w, h, WALL], [0, h / 2, d / 2]),
+        box([1.0, 0.75, 1.0], [0, 0.375, 0]),
+    ])
+
+
+@pytest.fixture(scope='module')
+def room(tmp_path_factory):
+    output = str(tmp_path_factory.mktemp('room') / 'room.svox')
+    grid, ratio, scale = voxelize_obj('room.obj', output=output, method='fast', mesh=make_room())
+    return grid, ratio, scale, RouteMap.build(output, scale)
+
+
+def test_scale_follows_room_height(room):
+    _, ratio, scale, _ = room
+    # 高度方向100个体素只能容纳约33个体素/单位，水平方向的ratio约为66
+    assert scale == pytest.approx(0.995 * 100 / ROOM[1], rel=0.02)
+    assert scale < ratio
+
+
+def test_ceiling_is_not_an_obstacle(room):
+    _, _, _, route_map = room
+    assert route_map.walkable.mean() > 0.5
+    assert route_map.check_point(2.5, 3.5) is None
+    assert route_map.check_point(1, -1) is None
+
+
+def test_table_blocks_walking_but_can_be_reached(room):
+    _, _, _, route_map = room
+    assert route_map.check_point(0, 0) is not None
+    assert route_map.check_target(0, 0) is None
+    table = pd.DataFrame([["-2", "0", "2", "0", "walk"], ["1.5", "1.5", "0", "0", "pick up"]],
+                         columns=["起点x1", "起点y1", "终点x2", "终点y2", "动作"])
+    problems = route_map.check_route(table)
+    assert len(problems) == 1 and problems[0].startswith("第1行") and "阻挡" in problems[0]
+
+
+def test_points_outside_the_walls_are_rejected(room):
+    _, _, _, route_map = room
+    assert route_map.check_point(3.5, 0) is not None
+    assert route_map.check_point(0, 4.5) is not None
+    assert np.isclose(route_map.to_scene(*route_map.to_pixel(1.0, -2.0)), (1.0, -2.0), atol=1 / route_map.scale).all()
@@ -0,0 +1,130 @@
+###
+#  轻量的轨迹预览：把Lingo输出的人物运动画在场景俯视投影图（npy_to_2d_image的输出）上，
+#  几秒内生成GIF（有ffmpeg时同时生成mp4），用于确认生成的运动是否沿着规划路线；Cycles渲染只在需要时执行
+###
+import glob
+import os
+import pickle as pkl
+import shutil
+import subprocess
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# Lingo输出中可能存放人物位置的字段，按优先级排列
+MOTION_KEYS = ('joints', 'joint_positions', 'positions', 'transl', 'trans', 'root', 'trajectory')
+
+
+def _extract_motion(data):
+    """从Lingo的输出对象中取出 (T, J, 3) 的关节位置（只有根节点轨迹时J=1），无法识别时返回None"""
+    if isinstance(data, dict):
+        for key in MOTION_KEYS:
+            if key in data:
+                return _extract_motion(data[key])
+        return None
+    if isinstance(data, (list, tuple)):
+        if data and all(isinstance(d, (dict, list, tuple, np.ndarray)) for d in data):
+            segments = [m for m in (_extract_motion(d) for d in data) if m is not None]
+            if segments and len({m.shape[1] for m in segments}) == 1:
+                return np.concatenate(segments, axis=0)
+        data = np.asarray(data)
+    if isinstance(data, np.ndarray) and data.dtype.kind == 'f' and data.shape[-1] == 3:
+        if data.ndim == 2:
+            return data[:, None, :]
+        if data.ndim == 3:
+            return data
+        if data.ndim == 4:
+            return data.reshape(-1, *data.shape[2:])
+    return None
+
+
+def load_lingo_motion(path: str) -> np.ndarray:
+    """读取Lingo输出文件（.pkl/.npy/.npz），返回 (T, J, 3) 的关节位置，第0个关节视为根节点"""
+    if path.endswith('.pkl'):
+        with open(path, 'rb') as f:
+            data = pkl.load(f)
+    elif path.endswith('.npz'):
+        data = dict(np.load(path, allow_pickle=True))
+    else:
+        data = np.load(path, allow_pickle=True)
+        if data.dtype == object and data.shape == ():
+            data = data.item()
+    motion = _extract_motion(data)
+    if motion is None:
+        raise ValueError(f"无法从 {path} 中识别出人物运动数据")
+    return motion
+
+
+def find_lingo_output(output_dir: str, task_id: str, exclude=(), since: float = None):
+    """在任务目录中查找Lingo的输出文件（排除模型输入的pkl和场景体素文件），找不到时返回None
+
+    参数:
+        since (float, optional): 只考虑修改时间不早于此时刻的文件，用于排除之前提交留下的输出. Defaults to None.
+    """
+    exclude = {os.path.abspath(p) for p in exclude}
+    candidates = []
+    for pattern in ('*.pkl', '*.npz', '*.npy'):
+        candidates += glob.glob(os.path.join(output_dir, '**', pattern), recursive=True)
+    candidates = [p for p in candidates
+                  if os.path.abspath(p) not in exclude and os.path.basename(p) != f'{task_id}.pkl'
+                  and (since is None or os.path.getmtime(p) >= since)]
+    return max(candidates, key=os.path.getmtime) if candidates else None
+
+
+def render_trajectory_preview(motion: np.ndarray, scene_image_path: str, ratio: float, output_path: str,
+                              max_frames: int = 120, fps: int = 15):
+    """在场景投影图上逐帧绘制人物轨迹和身体位置，输出GIF；output_path以.mp4结尾且有ffmpeg时输出mp4
+
+    参数:
+        motion (np.ndarray): (T, J, 3) 的关节位置，场景坐标，y轴向上
+        scene_image_path (str): 场景的俯视投影图
+        ratio (float): 像素坐标与场景坐标之比（与preview_action中的换算一致）
+        output_path (str): 输出文件路径（.gif或.mp4）
+        max_frames (int, optional): 最多输出的帧数，超出时均匀抽帧. Defaults to 120.
+        fps (int, optional): 输出帧率. Defaults to 15.
+    返回:
+        str: 实际输出的文件路径（无ffmpeg时mp4会退化为同名.gif）
+    """
+    base = Image.open(scene_image_path).convert('RGB')
+    width, height = base.size
+    r = min(width, height) / 100
+
+    # 场景坐标 (x, z) -> 像素坐标，图像中心为场景原点，与预览的换算方式一致
+    px = width / 2 + motion[..., 0] * ratio
+    py = height / 2 - motion[..., 2] * ratio
+    frame_ids = np.unique(np.linspace(0, len(motion) - 1, min(max_frames, len(motion))).astype(int))
+
+    # 完整轨迹作为底图，只需绘制一次
+    trail = base.copy()
+    trail_draw = ImageDraw.Draw(trail)
+    trail_draw.line(list(zip(px[:, 0], py[:, 0])), fill=(255, 140, 0), width=2)
+
+    frames = []
+    for t in frame_ids:
+        frame = trail.copy()
+        draw = ImageDraw.Draw(frame)
+        draw.line(list(zip(px[:t + 1, 0], py[:t + 1, 0])), fill=(220, 0, 0), width=3)
+        for x, y in zip(px[t], py[t]):
+            draw.ellipse([x - r / 2, y - r / 2, x + r / 2, y + r / 2], fill=(0, 90, 255))
+        x, y = px[t, 0], py[t, 0]
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=(220, 0, 0), outline="black")
+        frames.append(frame)
+
+    ffmpeg = shutil.which("ffmpeg")
+    if output_path.endswith('.mp4') and ffmpeg is not None:
+        # libx264要求宽高为偶数
+        even_w, even_h = width - width % 2, height - height % 2
+        process = subprocess.Popen([ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                                    "-s", f"{even_w}x{even_h}", "-r", str(fps), "-i", "-",
+                                    "-c:v", "libx264", "-pix_fmt", "yuv420p", output_path],
+                                   stdin=subprocess.PIPE)
+        for frame in frames:
+            process.stdin.write(frame.crop((0, 0, even_w, even_h)).tobytes())
+        process.stdin.close()
+        if process.wait() != 0:
+            raise RuntimeError("ffmpeg编码轨迹预览失败")
+        return output_path
+
+    gif_path = os.path.splitext(output_path)[0] + '.gif'
+    frames[0].save(gif_path, save_all=True, append_images=frames[1:], duration=int(1000 / fps), loop=0)
+    return gif_path
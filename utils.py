@@ -4,37 +4,131 @@
 from classes import *
 from typing import List
 import numpy as np
-from scipy.ndimage import binary_fill_holes
-import warnings
-from  trimesh.voxel.creation import voxelize
-from datetime import datetime
 import os
 import pickle as pkl
-from interfaces import *
 from pathlib import Path
 import subprocess
-import bpy
-import uuid
-from os.path import isdir,isfile,join as path_join,exists as path_exists
-import numpy as np
-import os
-import pandas as pd
-import zipfile
-import shutil
-def fill_voxel_matrix(original_matrix):
+from result_packaging import package_result
+FILL_SLAB = 32  # 并行填充时每个切片的x层数
+
+
+def _voxel_slab(voxels, x0: int, x1: int) -> np.ndarray:
+    """取出[x0, x1)的x切片；voxels可以是数组（包括内存映射）或voxel_format/sparse_voxels中的体素网格"""
+    if hasattr(voxels, 'iter_slabs'):
+        return voxels.slab(x0, x1)
+    return np.asarray(voxels[x0:x1])
+
+
+def _label_background(slab: np.ndarray):
+    """对切片中的空体素做6邻接连通域标记（与binary_fill_holes使用的结构元素相同）"""
+    from scipy.ndimage import label # scipy只在需要时导入
+    return label(np.logical_not(slab))
+
+
+def fill_voxel_matrix(original_matrix, out=None, workers: int = None, slab: int = FILL_SLAB):
     """
     将体素矩阵的内部区域填充为 True。
     假设 original_matrix 的 True 表示外壳。
+    结果与 scipy.ndimage.binary_fill_holes 完全相同：与矩阵边界连通的空体素保持为 False，其余空体素填充为 True。
+    矩阵沿x轴切成若干切片，在线程池中分别标记空体素的连通域，再把相邻切片交界面上相连的连通域合并，
+    因此内存占用只与同时处理的切片数有关，不需要像binary_fill_holes那样为整个矩阵分配多份临时数组。
+
+    参数:
+        original_matrix: 三维体素矩阵，也可以是内存映射数组或open_voxels返回的体素网格
+        out (np.ndarray, optional): 写入结果的bool数组（可以是内存映射），形状与输入相同；可以就是输入本身. Defaults to None.
+        workers (int, optional): 线程数. Defaults to CPU核数.
+        slab (int, optional): 每个切片的x层数. Defaults to 32.
+    返回:
+        np.ndarray: 填充后的矩阵（传入out时即为out）
     """
-    # 使用 binary_fill_holes 对三维矩阵进行内部填充
-    filled_matrix = binary_fill_holes(original_matrix)
-    
-    return filled_matrix
+    from concurrent.futures import ThreadPoolExecutor
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
 
+    shape = tuple(original_matrix.shape)
+    if out is None:
+        out = np.empty(shape, dtype=bool)
+    bounds = [(x0, min(x0 + slab, shape[0])) for x0 in range(0, shape[0], slab)]
+    last = len(bounds) - 1
 
-def pad_voxel_matrix_with_y_padding(original_matrix, target_shape):
+    def first_pass(i):
+        # 与y/z边界（以及整个矩阵的x两端）相连的连通域一定在外部，不接触任何边界和交界面的连通域一定是空洞；
+        # 只接触交界面的连通域要在合并后才能确定，暂时保持为False
+        x0, x1 = bounds[i]
+        labels, n = _label_background(_voxel_slab(original_matrix, x0, x1))
+        outside = np.zeros(n + 1, dtype=bool)
+        for face in (labels[:, 0, :], labels[:, -1, :], labels[:, :, 0], labels[:, :, -1]):
+            outside[face] = True
+        if i == 0:
+            outside[labels[0]] = True
+        if i == last:
+            outside[labels[-1]] = True
+        undecided = np.zeros(n + 1, dtype=bool)
+        faces = (labels[0].copy() if i > 0 else None, labels[-1].copy() if i < last else None)
+        for face in faces:
+            if face is not None:
+                undecided[face] = True
+        undecided &= ~outside
+        undecided[0] = False
+        outside[0] = False
+        out[x0:x1] = ~(outside | undecided)[labels]
+        return n, np.flatnonzero(outside), faces
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        passes = list(pool.map(first_pass, range(len(bounds))))
+        if last == 0:
+            return out
+
+        # 合并：节点0表示矩阵外部，切片i的第l个连通域为offsets[i] + l
+        offsets = np.cumsum([0] + [n for n, _, _ in passes])
+        rows, cols = [], []
+        for i, (n, outside, (head, tail)) in enumerate(passes):
+            rows.append(np.zeros(len(outside), dtype=np.int64))
+            cols.append(outside + offsets[i])
+            if tail is not None:
+                next_head = passes[i + 1][2][0]
+                touching = (tail > 0) & (next_head > 0)
+                rows.append(tail[touching].astype(np.int64) + offsets[i])
+                cols.append(next_head[touching].astype(np.int64) + offsets[i + 1])
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        n_nodes = int(offsets[-1]) + 1
+        graph = coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n_nodes, n_nodes))
+        _, component = connected_components(graph, directed=False)
+        enclosed = component != component[0]
+
+        def second_pass(i):
+            # 第一遍中暂时保持为False的连通域里，与外部不连通的也是空洞。对切片中剩余的空体素重新标记，
+            # 通过交界面上的体素把新的连通域对应到第一遍的连通域
+            x0, x1 = bounds[i]
+            head, tail = passes[i][2]
+            faces = [(face, plane) for face, plane in ((head, 0), (tail, -1)) if face is not None]
+            if not any(enclosed[face[face > 0].astype(np.int64) + offsets[i]].any() for face, _ in faces):
+                return
+            labels, n = _label_background(out[x0:x1])
+            fill = np.zeros(n + 1, dtype=bool)
+            for face, plane in faces:
+                touching = face > 0
+                fill[labels[plane][touching]] |= enclosed[face[touching].astype(np.int64) + offsets[i]]
+            fill[0] = False
+            out[x0:x1] |= fill[labels]
+
+        list(pool.map(second_pass, range(len(bounds))))
+    return out
+
+
+def pad_voxel_matrix_with_y_padding(original_matrix, target_shape, out=None, chunk: int = 32):
     """
     将体素矩阵填充到目标尺寸，y轴的padding拼接在原矩阵的末尾，其余维度居中填充。
+    结果直接写入out（例如np.lib.format.open_memmap打开的.npy），不会另外分配完整的目标矩阵；
+    原矩阵按x切片逐块复制，也可以直接传入open_voxels返回的体素网格。
+
+    参数:
+        original_matrix: 三维体素矩阵或体素网格
+        target_shape: 目标尺寸
+        out (np.ndarray, optional): 形状为target_shape的bool数组（可以是内存映射）. Defaults to None，此时新建.
+        chunk (int, optional): 每次复制的x层数. Defaults to 32.
+    返回:
+        np.ndarray: 填充后的矩阵（传入out时即为out）
     """
     # 获取原始矩阵的形状
     original_shape = np.array(original_matrix.shape)
@@ -42,27 +136,35 @@ def pad_voxel_matrix_with_y_padding(original_matrix, target_shape):
 
     # 计算需要填充的数量
     padding = target_shape - original_shape
+    if (padding < 0).any():
+        raise ValueError(f"目标尺寸{tuple(target_shape)}小于体素矩阵的尺寸{tuple(original_shape)}")
 
-    # 分别计算 x 和 z 轴（对称填充）和 y 轴（只在末尾填充）的填充量
+    # 分别计算 x 和 z 轴（对称填充）的填充量，y 轴只在末尾填充
     x_padding = padding[0] // 2
     z_padding = padding[2] // 2
-    y_padding_start = 0
-    y_padding_end = padding[1]
-
-    # 构造全False的目标矩阵
-    padded_matrix = np.zeros(target_shape, dtype=bool)
+    x_end = x_padding + original_shape[0]
+    y_end = original_shape[1]
+    z_end = z_padding + original_shape[2]
 
-    # 构造切片：x 和 z 居中填充，y 在末尾拼接
-    slices = (
-        slice(x_padding, x_padding + original_shape[0]),  # x 轴填充
-        slice(0, original_shape[1]),                      # y 轴不填充开始部分
-        slice(z_padding, z_padding + original_shape[2])   # z 轴填充
-    )
+    if out is None:
+        # 新建的矩阵本来就是全False，只需复制原矩阵
+        out = np.zeros(tuple(target_shape), dtype=bool)
+    else:
+        if tuple(out.shape) != tuple(target_shape):
+            raise ValueError(f"out的形状{out.shape}与目标尺寸{tuple(target_shape)}不一致")
+        # 预先分配的输出只清零原矩阵以外的部分
+        out[:x_padding] = False
+        out[x_end:] = False
+        out[x_padding:x_end, y_end:] = False
+        out[x_padding:x_end, :y_end, :z_padding] = False
+        out[x_padding:x_end, :y_end, z_end:] = False
 
-    # 将原始矩阵放置到目标矩阵中
-    padded_matrix[slices] = original_matrix
+    # 将原始矩阵逐块放置到目标矩阵中：x 和 z 居中填充，y 在末尾拼接
+    for x0 in range(0, original_shape[0], chunk):
+        x1 = min(x0 + chunk, original_shape[0])
+        out[x_padding + x0:x_padding + x1, :y_end, z_padding:z_end] = _voxel_slab(original_matrix, x0, x1)
 
-    return padded_matrix
+    return out
 
 
 
@@ -88,6 +190,7 @@ def run_blender_code(script_name:str,blend_path:str="./vis.blend",params:dict={}
         blend_path (str, optional): vis.blend的路径 Defaults to "./vis.blend".
         params (str, optional): 脚本参数，本质上是用于替换代码模板中占位符的字典，用法和python原生的模板-字符串类似. Defaults to {}.
     """
+    import bpy # bpy只在需要时导入，避免不使用Blender的进程（Web进程、基准测试）也要加载它
     # bpy.ops.preferences.addon_install(filepath = addon_path)
     bpy.ops.wm.open_mainfile(filepath=blend_path)
 
@@ -121,16 +224,19 @@ def run_lingo_code_in_subprocess(input_path:str,output_path:str,npy_name:str):
     print(f"工作完毕，切换回：{current_directory}")
 
 
-def zip_input_into_pickle(task:Task):
-    """将task内的data打包成为模型可识别的输入
+def build_lingo_input(scene_name:str, table)->list:
+    """将动作规划表转换为Lingo模型的输入（每一行动作一段）
 
     参数:
-        task (Task): 需要打包的task对象
-    """    
+        scene_name (str): 场景名，即场景体素文件在Scene_vis中的文件名（任务ID）
+        table (pd.DataFrame): 动作规划表
+    返回:
+        list: 每段动作的dict
+    """
     data = []
     ep_num=10
-    for _,each_row in task.data.iterrows():
-        data.append({'scene_name': task.task_id, 
+    for _,each_row in table.iterrows():
+        data.append({'scene_name': scene_name,
                     'text': each_row["动作"],
                     'start_location': np.array([each_row["起点x1"],1.0,each_row["起点y1"]]),
                     'end_location':  np.array([each_row["终点x2"],1.0,each_row["终点y2"]]),
@@ -141,7 +247,31 @@ def zip_input_into_pickle(task:Task):
     seg_num = len(data)
     for seg in data:
         seg['seg_num'] = seg_num
-        
+    return data
+
+
+def canonical_route(table)->list:
+    """动作规划表的规范形式：与build_lingo_input的内容相同，但不含场景名，数值统一为float（"1"与"1.0"相同），
+    可以直接json序列化，用于判断两次提交的模型输入是否相同"""
+    def canonical(value):
+        try:
+            return round(float(value), 6)
+        except (TypeError, ValueError):
+            return str(value).strip()
+    route = []
+    for seg in build_lingo_input(None, table):
+        route.append({key: [canonical(v) for v in value] if isinstance(value, np.ndarray) else canonical(value)
+                      for key, value in seg.items() if key != 'scene_name'})
+    return route
+
+
+def zip_input_into_pickle(task:Task):
+    """将task内的data打包成为模型可识别的输入
+
+    参数:
+        task (Task): 需要打包的task对象
+    """    
+    data = build_lingo_input(task.task_id, task.data)
     with open(os.path.join(task.output_dir, f'{task.task_id}.pkl'), 'wb') as f:
         pkl.dump(data, f)
 
@@ -153,6 +283,7 @@ def open_blend_and_import_obj(blend_file_path:str, obj_file_path:str):
         blend_file_path (str): blend模板文件的路径
         obj_file_path (str): obj模型文件的路径
     """    
+    import bpy # bpy只在需要时导入
     try:
         # 打开 .blend 文件
         bpy.ops.wm.open_mainfile(filepath=blend_file_path)
@@ -190,23 +321,10 @@ def open_blend_and_import_obj(blend_file_path:str, obj_file_path:str):
         bpy.ops.wm.save_mainfile(filepath=blend_file_path)
     except Exception as e:
         print(f"操作过程中出现错误: {e}")
-        
+        raise # 导入失败时不能当作成功，否则后续会渲染空白模板
+
 def zip_folder_files(folder_path):
-    # 获取文件夹的基本名称，用于生成 ZIP 文件的名称
-    folder_name = os.path.basename(folder_path)
-    # 生成 ZIP 文件的完整路径，ZIP 文件名为文件夹名加上 .zip 后缀
-    zip_file_path = os.path.join(folder_path, f'{folder_name}.zip')
-    # 以写入模式创建一个 ZIP 文件对象，使用 ZIP_DEFLATED 压缩算法
-    os.makedirs("temp",exist_ok=True)
-    with zipfile.ZipFile(f"./temp/{folder_name}.zip", 'w', zipfile.ZIP_DEFLATED) as zipf:
-        # 遍历文件夹下的所有文件
-        for filename in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, filename)
-            # 只处理文件，不处理文件夹
-            if os.path.isfile(file_path):
-                print(f"Zipping {file_path}")
-                    # 将文件添加到 ZIP 文件中，同时使用文件名作为 ZIP 内的相对路径
-                zipf.write(file_path, filename)
-    shutil.move(f"./temp/{folder_name}.zip",zip_file_path)
-    print(f"已将 {folder_path} 下的所有文件打包为 {zip_file_path}")
-    return zip_file_path
\ No newline at end of file
+    """将任务目录下的所有文件打包为 <目录>/<目录名>.zip 并返回其路径。
+    已压缩的格式直接存储，其余文件并行压缩；目录未变化时复用上次的压缩包（见result_packaging）
+    """
+    return package_result(folder_path)
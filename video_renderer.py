@@ -3,25 +3,85 @@ from pprint import pprint
 import bpy
 import sys
 import argparse
+from render_profiles import DEFAULT_PROFILE, RENDER_PROFILES, get_profile
+
+CPU_DEVICES = ('NONE', 'CPU')
 
 
 def set_gpu_rendering(device="CUDA"):   #目标1：尽量使他运行在GPU上（支持'CUDA', 'HIP', 'OPTIX'）
-    """设置 GPU 渲染""" #新增
-    assert device in ['CUDA', 'HIP', 'OPTIX', 'NONE']
+    """设置 GPU 渲染，返回是否找到了指定类型的GPU；找不到时切换为CPU渲染""" #新增
+    assert device in ['CUDA', 'HIP', 'OPTIX']
 
     preferences = bpy.context.preferences.addons["cycles"].preferences
-    preferences.compute_device_type = device  # 'CUDA', 'HIP', 'OPTIX' 根据显卡选择
+    try:
+        preferences.compute_device_type = device  # 'CUDA', 'HIP', 'OPTIX' 根据显卡选择
+    except TypeError:
+        # 当前Blender构建不支持该设备类型
+        print(f"不支持 {device}，改用CPU渲染")
+        set_cpu_rendering()
+        return False
 
     # 获取所有计算设备
     preferences.get_devices()
+    found = False
     for d in preferences.devices:
         d.use = device in d.type  # 仅启用指定的 GPU 设备
+        found = found or d.use
+    if not found:
+        # 没有可用的GPU时不再静默回退，明确使用CPU渲染并按CPU档位设置
+        print(f"未找到 {device} 设备，改用CPU渲染")
+        set_cpu_rendering()
+        return False
 
     # 启用 GPU 计算
     bpy.context.scene.cycles.device = "GPU"
     print(f"GPU 渲染模式已启用 ({device})")
-    
-    
+    return True
+
+
+def set_cpu_rendering():
+    """设置 CPU 渲染"""
+    bpy.context.preferences.addons["cycles"].preferences.compute_device_type = 'NONE'
+    bpy.context.scene.cycles.device = "CPU"
+    print("CPU 渲染模式已启用")
+
+
+def apply_render_profile(scene, profile: dict, threads=None):
+    """把渲染档位（见render_profiles）应用到场景
+
+    Args:
+        scene: bpy场景
+        profile (dict): render_profiles.get_profile返回的设置
+        threads (int, optional): 覆盖档位中的线程数，分块并行渲染时由调用者平分CPU核心.
+    """
+    scene.cycles.samples = profile['samples']
+    scene.cycles.preview_samples = min(16, profile['samples'])
+    # 自适应采样：噪声已足够低的像素提前停止
+    scene.cycles.use_adaptive_sampling = True
+    scene.cycles.adaptive_threshold = profile['adaptive_threshold']
+    scene.cycles.adaptive_min_samples = profile['adaptive_min_samples']
+    scene.cycles.use_denoising = profile['denoise']
+
+    scene.render.resolution_x, scene.render.resolution_y = profile['resolution']
+    scene.render.resolution_percentage = profile['resolution_percentage']
+    scene.render.use_persistent_data = profile['use_persistent_data']
+
+    tile_size = profile['tile_size']
+    if hasattr(scene.cycles, 'tile_size'):
+        # Blender 3.0及以上
+        scene.cycles.use_auto_tile = True
+        scene.cycles.tile_size = tile_size
+    else:
+        scene.render.tile_x = scene.render.tile_y = tile_size
+
+    threads = threads or profile['threads']
+    if threads:
+        scene.render.threads_mode = 'FIXED'
+        scene.render.threads = threads
+    else:
+        scene.render.threads_mode = 'AUTO'
+
+
 def auto_detect_animation_range():   # 目标2：自动检测动画中存在动作的帧并自动设置渲染起始与结束帧
     """自动检测动画中存在运动的帧范围"""
     min_frame, max_frame = float('inf'), float('-inf')
@@ -40,14 +100,17 @@ def auto_detect_animation_range():   # 目标2：自动检测动画中存在动
     return int(min_frame), int(max_frame)
 
 
-def render_example_video(blend_file_path:str,output:str,device="CUDA"):
+def render_example_video(blend_file_path:str,output:str,device="CUDA",frame_range=None,threads=None,profile:str=DEFAULT_PROFILE):
     """从一个blender文件（.blend）渲染一段俯瞰视角的示例视频
         !!!重要提示：避免在gradio的上下文内直接调用该代码，否则将导致gradio应用崩溃!!!
 
     Args:
         blend_file_path (str): blender文件的路径（Windows上运行时请使用绝对路径）
         output (str): 视频输出的路径及文件名（Windows上运行时请使用绝对路径）
-        device (str, optional): 使用的设备类型（若不可用会自动回退为CPU）. Defaults to "CUDA".
+        device (str, optional): 使用的设备类型，"NONE"或"CPU"为CPU渲染（指定的GPU不可用时也会改用CPU）. Defaults to "CUDA".
+        frame_range (tuple, optional): 只渲染 (起始帧, 结束帧)，用于分块并行渲染；默认自动检测动画帧范围.
+        threads (int, optional): 渲染使用的CPU线程数；默认使用档位（及其校准结果）中的设置.
+        profile (str, optional): 渲染档位，'draft'、'standard'或'final'，见render_profiles. Defaults to "standard".
     """
     assert os.path.exists(blend_file_path)
     
@@ -61,23 +124,22 @@ def render_example_video(blend_file_path:str,output:str,device="CUDA"):
     scene = bpy.context.scene
     scene.render.engine = "CYCLES"
 
-    # 使用 GPU 渲染
-    set_gpu_rendering(device)
-
-    # 降低采样数量从而加快渲染速度
-    scene.cycles.samples = 32  # 降低采样数量
-    scene.cycles.preview_samples = 16
-    scene.cycles.use_denoising = True  # 启用降噪
+    # 使用 GPU 渲染，CPU渲染机上直接使用CPU
+    if device in CPU_DEVICES:
+        set_cpu_rendering()
+        on_gpu = False
+    else:
+        on_gpu = set_gpu_rendering(device)
 
-    # 降低分辨率
-    scene.render.resolution_percentage = 80  # 降低渲染分辨率
+    # 采样、分辨率、分块和线程按档位设置；CPU渲染时使用本机的校准结果
+    settings = get_profile(profile, device="GPU" if on_gpu else "CPU")
+    apply_render_profile(scene, settings, threads)
+    print(f"渲染档位: {profile} {settings}")
 
     # 启用简化模式
     scene.render.use_simplify = True
     scene.render.simplify_subdivision = 0  # 禁用细分曲面
     scene.render.simplify_child_particles = 0.5  # 减少粒子数量
-    scene.render.resolution_x = 640  # 水平分辨率
-    scene.render.resolution_y = 480  # 垂直分辨率
     
     # 优化灯光采样
     scene.cycles.light_sampling_threshold = 0.1  # 跳过低影响灯光
@@ -86,8 +148,8 @@ def render_example_video(blend_file_path:str,output:str,device="CUDA"):
     scene.cycles.volume_samples = 1  # 降低体积采样
     scene.cycles.use_volumes = False  # 禁用体积
 
-    # 自动检测动画帧范围
-    scene.frame_start, scene.frame_end = auto_detect_animation_range()
+    # 自动检测动画帧范围（分块渲染时使用指定的范围）
+    scene.frame_start, scene.frame_end = frame_range or auto_detect_animation_range()
     print(f"检测到动画帧范围: {scene.frame_start} - {scene.frame_end}")
 
     # 设置输出路径和帧范围
@@ -109,15 +171,27 @@ if __name__=="__main__":
     # 添加位置参数
     parser.add_argument('blender_path', help='the path for input blender file')
     # 添加位置参数
-    parser.add_argument('output_path', help='the path for output example video file')
+    parser.add_argument('output_path', nargs='?', help='the path for output example video file')
     # 添加可选参数
-    parser.add_argument('-d', '--device', default='CUDA', help='the acceleration solution to be used, choose from "CUDA", "HIP", "OPTIX", "NONE"')
+    parser.add_argument('-d', '--device', default='CUDA', help='the acceleration solution to be used, choose from "CUDA", "HIP", "OPTIX", "NONE" (CPU)')
+    parser.add_argument('--frames', default=None, help='only render frames START-END, e.g. "1-60"')
+    parser.add_argument('--threads', type=int, default=None, help='number of CPU render threads')
+    parser.add_argument('--profile', default=DEFAULT_PROFILE, choices=list(RENDER_PROFILES), help='render profile, see render_profiles.py')
+    parser.add_argument('--detect-range', action='store_true', help='print the detected animation frame range as "FRAME_RANGE START END" and exit')
 
     # 解析命令行参数
     args = parser.parse_args()
 
+    if args.detect_range:
+        bpy.ops.wm.open_mainfile(filepath=args.blender_path)
+        print("FRAME_RANGE %d %d" % auto_detect_animation_range())
+        sys.exit(0)
+    if args.output_path is None:
+        parser.error("output_path is required unless --detect-range is given")
+    frame_range = tuple(int(f) for f in args.frames.split('-')) if args.frames else None
+
     print(f"blender file path: {args.blender_path}")
     print(f"output video path: {args.output_path}")
-    print(f"Using: {args.device}")
+    print(f"Using: {args.device}, profile: {args.profile}")
     
-    render_example_video(args.blender_path,args.output_path,device=args.device)
\ No newline at end of file
+    render_example_video(args.blender_path,args.output_path,device=args.device,frame_range=frame_range,threads=args.threads,profile=args.profile)
\ No newline at end of file
@@ -0,0 +1,180 @@
+###
+#  体素化结果的内容寻址缓存：以场景文件内容 + 体素化参数的哈希为键，
+#  缓存体素矩阵、像素/场景坐标比、体素缩放因子以及投影图片，磁盘占用超出上限时按LRU淘汰
+###
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from os.path import join as path_join, exists as path_exists
+
+from bounded_cache import BoundedLRUCache
+
+DEFAULT_CACHE_DIR = "./cache/voxel_cache"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 默认最多占用2GB磁盘
+META_NAME = "meta.json"
+
+
+# (设备, inode, 大小, 修改时间) -> sha256。按inode记录，同一文件的硬链接（见asset_store）共享同一条记录
+_file_digests = BoundedLRUCache(max_bytes=1 << 20, max_entries=4096, sizeof=lambda digest: 256)
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """流式计算文件内容的sha256，避免将大文件整个读入内存。文件未变化时直接返回上次的结果，
+    同一次上传经过的资源存储、网格缓存和体素缓存不会重复读取整个文件
+
+    参数:
+        path (str): 文件路径
+        chunk_size (int, optional): 每次读取的字节数. Defaults to 1MB.
+    """
+    st = os.stat(path)
+    key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    digest = _file_digests.get(key)
+    if digest is not None:
+        return digest
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+    _file_digests.put(key, digest)
+    return digest
+
+
+def make_cache_key(mesh_digest: str, **params) -> str:
+    """由场景文件的sha256和体素化参数生成缓存键，与VoxelCache.make_key相同，供已算过哈希的调用者使用（见scene_library）"""
+    h = hashlib.sha256()
+    h.update(mesh_digest.encode())
+    h.update(json.dumps(params, sort_keys=True, default=list).encode())
+    return h.hexdigest()
+
+
+class VoxelCache:
+    """体素化结果缓存。每个条目是缓存目录下以键命名的子目录，包含:
+        voxels.<ext>              体素矩阵文件
+        projection_<type>.png     对应投影方式的二维投影图片
+        meta.json                 像素/场景坐标比、体素缩放因子等元数据
+    条目目录的修改时间被用作最近访问时间，命中时刷新，淘汰时最旧的先删除。
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, mesh_path: str, **params) -> str:
+        """根据场景文件内容和体素化参数生成缓存键
+
+        参数:
+            mesh_path (str): 场景文件（.obj）的路径
+            params: 影响体素化结果的参数，例如target_shape、pitch
+        """
+        return make_cache_key(hash_file(mesh_path), **params)
+
+    def _entry_dir(self, key: str) -> str:
+        return path_join(self.cache_dir, key)
+
+    def fetch(self, key: str, voxel_output: str, image_output: str = None, projection_type: str = 'average'):
+        """查找缓存，命中时将体素矩阵（以及投影图片）放到指定路径（reflink、硬链接或复制）
+
+        参数:
+            key (str): make_key生成的缓存键
+            voxel_output (str): 体素矩阵的目标路径
+            image_output (str, optional): 投影图片的目标路径，为None时不复制图片
+            projection_type (str, optional): 投影方式. Defaults to 'average'.
+        返回:
+            命中时返回 (pixel_to_scene_cordinate_ratio, 体素缩放因子)，旧条目没有缩放因子时其为None；
+            未命中（或缺少所需的投影图片）时返回None
+        """
+        entry = self._entry_dir(key)
+        voxel_file = path_join(entry, "voxels" + os.path.splitext(voxel_output)[1])
+        image_file = path_join(entry, f"projection_{projection_type}.png")
+        meta_file = path_join(entry, META_NAME)
+        if not (path_exists(voxel_file) and path_exists(meta_file)):
+            return None
+        if image_output is not None and not path_exists(image_file):
+            return None
+        from asset_store import link_or_copy  # asset_store依赖本模块的hash_file
+        try:
+            with open(meta_file, 'r') as f:
+                meta = json.load(f)
+            # 条目写入后不再修改，可以直接链接到任务目录；淘汰条目不影响已链接的文件
+            link_or_copy(voxel_file, voxel_output)
+            if image_output is not None:
+                link_or_copy(image_file, image_output)
+        except (OSError, ValueError) as e:
+            # 条目可能正在被淘汰，视为未命中
+            print(f"体素缓存读取失败，按未命中处理: {e}")
+            return None
+        now = time.time()
+        os.utime(entry, (now, now))
+        print(f"体素缓存命中: {key}")
+        return meta["pixel_to_scene_cordinate_ratio"], meta.get("voxel_scale")
+
+    def store(self, key: str, voxel_path: str, ratio: float, image_path: str = None, projection_type: str = 'average',
+              scale: float = None):
+        """将体素化结果写入缓存。先写入临时目录再整体重命名，保证其他进程不会读到写了一半的条目
+
+        参数:
+            key (str): make_key生成的缓存键
+            voxel_path (str): 体素矩阵文件的路径
+            ratio (float): pixel_to_scene_cordinate_ratio
+            image_path (str, optional): 投影图片路径
+            projection_type (str, optional): 投影方式. Defaults to 'average'.
+            scale (float, optional): 体素缩放因子，见interfaces.voxelize_obj. Defaults to None.
+        """
+        entry = self._entry_dir(key)
+        if path_exists(entry):
+            # 条目已存在（例如只缺少某种投影方式的图片，或另一种格式的体素文件），补充缺少的文件即可
+            missing = [(voxel_path, path_join(entry, "voxels" + os.path.splitext(voxel_path)[1]))]
+            if image_path is not None:
+                missing.append((image_path, path_join(entry, f"projection_{projection_type}.png")))
+            for src, dst in missing:
+                if not path_exists(dst):
+                    tmp_file = f"{dst}.{uuid.uuid4().hex}.tmp"
+                    shutil.copyfile(src, tmp_file)
+                    os.replace(tmp_file, dst)
+            return
+        tmp_dir = path_join(self.cache_dir, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        try:
+            shutil.copyfile(voxel_path, path_join(tmp_dir, "voxels" + os.path.splitext(voxel_path)[1]))
+            if image_path is not None:
+                shutil.copyfile(image_path, path_join(tmp_dir, f"projection_{projection_type}.png"))
+            with open(path_join(tmp_dir, META_NAME), 'w') as f:
+                json.dump({"pixel_to_scene_cordinate_ratio": ratio, "voxel_scale": scale, "created": time.time()}, f)
+            os.rename(tmp_dir, entry)
+        except OSError:
+            # 其他进程抢先写入了同一条目
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict()
+
+    def _entries(self):
+        """返回 [(最近访问时间, 占用字节数, 条目路径)]"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith('.'):
+                continue
+            entry = path_join(self.cache_dir, name)
+            try:
+                size = sum(os.path.getsize(path_join(entry, f)) for f in os.listdir(entry))
+                entries.append((os.path.getmtime(entry), size, entry))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """按最近访问时间淘汰条目，直至磁盘占用不超过max_bytes"""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+                print(f"体素缓存淘汰: {entry}")
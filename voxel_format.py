@@ -0,0 +1,172 @@
+###
+#  体素矩阵的位压缩存储格式（.pvox）：每8个体素占1个字节，文件头记录形状和元数据
+#  数据按x轴切片（slab）连续存放，读取时可内存映射，只解包调用者需要的切片。
+#  稀疏格式（.svox）见sparse_voxels，open_voxels/save_voxels按文件头和扩展名统一处理三种格式
+###
+import json
+import struct
+import numpy as np
+
+MAGIC = b"LVOXPK01"
+PACKED_SUFFIX = ".pvox"
+_ALIGN = 64  # 数据区按64字节对齐，便于内存映射
+
+
+def _data_offset(header_len: int) -> int:
+    raw = len(MAGIC) + 4 + header_len
+    return (raw + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def save_packed_voxels(path: str, voxel_grid: np.ndarray, meta: dict = None, chunk: int = 32):
+    """将三维布尔体素矩阵按位压缩后写入文件
+
+    参数:
+        path (str): 输出文件路径，建议以.pvox结尾
+        voxel_grid (np.ndarray): 三维体素矩阵，非零即视为占据
+        meta (dict, optional): 需要一并保存的元数据（需可被json序列化）
+        chunk (int, optional): 每次压缩的x切片数，用于限制临时内存. Defaults to 32.
+    """
+    if voxel_grid.ndim != 3:
+        raise ValueError(f"体素矩阵应为三维数组，当前维度为 {voxel_grid.ndim}")
+    X, Y, Z = voxel_grid.shape
+    header = json.dumps({
+        "shape": [int(X), int(Y), int(Z)],
+        "bitorder": "little",
+        "slab_bytes": (Y * Z + 7) // 8,
+        "meta": meta or {},
+    }).encode()
+    offset = _data_offset(len(header))
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        f.write(b'\0' * (offset - f.tell()))
+        for x0 in range(0, X, chunk):
+            slab = np.asarray(voxel_grid[x0:x0 + chunk], dtype=bool).reshape(-1, Y * Z)
+            f.write(np.packbits(slab, axis=1, bitorder='little').tobytes())
+
+
+class PackedVoxelGrid:
+    """以内存映射方式打开的.pvox文件，只在需要时解包指定的x切片
+
+    属性:
+        shape (tuple): 体素矩阵形状 (X, Y, Z)
+        meta (dict): 写入时附带的元数据
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError(f"{path} 不是有效的.pvox体素文件")
+            (header_len,) = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(header_len))
+        self.shape = tuple(header["shape"])
+        self.meta = header.get("meta", {})
+        self.slab_bytes = header["slab_bytes"]
+        self.dtype = np.dtype(bool)
+        self.ndim = 3
+        self._packed = np.memmap(path, dtype=np.uint8, mode='r', offset=_data_offset(header_len),
+                                 shape=(self.shape[0], self.slab_bytes))
+
+    @property
+    def nbytes_packed(self) -> int:
+        return self._packed.size
+
+    def slab(self, x0: int, x1: int) -> np.ndarray:
+        """解包 [x0, x1) 范围内的x切片，返回形状为 (x1-x0, Y, Z) 的布尔数组"""
+        _, Y, Z = self.shape
+        packed = self._packed[x0:x1]
+        bits = np.unpackbits(packed, axis=1, count=Y * Z, bitorder='little')
+        return bits.view(bool).reshape(-1, Y, Z)
+
+    def iter_slabs(self, chunk: int = 16):
+        """按x轴依次产出 (x0, slab)，每次最多解包chunk个切片"""
+        for x0 in range(0, self.shape[0], chunk):
+            yield x0, self.slab(x0, min(x0 + chunk, self.shape[0]))
+
+    def to_dense(self) -> np.ndarray:
+        """解包为完整的布尔数组"""
+        return self.slab(0, self.shape[0])
+
+
+class DenseVoxelGrid:
+    """与PackedVoxelGrid接口一致的.npy包装，.npy文件以mmap_mode='r'打开，同样支持按切片读取"""
+
+    def __init__(self, path_or_array):
+        if isinstance(path_or_array, np.ndarray):
+            self.path = None
+            self._array = path_or_array
+        else:
+            self.path = path_or_array
+            self._array = np.load(path_or_array, mmap_mode='r')
+        self.shape = self._array.shape
+        self.ndim = self._array.ndim
+        self.dtype = self._array.dtype
+        self.meta = {}
+
+    def slab(self, x0: int, x1: int) -> np.ndarray:
+        return np.asarray(self._array[x0:x1], dtype=bool)
+
+    def iter_slabs(self, chunk: int = 16):
+        for x0 in range(0, self.shape[0], chunk):
+            yield x0, self.slab(x0, min(x0 + chunk, self.shape[0]))
+
+    def to_dense(self) -> np.ndarray:
+        return np.asarray(self._array, dtype=bool)
+
+
+def is_packed(path: str) -> bool:
+    """根据文件头判断是否为.pvox格式"""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def open_voxels(path: str):
+    """以内存映射方式打开体素文件（.pvox、.svox或.npy），返回支持slab/iter_slabs/to_dense的对象"""
+    from sparse_voxels import is_sparse, open_sparse_voxels
+    if is_packed(path):
+        return PackedVoxelGrid(path)
+    if is_sparse(path):
+        return open_sparse_voxels(path)
+    return DenseVoxelGrid(path)
+
+
+def load_voxels(path: str) -> np.ndarray:
+    """读取体素文件（.pvox、.svox或.npy）为完整的布尔数组"""
+    return open_voxels(path).to_dense()
+
+
+def save_voxels(path: str, voxel_grid, meta: dict = None):
+    """根据扩展名保存体素矩阵：.pvox使用位压缩格式，.svox使用稀疏格式（见sparse_voxels），其余使用np.save
+
+    参数:
+        voxel_grid: 三维布尔数组或sparse_voxels.SparseVoxelGrid
+    """
+    from sparse_voxels import SPARSE_SUFFIX, SparseVoxelGrid, save_sparse_voxels
+    if path.endswith(SPARSE_SUFFIX):
+        save_sparse_voxels(path, voxel_grid, meta)
+        return
+    if isinstance(voxel_grid, SparseVoxelGrid):
+        voxel_grid = voxel_grid.to_dense()
+    if path.endswith(PACKED_SUFFIX):
+        save_packed_voxels(path, voxel_grid, meta)
+    else:
+        np.save(path, voxel_grid)
+
+
+def export_dense_npy(src: str, dst: str, chunk: int = 32):
+    """将体素文件逐切片导出为.npy（供只接受.npy的Lingo模型使用），导出过程中不会整体载入内存
+
+    参数:
+        src (str): 源体素文件（.pvox、.svox或.npy）
+        dst (str): 输出的.npy路径
+        chunk (int, optional): 每次导出的x切片数. Defaults to 32.
+    """
+    grid = open_voxels(src)
+    out = np.lib.format.open_memmap(dst, mode='w+', dtype=bool, shape=grid.shape)
+    for x0, slab in grid.iter_slabs(chunk):
+        out[x0:x0 + slab.shape[0]] = slab
+    out.flush()
+    del out
@@ -0,0 +1,129 @@
+###
+#  体素化引擎：trimesh的细分体素化（subdivide）以及基于NumPy批量计算的快速体素化（fast）
+#  两者输出相同的网格布局：矩阵原点为所有命中体素的最小索引，与trimesh VoxelGrid.matrix一致
+###
+import numpy as np
+
+from sparse_voxels import SparseVoxelGrid
+
+VOXELIZE_METHODS = ('subdivide', 'fast')
+
+
+def grid_scale(model_size, target_shape=(400, 100, 600)) -> float:
+    """模型尺寸为model_size时normalize_mesh_to_grid使用的缩放因子，即每单位场景长度对应的体素数"""
+    return float(min(np.array(target_shape) / np.asarray(model_size, dtype=np.float64)) * 0.995)
+
+
+def normalize_mesh_to_grid(mesh, target_shape=(400, 100, 600)):
+    """将网格等比缩放并平移到目标体素网格内（就地修改），与voxelize_obj的约定一致
+
+    参数:
+        mesh (trimesh.Trimesh): 需要处理的网格
+        target_shape (tuple, optional): 目标体素尺寸. Defaults to (400, 100, 600).
+    返回:
+        float: 使用的缩放因子
+    """
+    # 计算模型边界范围
+    bounds_min, bounds_max = mesh.bounds
+    model_size = bounds_max - bounds_min
+
+    # 计算缩放比例，使模型正好适配目标体素网格（按最小比例等比缩放）
+    scaling_factor = grid_scale(model_size, target_shape)
+    # 缩放模型
+    mesh.apply_scale(scaling_factor)
+    # 平移模型到体素网格中心
+    mesh.apply_translation(-mesh.bounds[0])  # 移动到原点
+    mesh.apply_translation([0,0.2,0])  # 移动到原点
+    grid_size = np.array(target_shape)
+    mesh.apply_translation(grid_size / 2 - model_size * scaling_factor / 2)
+    return scaling_factor
+
+
+def _barycentric_lattice(n: int) -> np.ndarray:
+    """边被n等分时三角形内所有格点的重心坐标，形状为 ((n+1)(n+2)/2, 3)"""
+    i, j = np.triu_indices(n + 1)
+    # triu_indices给出 i<=j，换算为 a=i, b=n-j 即满足 a+b<=n
+    a = i
+    b = n - j
+    bary = np.stack([n - a - b, a, b], axis=1).astype(np.float64) / n
+    return bary
+
+
+def voxelize_fast(mesh, pitch: float = 1, edge_factor: float = 2.0, max_points: int = 1 << 22, sparse: bool = False):
+    """快速表面体素化：对每个三角形按 pitch/edge_factor 的间距生成重心坐标格点，
+    按细分次数将三角形分组后用NumPy批量计算格点坐标并直接写入布尔网格，
+    避免trimesh逐轮细分整个网格时产生的大量中间顶点和去重开销。
+
+    参数:
+        mesh (trimesh.Trimesh): 已缩放到体素坐标的网格
+        pitch (float, optional): 体素的大小. Defaults to 1.
+        edge_factor (float, optional): 格点间距为 pitch/edge_factor，与trimesh的同名参数含义一致. Defaults to 2.0.
+        max_points (int, optional): 每批计算的最大格点数，用于限制临时内存. Defaults to 4M.
+        sparse (bool, optional): 为True时不分配稠密网格，只收集命中体素的索引并返回SparseVoxelGrid. Defaults to False.
+    返回:
+        np.ndarray | SparseVoxelGrid: 体素矩阵，布局与trimesh VoxelGrid.matrix相同
+    """
+    vertices = np.asarray(mesh.vertices, dtype=np.float64)
+    faces = np.asarray(mesh.faces)
+    triangles = vertices[faces]  # (F, 3, 3)
+
+    # 所有格点都是三角形顶点的凸组合，四舍五入后的索引范围由顶点决定，可以预先分配网格。
+    # 坐标恰好为x.5时，格点的浮点误差可能使其舍入到顶点范围之外，写入前截断到网格内
+    used = vertices[np.unique(faces)]
+    origin = np.round(used.min(axis=0) / pitch).astype(np.int64)
+    shape = np.round(used.max(axis=0) / pitch).astype(np.int64) - origin + 1
+    upper = shape - 1
+    if sparse:
+        hits = []
+    else:
+        grid = np.zeros(shape, dtype=bool)
+
+    # 每个三角形需要的等分数：最长边 / 格点间距
+    edges = np.stack([
+        triangles[:, 1] - triangles[:, 0],
+        triangles[:, 2] - triangles[:, 1],
+        triangles[:, 0] - triangles[:, 2],
+    ], axis=1)
+    longest = np.linalg.norm(edges, axis=2).max(axis=1)
+    splits = np.maximum(np.ceil(longest / (pitch / edge_factor)), 1).astype(np.int64)
+
+    order = np.argsort(splits, kind='stable')
+    sorted_splits = splits[order]
+    bucket_starts = np.flatnonzero(np.r_[True, sorted_splits[1:] != sorted_splits[:-1]])
+    bucket_ends = np.r_[bucket_starts[1:], len(order)]
+    for start, end in zip(bucket_starts, bucket_ends):
+        bary = _barycentric_lattice(int(sorted_splits[start]))
+        batch = max(1, max_points // len(bary))
+        face_ids = order[start:end]
+        for b0 in range(0, len(face_ids), batch):
+            tri = triangles[face_ids[b0:b0 + batch]]
+            points = np.einsum('pk,fkd->fpd', bary, tri).reshape(-1, 3)
+            hit = np.clip(np.round(points / pitch).astype(np.int64) - origin, 0, upper)
+            if sparse:
+                # 每批先去重，命中索引的总量与表面积成正比，与网格体积无关
+                hits.append(np.unique((hit[:, 0] * shape[2] + hit[:, 2]) * shape[1] + hit[:, 1]))
+            else:
+                grid[hit[:, 0], hit[:, 1], hit[:, 2]] = True
+    if sparse:
+        return SparseVoxelGrid.from_linear(np.concatenate(hits) if hits else np.zeros(0, np.int64), shape)
+    return grid
+
+
+def voxelize_mesh(mesh, pitch: float = 1, method: str = 'subdivide', sparse: bool = False):
+    """按指定引擎对已缩放到体素坐标的网格进行表面体素化
+
+    参数:
+        mesh (trimesh.Trimesh): 网格
+        pitch (float, optional): 体素的大小. Defaults to 1.
+        method (str, optional): 'subdivide' 使用trimesh的细分体素化，'fast' 使用voxelize_fast. Defaults to 'subdivide'.
+        sparse (bool, optional): 返回SparseVoxelGrid而不是稠密数组. Defaults to False.
+    返回:
+        np.ndarray | SparseVoxelGrid: 体素矩阵
+    """
+    if method == 'subdivide':
+        from trimesh.voxel.creation import voxelize
+        matrix = voxelize(mesh, pitch).matrix
+        return SparseVoxelGrid.from_dense(matrix) if sparse else matrix
+    elif method == 'fast':
+        return voxelize_fast(mesh, pitch, sparse=sparse)
+    raise ValueError(f"体素化方式不支持，仅支持 {', '.join(VOXELIZE_METHODS)}")
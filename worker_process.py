@@ -0,0 +1,164 @@
+###
+#  常驻子进程的通用管理：父进程监听本地端口，子进程启动后连接回来，双方通过multiprocessing.connection收发消息
+#  子进程崩溃时自动重启。Lingo推理进程（lingo_worker）和Blender渲染进程（blender_server）都基于此实现
+###
+import os
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from multiprocessing.connection import Client, Listener
+
+ADDRESS_ENV = "LINGO_WEB_WORKER_ADDRESS"
+AUTHKEY_ENV = "LINGO_WEB_WORKER_AUTHKEY"
+
+
+class WorkerCrashed(RuntimeError):
+    """子进程在处理请求时退出或断开连接"""
+
+
+class WorkerProcess:
+    """管理一个常驻子进程，并以请求-应答的方式与其通信
+
+    参数:
+        args (list): 启动子进程的命令，例如 [sys.executable, "lingo_worker.py"]
+        cwd (str, optional): 子进程的工作目录
+        name (str, optional): 用于日志输出的名称
+        startup_timeout (float, optional): 等待子进程连接的超时时间（秒）. Defaults to 600.
+    """
+
+    def __init__(self, args, cwd: str = None, name: str = "worker", startup_timeout: float = 600):
+        self.args = list(args)
+        self.cwd = cwd
+        self.name = name
+        self.startup_timeout = startup_timeout
+        self.restarts = 0
+        self._proc = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def pid(self):
+        """子进程的pid，未运行时为None（供metrics.track_process采样内存）"""
+        return self._proc.pid if self._proc is not None and self._proc.poll() is None else None
+
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None and self._conn is not None
+
+    def start(self):
+        """启动子进程并等待其连接回来"""
+        authkey = os.urandom(16)
+        with Listener(('127.0.0.1', 0), authkey=authkey) as listener:
+            env = dict(os.environ)
+            env[ADDRESS_ENV] = "%s:%d" % listener.address
+            env[AUTHKEY_ENV] = authkey.hex()
+            self._proc = subprocess.Popen(self.args, cwd=self.cwd, env=env)
+            # Listener.accept本身不支持超时，用子线程等待
+            accepted = {}
+            acceptor = threading.Thread(target=lambda: accepted.setdefault('conn', listener.accept()), daemon=True)
+            acceptor.start()
+            # 分段等待，子进程在连接之前就退出（路径错误、导入失败等）时立即报错，不必等到超时
+            deadline = time.monotonic() + self.startup_timeout
+            while 'conn' not in accepted and acceptor.is_alive():
+                code = self._proc.poll()
+                if code is not None:
+                    raise WorkerCrashed(f"{self.name} 启动失败，退出码 {code}")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                acceptor.join(min(0.5, remaining))
+            if 'conn' not in accepted:
+                self._proc.kill()
+                raise WorkerCrashed(f"{self.name} 启动超时")
+            self._conn = accepted['conn']
+        print(f"{self.name} 已启动，pid={self._proc.pid}")
+
+    def stop(self):
+        """通知子进程退出，超时后强制结束"""
+        if self._conn is not None:
+            try:
+                self._conn.send({'cmd': 'shutdown'})
+            except OSError:
+                pass
+            self._conn.close()
+            self._conn = None
+        if self._proc is not None:
+            try:
+                self._proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+            self._proc = None
+
+    def restart(self):
+        self.stop()
+        self.restarts += 1
+        print(f"{self.name} 重启（第{self.restarts}次）")
+        self.start()
+
+    def request(self, message: dict, on_progress=None):
+        """发送一条请求并等待应答。子进程在应答前可以发送任意条进度消息，交给on_progress处理
+
+        参数:
+            message (dict): 请求内容，需包含cmd字段
+            on_progress (callable, optional): 进度消息的回调，参数为消息dict
+        返回:
+            子进程返回的result
+        """
+        with self._lock:
+            if not self.alive():
+                if self._proc is not None:
+                    self.restart()
+                else:
+                    self.start()
+            try:
+                self._conn.send(message)
+                while True:
+                    reply = self._conn.recv()
+                    if reply.get('type') == 'progress':
+                        if on_progress is not None:
+                            on_progress(reply)
+                        continue
+                    break
+            except (EOFError, OSError) as e:
+                # 子进程崩溃，下次请求时重启
+                self._conn = None
+                raise WorkerCrashed(f"{self.name} 在处理请求时退出: {e}") from e
+        if reply.get('type') == 'error':
+            raise RuntimeError(f"{self.name} 处理请求失败:\n{reply['error']}")
+        return reply.get('result')
+
+
+def connect_to_parent():
+    """子进程侧：根据环境变量连接父进程"""
+    host, port = os.environ[ADDRESS_ENV].rsplit(':', 1)
+    return Client((host, int(port)), authkey=bytes.fromhex(os.environ[AUTHKEY_ENV]))
+
+
+def serve(handler):
+    """子进程侧：循环接收请求并交给handler处理，直到收到shutdown或父进程断开
+
+    参数:
+        handler (callable): handler(message, send_progress) -> result，
+            send_progress(**fields) 可用于向父进程发送进度消息
+    """
+    conn = connect_to_parent()
+
+    def send_progress(**fields):
+        conn.send(dict(fields, type='progress'))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message.get('cmd') == 'shutdown':
+            break
+        try:
+            result = handler(message, send_progress)
+            conn.send({'type': 'result', 'result': result})
+        except Exception:
+            traceback.print_exc()
+            conn.send({'type': 'error', 'error': traceback.format_exc()})
+    conn.close()
+    sys.exit(0)